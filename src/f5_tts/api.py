@@ -125,6 +125,7 @@ class F5TTS:
             speed=speed,
             fix_duration=fix_duration,
             device=self.device,
+            seed=seed,
         )
 
         if file_wave is not None:
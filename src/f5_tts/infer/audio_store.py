@@ -0,0 +1,55 @@
+# Content-addressed store of reference audio: every distinct recording is stored only once
+import glob
+import hashlib
+import os
+import uuid
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class AudioStore:
+    """
+    Stores every uploaded audio under the sha256 of its bytes, as <folder>/<hash[:2]>/<hash><extension>.
+
+    Uploading the same recording under another name or for another speech type gives the same hash and it is
+    not stored again; everything derived from the audio (canonical version, clip, transcript, mel) is named
+    after that hash, so it is computed only once as well.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def find(self, digest):
+        """Path of the audio stored under that hash, or None."""
+        matches = glob.glob(os.path.join(self.folder, digest[:2], f"{digest}.*"))
+        return matches[0] if matches else None
+
+    def add_stream(self, stream, ext):
+        """Stores the content of an open file (e.g. request.files[...].stream). Returns (hash, path)."""
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = os.path.join(self.folder, f"{uuid.uuid4().hex}.tmp")
+        h = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+            return self._install(tmp_path, h.hexdigest(), ext)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def add_file(self, path):
+        """Copies an existing file into the store. Returns (hash, path)."""
+        with open(path, "rb") as f:
+            return self.add_stream(f, os.path.splitext(path)[1])
+
+    def _install(self, tmp_path, digest, ext):
+        existing = self.find(digest)
+        if existing is not None:
+            return digest, existing
+        path = os.path.join(self.folder, digest[:2], f"{digest}{ext.lower()}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return digest, path
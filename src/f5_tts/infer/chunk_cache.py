@@ -0,0 +1,127 @@
+# Persistent cache of generated chunk audio, so repeated sentences are not sampled again
+import hashlib
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, enough for single-process development
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def voice_hash(audio, ref_text, ref_mel=None):
+    """
+    Content hash of a voice prompt: reference samples, transcript and (if given) precomputed mel.
+    """
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    h.update(ref_text.encode("utf-8"))
+    if ref_mel is not None:
+        h.update(np.ascontiguousarray(ref_mel, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def chunk_key(**params):
+    """
+    Cache key of one generated chunk, e.g. voice hash, chunk text, nfe, cfg, sway, speed, seed, checkpoint id.
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chunk_seed(seed, text):
+    """
+    Deterministic per-chunk seed: the same text with the same base seed always starts from the same noise,
+    which is what makes a cached chunk a valid substitute for sampling it again.
+    """
+    digest = hashlib.sha256(f"{seed}:{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little") & 0x7FFFFFFF
+
+
+class ChunkCache:
+    """
+    Size-bounded LRU store of generated chunks on disk, one .npz per chunk (wave float32, mel float16).
+
+    Recency is the file mtime, refreshed on every hit, so the order survives restarts. The directory is shared by
+    every process using it (gunicorn workers, pool workers, the daemon): writes are atomic renames, and each put
+    measures the directory itself under an exclusive lock (fcntl) on <directory>/.lock before evicting, so the
+    bound holds for all of them together. A scan per put is cheap next to sampling the chunk it stores.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock_path = os.path.join(directory, ".lock")
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Returns (wave, mel) or None.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                wave, mel = data["wave"], data["mel"].astype(np.float32)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted by another process after it was read: still a valid result
+            pass
+        return wave, mel
+
+    def put(self, key, wave, mel):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, wave=np.asarray(wave, dtype=np.float32), mel=np.asarray(mel, dtype=np.float16))
+        os.replace(tmp_path, path)
+        with self._exclusive():
+            self._evict_locked(keep=path)
+
+    @contextmanager
+    def _exclusive(self):
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def usage(self):
+        """Returns [(mtime_ns, size, path)] of the cached chunks, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def _evict_locked(self, keep):
+        entries = self.usage()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:  # the chunk just stored stays even if it alone exceeds the bound
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"Evicted cached chunk {os.path.basename(path)[:-4]}")
@@ -0,0 +1,251 @@
+# Local inference daemon: one warm copy of DiT + Vocos per host, shared by the Flask app, socket_server and the
+# CLI over a Unix domain socket (protocol in daemon_client.py)
+#
+#   python -m f5_tts.infer.daemon --socket /tmp/f5_tts_daemon.sock
+import argparse
+import json
+import logging
+import os
+import select
+import socketserver
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from cached_path import cached_path
+
+from f5_tts.infer.chunk_cache import ChunkCache
+from f5_tts.infer.daemon_client import (
+    CANCEL,
+    CHUNK,
+    DEFAULT_SOCKET_PATH,
+    DONE,
+    ERROR,
+    ERROR_CANCELLED,
+    ERROR_INTERNAL,
+    ERROR_UNKNOWN_VOICE,
+    FLAG_CHUNKS,
+    FLAG_MEL,
+    FLAG_PROGRESS,
+    FLAG_TRIM_INTERNAL_SILENCE,
+    FORMAT,
+    INFO,
+    MEL,
+    OK,
+    PCM,
+    PROGRESS,
+    PROGRESS_FRAME,
+    SYNTH,
+    SYNTH_PARAMS,
+    VOICE,
+    encode_error,
+    encode_pcm,
+    read_frame,
+    write_frame,
+)
+from f5_tts.infer.utils_infer import (
+    CancellationToken,
+    DurationEstimator,
+    InferenceCancelled,
+    device,
+    infer_process,
+    load_model,
+    load_vocoder,
+    target_sample_rate,
+)
+from f5_tts.model import DiT
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CKPT = "hf://jpgallegoar/F5-Spanish/model_1250000.safetensors"
+F5TTS_MODEL_CFG = dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4)
+
+
+class PcmSink:
+    """Streams the assembled (cross-faded) audio to the client as PCM frames."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.samples = 0
+
+    def write(self, wave):
+        write_frame(self.sock, PCM, encode_pcm(wave))
+        self.samples += len(wave)
+
+
+class InferenceDaemon:
+    """
+    Owns the model and vocoder. Requests from any number of connections are served one at a time: the model is
+    shared, and running syntheses concurrently on it would only make each of them slower.
+
+    Registered voices are kept in LRU order, at most max_voices of them; a client whose voice was dropped gets
+    ERROR_UNKNOWN_VOICE and registers it again.
+    """
+
+    def __init__(self, model, vocoder, chunk_cache=None, max_voices=256):
+        self.model = model
+        self.vocoder = vocoder
+        self.chunk_cache = chunk_cache
+        self.max_voices = max_voices
+        self.voices = OrderedDict()
+        self.voices_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def register_voice(self, vid, voice):
+        with self.voices_lock:
+            self.voices[vid] = voice
+            self.voices.move_to_end(vid)
+            while len(self.voices) > self.max_voices:
+                self.voices.popitem(last=False)
+
+    def find_voice(self, vid):
+        with self.voices_lock:
+            voice = self.voices.get(vid)
+            if voice is not None:
+                self.voices.move_to_end(vid)
+            return voice
+
+    def handle(self, sock):
+        while True:
+            try:
+                frame_type, payload = read_frame(sock)
+            except ConnectionError:
+                return
+            if frame_type == VOICE:
+                voice = json.loads(payload)
+                self.register_voice(voice.pop("id"), voice)
+                write_frame(sock, OK)
+            elif frame_type == SYNTH:
+                self.synthesize(sock, payload)
+            elif frame_type == INFO:
+                info = {"checkpoint": getattr(self.model, "checkpoint_id", None)}
+                write_frame(sock, OK, json.dumps(info).encode("utf-8"))
+            elif frame_type != CANCEL:  # a late CANCEL for a request that already finished is harmless
+                write_frame(sock, ERROR, encode_error(ERROR_INTERNAL, f"unknown frame type {frame_type}"))
+
+    def synthesize(self, sock, payload):
+        speed, cross_fade_duration, nfe_step, cfg_strength, sway, target_rms, seed, flags = SYNTH_PARAMS.unpack_from(
+            payload
+        )
+        offset = SYNTH_PARAMS.size
+        (vid_length,) = struct.unpack_from("<H", payload, offset)
+        vid = payload[offset + 2 : offset + 2 + vid_length].decode("ascii")
+        text = payload[offset + 2 + vid_length :].decode("utf-8")
+
+        voice = self.find_voice(vid)
+        if voice is None:
+            write_frame(sock, ERROR, encode_error(ERROR_UNKNOWN_VOICE, f"unknown voice {vid}"))
+            return
+
+        token = CancellationToken()
+
+        def on_step(progress):
+            # between ODE steps: a CANCEL frame or a closed connection stops the synthesis
+            if select.select([sock], [], [], 0)[0]:
+                try:
+                    frame_type, _ = read_frame(sock)
+                except ConnectionError:
+                    frame_type = CANCEL
+                if frame_type == CANCEL:
+                    token.cancel()
+            if flags & FLAG_PROGRESS:
+                write_frame(
+                    sock,
+                    PROGRESS_FRAME,
+                    PROGRESS.pack(
+                        progress["chunk"], progress["chunks"], progress["step"], progress["steps"], progress["elapsed"]
+                    ),
+                )
+
+        def on_chunk(i, chunk_text, wave, mel):
+            encoded = chunk_text.encode("utf-8")
+            write_frame(sock, CHUNK, struct.pack("<H", len(encoded)) + encoded + encode_pcm(wave))
+
+        chunks = bool(flags & FLAG_CHUNKS)
+        sink = None if chunks else PcmSink(sock)
+        try:
+            with self.lock:
+                write_frame(sock, FORMAT, struct.pack("<I", target_sample_rate))
+                _, _, mel = infer_process(
+                    voice["audio"],
+                    voice["ref_text"],
+                    text,
+                    self.model,
+                    self.vocoder,
+                    show_info=logger.info,
+                    target_rms=target_rms,
+                    cross_fade_duration=cross_fade_duration,
+                    nfe_step=nfe_step,
+                    cfg_strength=cfg_strength,
+                    sway_sampling_coef=sway,
+                    speed=speed,
+                    ref_mel=np.load(voice["mel"], mmap_mode="r") if voice.get("mel") else None,
+                    duration_estimator=DurationEstimator(**voice["duration"]) if voice.get("duration") else None,
+                    trim_internal_silence=bool(flags & FLAG_TRIM_INTERNAL_SILENCE),
+                    sink=sink,
+                    return_spectrogram=bool(flags & FLAG_MEL),
+                    progress_callback=on_step,
+                    cancel_token=token,
+                    seed=seed,
+                    chunk_cache=self.chunk_cache,
+                    on_chunk=on_chunk if chunks else None,
+                    assemble=not chunks,  # in chunk mode the client joins the chunks itself
+                )
+            if mel is not None:
+                mel = np.ascontiguousarray(mel, dtype="<f2")
+                write_frame(sock, MEL, struct.pack("<II", *mel.shape) + mel.tobytes())
+            write_frame(sock, DONE, struct.pack("<Q", getattr(sink, "samples", 0)))
+        except InferenceCancelled as e:
+            write_frame(sock, ERROR, encode_error(ERROR_CANCELLED, str(e) or "cancelled"))
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("Client went away during synthesis")
+        except Exception as e:
+            logger.exception(f"Synthesis failed: {e}")
+            write_frame(sock, ERROR, encode_error(ERROR_INTERNAL, str(e)))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.daemon_instance.handle(self.request)
+
+
+def serve(daemon, path=DEFAULT_SOCKET_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.ThreadingUnixStreamServer(path, _Handler) as server:
+        server.daemon_threads = True
+        server.daemon_instance = daemon
+        os.chmod(path, 0o660)
+        logger.info(f"Inference daemon listening on {path}")
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local F5-TTS inference daemon")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("-p", "--ckpt_file", default=DEFAULT_CKPT, help="checkpoint (.safetensors/.pt or hf:// url)")
+    parser.add_argument("-v", "--vocab_file", default="", help="vocab .txt")
+    parser.add_argument("--chunk_cache", default="", help="folder of the generated-chunk cache (disabled if empty)")
+    parser.add_argument("--duration_predictor", default="", help="trained DurationPredictor checkpoint (optional)")
+    parser.add_argument("--chunk_cache_max_bytes", type=int, default=2 * 1024**3)
+    parser.add_argument("--max_voices", type=int, default=256, help="registered voices kept, least recently used go")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    model = load_model(
+        DiT,
+        F5TTS_MODEL_CFG,
+        str(cached_path(args.ckpt_file)),
+        vocab_file=args.vocab_file,
+        mmap=device == "cpu",
+        duration_predictor_ckpt=args.duration_predictor,
+    )
+    vocoder = load_vocoder()
+    chunk_cache = ChunkCache(args.chunk_cache, max_bytes=args.chunk_cache_max_bytes) if args.chunk_cache else None
+    serve(InferenceDaemon(model, vocoder, chunk_cache, max_voices=args.max_voices), args.socket)
+
+
+if __name__ == "__main__":
+    main()
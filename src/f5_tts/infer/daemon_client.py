@@ -0,0 +1,243 @@
+# Client side of the local inference daemon (see daemon.py) and its wire protocol
+#
+# Every message is a frame: a 5-byte header (type: u8, payload length: u32, little-endian) and the payload.
+#
+# client -> daemon
+#   VOICE   JSON {"id", "audio", "ref_text", "mel", "duration"}: registers a prepared voice, answered with OK
+#   SYNTH   <ffHfffIB speed, cross_fade_duration, nfe_step, cfg_strength, sway_sampling_coef, target_rms, seed,
+#           flags> + <H voice id length> + voice id + text (utf-8, rest of the payload)
+#   CANCEL  empty: stop the running synthesis, answered with ERROR(cancelled)
+#   INFO    empty: answered with OK + JSON {"checkpoint"}, the id of the weights the daemon runs
+#
+# daemon -> client, for SYNTH: FORMAT, then PCM or CHUNK frames (and PROGRESS), optionally MEL, then DONE;
+# ERROR may replace any of them and ends the request.
+#   FORMAT    <I sample rate
+#   PCM       mono s16le samples, already cross-faded, in playback order
+#   CHUNK     <H text length> + chunk text + s16le samples of one generated chunk (FLAG_CHUNKS mode)
+#   PROGRESS  <IIIIf chunk, chunks, step, steps, elapsed
+#   MEL       <II channels, frames> + float16 mel spectrogram (n_mels x frames, as infer_process returns it)
+#   DONE      <Q total samples
+#   ERROR     <B code> + utf-8 message
+import hashlib
+import json
+import os
+import socket
+import struct
+
+import numpy as np
+
+DEFAULT_SOCKET_PATH = os.environ.get("F5_TTS_DAEMON_SOCKET", "/tmp/f5_tts_daemon.sock")
+
+HEADER = struct.Struct("<BI")
+SYNTH_PARAMS = struct.Struct("<ffHfffIB")
+PROGRESS = struct.Struct("<IIIIf")
+
+VOICE, SYNTH, CANCEL, INFO = 0x01, 0x02, 0x03, 0x04
+OK, FORMAT, PCM, CHUNK, PROGRESS_FRAME, MEL, DONE, ERROR = 0x80, 0x81, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87
+
+FLAG_TRIM_INTERNAL_SILENCE = 1
+FLAG_PROGRESS = 2
+FLAG_CHUNKS = 4
+FLAG_MEL = 8
+
+ERROR_INTERNAL, ERROR_UNKNOWN_VOICE, ERROR_CANCELLED = 0, 1, 2
+
+
+class DaemonError(Exception):
+    def __init__(self, message, code=ERROR_INTERNAL):
+        super().__init__(message)
+        self.code = code
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while size:
+        n = sock.recv_into(view[-size:], size)
+        if n == 0:
+            raise ConnectionError("connection closed by peer")
+        size -= n
+    return bytes(buffer)
+
+
+def read_frame(sock):
+    frame_type, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return frame_type, _recv_exact(sock, length) if length else b""
+
+
+def write_frame(sock, frame_type, payload=b""):
+    sock.sendall(HEADER.pack(frame_type, len(payload)) + payload)
+
+
+def encode_pcm(wave):
+    return (np.clip(np.asarray(wave, dtype=np.float32), -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def decode_pcm(payload):
+    return np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32767
+
+
+def encode_error(code, message):
+    return struct.pack("<B", code) + message.encode("utf-8")
+
+
+def voice_id(voice):
+    """Stable id of a prepared voice: hash of its paths, transcript and duration model."""
+    return hashlib.sha256(json.dumps(voice, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+
+class InferenceDaemonClient:
+    """
+    Thin client for the inference daemon. One connection per call, so an instance can be shared by threads.
+
+    A voice is a dict {"audio", "ref_text", "mel", "duration"} describing an already prepared reference (paths
+    on this host); it is registered with the daemon on first use, and again if the daemon was restarted.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, timeout=None):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def frames(
+        self,
+        voice,
+        text,
+        speed=1.0,
+        cross_fade_duration=0.15,
+        nfe_step=32,
+        cfg_strength=2.0,
+        sway_sampling_coef=-1.0,
+        target_rms=0.1,
+        seed=0,
+        trim_internal_silence=False,
+        progress=False,
+        chunks=False,
+        return_spectrogram=False,
+        cancel_token=None,
+    ):
+        """
+        Sends one SYNTH request and yields the daemon's reply frames (type, payload) up to DONE.
+        Raises DaemonError on ERROR, or InferenceCancelled once a cancelled cancel_token has been honoured.
+        """
+        voice = {key: voice.get(key) for key in ("audio", "ref_text", "mel", "duration")}
+        # the daemon runs in another working directory
+        for key in ("audio", "mel"):
+            if voice[key]:
+                voice[key] = os.path.abspath(voice[key])
+        vid = voice_id(voice).encode("ascii")
+        flags = (
+            (FLAG_TRIM_INTERNAL_SILENCE if trim_internal_silence else 0)
+            # progress frames are also what lets a cancellation be sent between ODE steps
+            | (FLAG_PROGRESS if progress or cancel_token is not None else 0)
+            | (FLAG_CHUNKS if chunks else 0)
+            | (FLAG_MEL if return_spectrogram else 0)
+        )
+        request = (
+            SYNTH_PARAMS.pack(
+                speed, cross_fade_duration, nfe_step, cfg_strength, sway_sampling_coef, target_rms, seed, flags
+            )
+            + struct.pack("<H", len(vid))
+            + vid
+            + text.encode("utf-8")
+        )
+
+        with self._connect() as sock:
+            write_frame(sock, SYNTH, request)
+            cancel_sent = False
+            while True:
+                frame_type, payload = read_frame(sock)
+                if frame_type == ERROR:
+                    code, message = payload[0], payload[1:].decode("utf-8", errors="replace")
+                    if code == ERROR_UNKNOWN_VOICE:
+                        write_frame(sock, VOICE, json.dumps({"id": vid.decode("ascii"), **voice}).encode("utf-8"))
+                        frame_type, payload = read_frame(sock)
+                        if frame_type != OK:
+                            raise DaemonError(payload[1:].decode("utf-8", errors="replace"), payload[0])
+                        write_frame(sock, SYNTH, request)
+                        continue
+                    if code == ERROR_CANCELLED:
+                        from f5_tts.infer.utils_infer import InferenceCancelled
+
+                        raise InferenceCancelled(message)
+                    raise DaemonError(message, code)
+
+                if cancel_token is not None and cancel_token.cancelled and not cancel_sent:
+                    write_frame(sock, CANCEL)
+                    cancel_sent = True
+
+                yield frame_type, payload
+                if frame_type == DONE:
+                    return
+
+    def info(self):
+        """Returns the daemon's {"checkpoint": id of the weights it runs}."""
+        with self._connect() as sock:
+            write_frame(sock, INFO)
+            frame_type, payload = read_frame(sock)
+        if frame_type != OK:
+            raise DaemonError(payload[1:].decode("utf-8", errors="replace"), payload[0])
+        return json.loads(payload)
+
+    def synthesize(
+        self,
+        voice,
+        text,
+        sink=None,
+        on_chunk=None,
+        progress_callback=None,
+        return_spectrogram=False,
+        assemble=True,
+        **params,
+    ):
+        """
+        Same contract as infer_process: writes to sink when given, otherwise returns the whole wave.
+        Returns (wave or None, sample rate, mel or None). assemble=False switches the daemon to per-chunk frames:
+        the chunks are passed to on_chunk(i, text, wave, None) and nothing is assembled.
+        """
+        if not assemble and on_chunk is None:
+            raise ValueError("assemble=False needs on_chunk")
+        sample_rate, waves, mel, index = None, [], None, 0
+        for frame_type, payload in self.frames(
+            voice,
+            text,
+            progress=progress_callback is not None,
+            chunks=not assemble,
+            return_spectrogram=return_spectrogram,
+            **params,
+        ):
+            if frame_type == FORMAT:
+                (sample_rate,) = struct.unpack("<I", payload)
+            elif frame_type == PCM:
+                wave = decode_pcm(payload)
+                if sink is not None:
+                    sink.write(wave)
+                else:
+                    waves.append(wave)
+            elif frame_type == CHUNK:
+                (text_length,) = struct.unpack_from("<H", payload)
+                chunk_text = payload[2 : 2 + text_length].decode("utf-8")
+                on_chunk(index, chunk_text, decode_pcm(payload[2 + text_length :]), None)
+                index += 1
+            elif frame_type == PROGRESS_FRAME and progress_callback is not None:
+                chunk, chunks, step, steps, elapsed = PROGRESS.unpack(payload)
+                progress_callback({"chunk": chunk, "chunks": chunks, "step": step, "steps": steps, "elapsed": elapsed})
+            elif frame_type == MEL:
+                shape = struct.unpack_from("<II", payload)
+                mel = np.frombuffer(payload[8:], dtype="<f2").reshape(shape).astype(np.float32)
+
+        wave = None
+        if sink is None and assemble:
+            wave = np.concatenate(waves) if waves else np.zeros(0, dtype=np.float32)
+        return wave, sample_rate, mel
+
+    def stream(self, voice, text, **params):
+        """Yields float32 PCM blocks as the daemon produces them (for socket_server)."""
+        for frame_type, payload in self.frames(voice, text, **params):
+            if frame_type == PCM:
+                yield decode_pcm(payload)
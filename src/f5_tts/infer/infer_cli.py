@@ -5,15 +5,15 @@ import re
 from importlib.resources import files
 from pathlib import Path
 
-import numpy as np
-import soundfile as sf
 import tomli
 from cached_path import cached_path
 
+from f5_tts.infer.daemon_client import InferenceDaemonClient
 from f5_tts.infer.utils_infer import (
     infer_process,
     load_model,
     load_vocoder,
+    open_audio_sink,
     preprocess_ref_audio_text,
     remove_silence_for_generated_wav,
 )
@@ -81,7 +81,28 @@ parser.add_argument(
     default=1.0,
     help="Adjust the speed of the audio generation (default: 1.0)",
 )
+parser.add_argument(
+    "--daemon",
+    type=str,
+    default="",
+    help="Unix socket of a running inference daemon; the model is not loaded in this process",
+)
 args = parser.parse_args()
+if args.daemon:
+    # the daemon runs its own checkpoint with vocos; silently ignoring these would synthesize with other weights
+    model_options = [
+        option
+        for option, given in [
+            ("--model", args.model),
+            ("--ckpt_file", args.ckpt_file),
+            ("--vocab_file", args.vocab_file),
+            ("--vocoder_name", args.vocoder_name != "vocos"),
+            ("--load_vocoder_from_local", args.load_vocoder_from_local),
+        ]
+        if given
+    ]
+    if model_options:
+        parser.error(f"--daemon uses the daemon's model and vocoder, {', '.join(model_options)} cannot be combined")
 
 config = tomli.load(open(args.config, "rb"))
 
@@ -117,44 +138,50 @@ elif args.vocoder_name == "bigvgan":
     vocoder_local_path = "../checkpoints/bigvgan_v2_24khz_100band_256x"
 mel_spec_type = args.vocoder_name
 
-vocoder = load_vocoder(vocoder_name=mel_spec_type, is_local=args.load_vocoder_from_local, local_path=vocoder_local_path)
+# With --daemon the model and vocoder live in the inference daemon (python -m f5_tts.infer.daemon)
+daemon = InferenceDaemonClient(args.daemon) if args.daemon else None
+if daemon is None:
+    vocoder = load_vocoder(
+        vocoder_name=mel_spec_type, is_local=args.load_vocoder_from_local, local_path=vocoder_local_path
+    )
 
+    # load models
+    if model == "F5-TTS":
+        model_cls = DiT
+        model_cfg = dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4)
+        if ckpt_file == "":
+            if args.vocoder_name == "vocos":
+                repo_name = "F5-TTS"
+                exp_name = "F5TTS_Base"
+                ckpt_step = 1200000
+                ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.safetensors"))
+                # ckpt_file = f"ckpts/{exp_name}/model_{ckpt_step}.pt"  # .pt | .safetensors; local path
+            elif args.vocoder_name == "bigvgan":
+                repo_name = "F5-TTS"
+                exp_name = "F5TTS_Base_bigvgan"
+                ckpt_step = 1250000
+                ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.pt"))
 
-# load models
-if model == "F5-TTS":
-    model_cls = DiT
-    model_cfg = dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4)
-    if ckpt_file == "":
-        if args.vocoder_name == "vocos":
-            repo_name = "F5-TTS"
-            exp_name = "F5TTS_Base"
+    elif model == "E2-TTS":
+        model_cls = UNetT
+        model_cfg = dict(dim=1024, depth=24, heads=16, ff_mult=4)
+        if ckpt_file == "":
+            repo_name = "E2-TTS"
+            exp_name = "E2TTS_Base"
             ckpt_step = 1200000
             ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.safetensors"))
             # ckpt_file = f"ckpts/{exp_name}/model_{ckpt_step}.pt"  # .pt | .safetensors; local path
-        elif args.vocoder_name == "bigvgan":
+        elif args.vocoder_name == "bigvgan":  # TODO: need to test
             repo_name = "F5-TTS"
             exp_name = "F5TTS_Base_bigvgan"
             ckpt_step = 1250000
             ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.pt"))
 
-elif model == "E2-TTS":
-    model_cls = UNetT
-    model_cfg = dict(dim=1024, depth=24, heads=16, ff_mult=4)
-    if ckpt_file == "":
-        repo_name = "E2-TTS"
-        exp_name = "E2TTS_Base"
-        ckpt_step = 1200000
-        ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.safetensors"))
-        # ckpt_file = f"ckpts/{exp_name}/model_{ckpt_step}.pt"  # .pt | .safetensors; local path
-    elif args.vocoder_name == "bigvgan":  # TODO: need to test
-        repo_name = "F5-TTS"
-        exp_name = "F5TTS_Base_bigvgan"
-        ckpt_step = 1250000
-        ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{exp_name}/model_{ckpt_step}.pt"))
-
-
-print(f"Using {model}...")
-ema_model = load_model(model_cls, model_cfg, ckpt_file, mel_spec_type=args.vocoder_name, vocab_file=vocab_file)
+    print(f"Using {model}...")
+    ema_model = load_model(model_cls, model_cfg, ckpt_file, mel_spec_type=args.vocoder_name, vocab_file=vocab_file)
+else:
+    print(f"Using the inference daemon at {args.daemon}...")
+    vocoder = ema_model = None
 
 
 def main_process(ref_audio, ref_text, text_gen, model_obj, mel_spec_type, remove_silence, speed):
@@ -172,7 +199,7 @@ def main_process(ref_audio, ref_text, text_gen, model_obj, mel_spec_type, remove
         print("Ref_audio:", voices[voice]["ref_audio"])
         print("Ref_text:", voices[voice]["ref_text"])
 
-    generated_audio_segments = []
+    generated_text_segments = []
     reg1 = r"(?=\[\w+\])"
     chunks = re.split(reg1, text_gen)
     reg2 = r"\[(\w+)\]"
@@ -189,27 +216,42 @@ def main_process(ref_audio, ref_text, text_gen, model_obj, mel_spec_type, remove
             print(f"Voice {voice} not found, using main.")
             voice = "main"
         text = re.sub(reg2, "", text)
-        gen_text = text.strip()
-        ref_audio = voices[voice]["ref_audio"]
-        ref_text = voices[voice]["ref_text"]
-        print(f"Voice: {voice}")
-        audio, final_sample_rate, spectragram = infer_process(
-            ref_audio, ref_text, gen_text, model_obj, vocoder, mel_spec_type=mel_spec_type, speed=speed
-        )
-        generated_audio_segments.append(audio)
-
-    if generated_audio_segments:
-        final_wave = np.concatenate(generated_audio_segments)
+        generated_text_segments.append((voice, text.strip()))
 
+    if generated_text_segments:
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        with open(wave_path, "wb") as f:
-            sf.write(f.name, final_wave, final_sample_rate)
-            # Remove silence
-            if remove_silence:
-                remove_silence_for_generated_wav(f.name)
-            print(f.name)
+        # Every chunk is appended to the output file as soon as it is generated, voices are joined back to back
+        with open_audio_sink(wave_path) as sink:
+            for voice, gen_text in generated_text_segments:
+                ref_audio = voices[voice]["ref_audio"]
+                ref_text = voices[voice]["ref_text"]
+                print(f"Voice: {voice}")
+                if daemon is not None:
+                    daemon.synthesize(
+                        {"audio": ref_audio, "ref_text": ref_text, "mel": None, "duration": None},
+                        gen_text,
+                        speed=speed,
+                        sink=sink,
+                    )
+                    continue
+                infer_process(
+                    ref_audio,
+                    ref_text,
+                    gen_text,
+                    model_obj,
+                    vocoder,
+                    mel_spec_type=mel_spec_type,
+                    speed=speed,
+                    sink=sink,
+                    return_spectrogram=False,
+                )
+
+        # Remove silence
+        if remove_silence:
+            remove_silence_for_generated_wav(str(wave_path))
+        print(wave_path)
 
 
 def main():
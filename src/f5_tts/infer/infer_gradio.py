@@ -1,31 +1,55 @@
 import re 
-import tempfile
 import os
+import io
 import json
+import base64
+import hashlib
+import queue
 import time
 import glob
 import logging
-from flask import Flask, request, jsonify, send_file
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from num2words import num2words
 from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 import numpy as np
 import soundfile as sf
-import torchaudio
 from pydub import AudioSegment
 import whisper_timestamped
 import datetime
 from f5_tts.infer.prosody import modify_prosody
+from f5_tts.infer.jobs import JobManager, JobStore, QueueFullError
+from f5_tts.infer.scheduler import LANES, AdmissionError, InferenceScheduler
+from f5_tts.infer.audio_assembly import CrossfadeWriter, TeeSink, crossfade_concat
+from f5_tts.infer.chunk_cache import ChunkCache
+from f5_tts.infer.projects import ProjectStore, diff_units
+from f5_tts.infer.singleflight import SingleFlight, request_key
+from f5_tts.infer.speech_types import SpeechTypeRegistry
+from f5_tts.infer.audio_store import AudioStore
+from f5_tts.infer.daemon_client import InferenceDaemonClient
+from f5_tts.infer.worker_pool import InferencePool
 
 from f5_tts.model import DiT, UNetT
 from f5_tts.infer.utils_infer import (
     load_vocoder,
     load_model,
+    ModelFrontend,
     preprocess_ref_audio_text,
     infer_process,
-    remove_silence_for_generated_wav,
+    open_audio_sink,
+    save_mel,
     save_spectrogram,
+    save_canonical_audio,
+    prepare_ref_artifacts,
+    plan_chunks,
+    split_sentences,
+    join_sentences,
+    CancellationToken,
+    DurationEstimator,
+    hop_length,
+    target_sample_rate,
 )
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
@@ -76,40 +100,114 @@ WHISPER_RAM_DTYPE = torch.float16                                  # ocupa menos
 logger.info(f"TTS usará: {TTS_DEVICE} — Whisper en RAM, dtype={WHISPER_RAM_DTYPE}")
 
 UPLOAD_FOLDER = 'temp_uploads'
+REFERENCE_AUDIO_FOLDER = 'reference_audios'  # audios subidos, una sola copia por contenido (sha256)
 GENERATED_AUDIO_FOLDER = 'generated_audios'
+CANONICAL_AUDIO_FOLDER = 'canonical_audios'  # referencias decodificadas una sola vez (24 kHz mono float32 .npy)
+PREPARED_REFS_FOLDER = 'prepared_refs'  # audio recortado, transcripción y mel listos para inferencia
+CHUNK_CACHE_FOLDER = 'chunk_cache'  # audio de fragmentos ya generados, LRU acotado por tamaño
+CHUNK_CACHE_MAX_BYTES = 2 * 1024**3
+PROJECTS_FOLDER = 'projects'  # último render de cada documento, para re-renderizar solo lo editado
+JOB_OUTPUT_FOLDER = 'job_outputs'  # resultados de trabajos asíncronos, se borran al vencer su TTL
 SPEECH_TYPES_FILE = 'speech_types.json'
+JOBS_DB_FILE = 'jobs.sqlite3'
+JOB_TTL_SECONDS = 3600
+# Socket del daemon de inferencia (python -m f5_tts.infer.daemon); si se indica, DiT y Vocos no se cargan aquí
+INFERENCE_DAEMON_SOCKET = os.environ.get('F5_TTS_DAEMON', '')
+# Pool de procesos de inferencia (ver worker_pool.py): número de procesos y hilos de torch de cada uno; con
+# F5_TTS_POOL_WORKERS=0 el modelo se carga en este proceso. Se activa con python -m f5_tts.infer.serve --pool-workers
+INFERENCE_POOL_WORKERS = int(os.environ.get('F5_TTS_POOL_WORKERS') or 0)
+INFERENCE_POOL_THREADS = int(os.environ.get('F5_TTS_POOL_THREADS') or 0) or None
+# Checkpoint de un DurationPredictor entrenado (Trainer duration_predictor); sin él se usa el ritmo de la referencia
+DURATION_PREDICTOR_CKPT = os.environ.get('F5_TTS_DURATION_PREDICTOR', '')
+DEFAULT_FRAMES_PER_BYTE = 6.5  # ~14 caracteres por segundo, para estimar costes de referencias sin preparar
+MAX_REF_FRAMES = int(15 * target_sample_rate / hop_length)  # preprocess_ref_audio_text recorta a < 15 s
 
 # Crear las carpetas si no existen
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(GENERATED_AUDIO_FOLDER, exist_ok=True)
+os.makedirs(CANONICAL_AUDIO_FOLDER, exist_ok=True)
+os.makedirs(PREPARED_REFS_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['GENERATED_AUDIO_FOLDER'] = GENERATED_AUDIO_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = None
 
 try:
-    vocoder = load_vocoder()
-    F5TTS_model_cfg = dict(
-        dim=1024,
-        depth=22,
-        heads=16,
-        ff_mult=2,
-        text_dim=512,
-        conv_layers=4
-    )
-    model_path = hf_hub_download(repo_id="jpgallegoar/F5-Spanish", filename="model_1250000.safetensors")
-    F5TTS_ema_model = load_model(
-        DiT,
-        F5TTS_model_cfg,
-        model_path,
-        device=TTS_DEVICE
-    )
-    logger.info("Modelos cargados exitosamente.")
+    if INFERENCE_DAEMON_SOCKET:
+        # El modelo vive en el daemon; aquí solo hacen falta el front-end de texto y el mel de las referencias
+        inference_daemon = InferenceDaemonClient(INFERENCE_DAEMON_SOCKET)
+        vocoder = None
+        F5TTS_ema_model = ModelFrontend(duration_predictor_ckpt=DURATION_PREDICTOR_CKPT)
+        logger.info(f"Inferencia delegada al daemon en {INFERENCE_DAEMON_SOCKET}")
+    elif INFERENCE_POOL_WORKERS:
+        # Los pesos los cargan los procesos del pool, que se arrancan con la primera petición (ver inference_pool)
+        inference_daemon = None
+        vocoder = None
+        model_path = hf_hub_download(repo_id="jpgallegoar/F5-Spanish", filename="model_1250000.safetensors")
+        F5TTS_ema_model = ModelFrontend(duration_predictor_ckpt=DURATION_PREDICTOR_CKPT, ckpt_path=model_path)
+        logger.info(f"Inferencia en un pool de {INFERENCE_POOL_WORKERS} procesos")
+    else:
+        inference_daemon = None
+        vocoder = load_vocoder()
+        F5TTS_model_cfg = dict(
+            dim=1024,
+            depth=22,
+            heads=16,
+            ff_mult=2,
+            text_dim=512,
+            conv_layers=4
+        )
+        model_path = hf_hub_download(repo_id="jpgallegoar/F5-Spanish", filename="model_1250000.safetensors")
+        F5TTS_ema_model = load_model(
+            DiT,
+            F5TTS_model_cfg,
+            model_path,
+            device=TTS_DEVICE,
+            # En CPU los pesos son vistas sobre el checkpoint mapeado: los workers de gunicorn los comparten
+            mmap=TTS_DEVICE == "cpu",
+            duration_predictor_ckpt=DURATION_PREDICTOR_CKPT
+        )
+        logger.info("Modelos cargados exitosamente.")
 except Exception as e:
     logger.exception(f"Error al cargar los modelos: {str(e)}")
     raise
 
-speech_types_dict = {}
+# Compartido por todos los workers de gunicorn; cada proceso relee el JSON solo cuando otro lo reemplaza
+speech_type_registry = SpeechTypeRegistry(SPEECH_TYPES_FILE)
+# Evita transcodificar dos veces a la vez la misma referencia antigua en este proceso
+canonical_audio_lock = threading.Lock()
+
+# La misma grabación subida con varios nombres se guarda, transcodifica y prepara una sola vez
+audio_store = AudioStore(REFERENCE_AUDIO_FOLDER)
+
+# Frases repetidas (saludos, instrucciones, definiciones) y guiones regenerados no se vuelven a muestrear
+chunk_cache = ChunkCache(CHUNK_CACHE_FOLDER, max_bytes=CHUNK_CACHE_MAX_BYTES)
+
+project_store = ProjectStore(PROJECTS_FOLDER)
+
+# Resolución de los perfiles de voz de una petición multi-estilo, un hilo por estilo
+voice_profile_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="voice-profile")
+
+# Todo el trabajo sobre el modelo pasa por el planificador: carril interactivo antes que lotes,
+# el más barato primero, y rechazo de lo que no terminaría dentro del plazo del carril.
+# Con el pool de procesos corren tantas peticiones a la vez como procesos tiene, para que ninguno quede ocioso
+inference_scheduler = InferenceScheduler(
+    deadlines={'interactive': 120.0, 'batch': 3 * 3600.0}, concurrency=INFERENCE_POOL_WORKERS or 1
+)
+
+# Generación asíncrona: los trabajos esperan su turno en el planificador
+job_manager = JobManager(
+    JobStore(JOBS_DB_FILE), JOB_OUTPUT_FOLDER, max_pending=32, ttl=JOB_TTL_SECONDS, scheduler=inference_scheduler
+)
+
+# Dobles clics, reintentos y usuarios generando el mismo texto de demo comparten un único cálculo
+single_flight = SingleFlight()
+
+# pyplot no es seguro entre hilos: los espectrogramas bajo demanda se dibujan de uno en uno
+spectrogram_render_lock = threading.Lock()
+
+# Un solo hilo: la preparación comparte GPU y ASR con la inferencia
+reference_prep_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ref-prep")
 
 # ---------- Whisper timestamped -----------
 # 1. Se carga UNA VEZ en CPU (RAM) en 16-bits para no ocupar VRAM.
@@ -143,15 +241,6 @@ def whisper_gpu(model):
         torch.cuda.ipc_collect()
  # ------------------------------------------
 
-def save_speech_types():
-    try:
-        with open(SPEECH_TYPES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(speech_types_dict, f, ensure_ascii=False, indent=4)
-        logger.info(f"Archivo JSON guardado exitosamente: {SPEECH_TYPES_FILE}")
-    except Exception as e:
-        logger.error(f"Error al guardar archivo JSON: {str(e)}")
-        raise
-
 def transcribe_audio_with_timestamps(audio_path, language="es"):
     """Transcribe audio usando Whisper en GPU solo mientras se necesita."""
     try:
@@ -174,18 +263,149 @@ def transcribe_audio_with_timestamps(audio_path, language="es"):
         return None
 
 def load_speech_types():
-    global speech_types_dict
+    speech_types = speech_type_registry.snapshot()
+    if not speech_types:
+        logger.info("No existe archivo de tipos de habla, se iniciará uno nuevo")
+
+    # Las entradas anteriores al almacén por contenido se pasan a él, para que compartan lo que derive de su audio
+    for style, speech_type_data in speech_types.items():
+        if 'sha256' not in speech_type_data and os.path.exists(speech_type_data['audio']):
+            digest, stored_path = audio_store.add_file(speech_type_data['audio'])
+
+            def migrate(speech_types, style=style, old_audio=speech_type_data['audio']):
+                current = speech_types.get(style)
+                if current is None or current['audio'] != old_audio:
+                    return
+                current.update(audio=stored_path, sha256=digest)
+                if not is_reference_ready(current):
+                    # Sin artefactos listos: se regeneran con nombres por hash y se pueden compartir
+                    current.pop('canonical', None)
+                    current.pop('prepared', None)
+
+            speech_type_registry.update(migrate)
+            logger.info(f"Audio de {style} movido al almacén por contenido: {stored_path}")
+
+    # Completar en segundo plano las referencias que aún no tienen artefactos preparados
+    for style, speech_type_data in speech_type_registry.snapshot().items():
+        if not is_reference_ready(speech_type_data):
+            logger.info(f"Referencia de {style} sin preparar, se encola su preparación")
+            enqueue_reference_preparation(style)
+
+def canonical_path_for(audio_path):
+    base = os.path.splitext(os.path.basename(audio_path.replace('\\', '/')))[0]
+    return os.path.join(CANONICAL_AUDIO_FOLDER, f"{base}.npy")
+
+def resolve_reference_audio(style):
+    """
+    Devuelve la ruta del audio de referencia canónico (.npy) de un tipo de habla.
+    Las entradas antiguas sin versión canónica se transcodifican una única vez y se registran en el JSON.
+    """
+    with canonical_audio_lock:
+        speech_type_data = speech_type_registry.get(style)
+        canonical = speech_type_data.get('canonical')
+        if canonical and os.path.exists(canonical):
+            return canonical
+
+        ref_audio = speech_type_data['audio']
+        if not os.path.exists(ref_audio):
+            return None
+
+        canonical = canonical_path_for(ref_audio)
+        save_canonical_audio(ref_audio, canonical)
+
+        def set_canonical(speech_types):
+            if speech_types.get(style, {}).get('audio') == ref_audio:
+                speech_types[style]['canonical'] = canonical
+
+        speech_type_registry.update(set_canonical)
+    logger.info(f"Audio de referencia de {style} transcodificado a formato canónico: {canonical}")
+    return canonical
+
+def reference_text_for(style, speech_type_data):
+    # Para estilos que NO sean "Regular", forzamos la transcripción ignorando el texto almacenado.
+    if style != "Regular":
+        return ""
+    return speech_type_data.get('ref_text', '')
+
+def prepared_folder_for(ref_text):
+    """
+    Carpeta de artefactos preparados: sus nombres salen del hash del audio, y aquí se separan por el texto de
+    referencia con que se prepararon ('asr' si se transcribió), que también los determina.
+    """
+    ref_text = ref_text.strip()
+    key = hashlib.sha256(ref_text.encode('utf-8')).hexdigest()[:16] if ref_text else 'asr'
+    return os.path.join(PREPARED_REFS_FOLDER, key)
+
+def shared_preparation(speech_types, style):
+    """Artefactos ya preparados por otro tipo de habla con el mismo audio y el mismo texto de referencia, o None."""
+    speech_type_data = speech_types[style]
+    canonical = speech_type_data.get('canonical')
+    if not canonical:
+        return None
+    ref_text = reference_text_for(style, speech_type_data)
+    for other, other_data in speech_types.items():
+        if (
+            other != style
+            and other_data.get('canonical') == canonical
+            and reference_text_for(other, other_data) == ref_text
+            and is_reference_ready(other_data)
+        ):
+            return other_data['prepared']
+    return None
+
+def is_reference_ready(speech_type_data):
+    prepared = speech_type_data.get('prepared')
+    return (
+        speech_type_data.get('status') == 'ready'
+        and prepared is not None
+        and prepared.get('source') == speech_type_data.get('canonical')
+        and os.path.exists(prepared['audio'])
+        and os.path.exists(prepared['mel'])
+    )
+
+def prepare_speech_type(style):
+    """
+    Trabajo en segundo plano: recorta, transcribe y calcula el mel de la referencia
+    de un tipo de habla, y lo marca como 'ready'.
+    """
+    snapshot = speech_type_registry.get(style)
+    if snapshot is None:
+        return
+
     try:
-        if os.path.exists(SPEECH_TYPES_FILE):
-            with open(SPEECH_TYPES_FILE, 'r', encoding='utf-8') as f:
-                speech_types_dict = json.load(f)
-            logger.info(f"Tipos de habla cargados: {speech_types_dict}")
+        canonical = resolve_reference_audio(style)
+        if canonical is None:
+            raise FileNotFoundError(f"Archivo de audio no encontrado: {snapshot['audio']}")
+
+        artifacts = shared_preparation(speech_type_registry.snapshot(), style)
+        if artifacts is not None:
+            logger.info(f"Referencia de {style} reutiliza los artefactos de otro tipo de habla con el mismo audio")
         else:
-            speech_types_dict = {}
-            logger.info("No existe archivo de tipos de habla, se iniciará uno nuevo")
+            ref_text = reference_text_for(style, snapshot)
+            artifacts = prepare_ref_artifacts(
+                canonical,
+                ref_text,
+                prepared_folder_for(ref_text),
+                F5TTS_ema_model,
+                show_info=lambda msg: logger.info(f"[{style}] {msg}"),
+            )
+            artifacts['source'] = canonical
+        status = 'ready'
     except Exception as e:
-        logger.error(f"Error al cargar tipos de habla: {str(e)}")
-        speech_types_dict = {}
+        logger.exception(f"Error al preparar la referencia de {style}: {e}")
+        artifacts, status = None, 'error'
+
+    # Si se subió un audio nuevo mientras tanto, no se guarda nada: su propio trabajo lo preparará
+    if speech_type_registry.set_prepared(style, snapshot.get('audio'), artifacts, status):
+        logger.info(f"Referencia de {style} preparada: {status}")
+
+def enqueue_reference_preparation(style):
+    def set_pending(speech_types):
+        if style in speech_types:
+            speech_types[style]['status'] = 'pending'
+
+    speech_type_registry.update(set_pending)
+    return reference_prep_executor.submit(prepare_speech_type, style)
 
 def gpu_decorator(func):
     if USING_SPACES:
@@ -214,53 +434,99 @@ def generate_response(messages, model, tokenizer):
     return tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
 
 def traducir_numero_a_texto(texto):
-    texto_separado = re.sub(r'([A-Za-z])(\d)', r'\1 \2', texto)
-    texto_separado = re.sub(r'(\d)([A-Za-z])', r'\1 \2', texto_separado)
-    def reemplazar_numero(match):
-        numero = match.group()
-        return num2words(int(numero), lang='es')
-    texto_traducido = re.sub(r'\b\d+\b', reemplazar_numero, texto_separado)
-    return texto_traducido
+    # Patrones precompilados y caché LRU por oración en el front-end de texto del modelo
+    return F5TTS_ema_model.text_frontend.normalize(texto)
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'wav', 'mp3','webm','ogg', 'm4a', 'WAV', 'MP3', 'OGG', 'M4A', 'WEBM'}
     return '.' in filename and filename.rsplit('.', 1)[1].upper() in ALLOWED_EXTENSIONS
 
+_inference_pool = None
+_inference_pool_lock = threading.Lock()
+
+def inference_pool():
+    """
+    El pool de procesos, creado con la primera petición: sus procesos y el hilo que recoge sus resultados deben
+    nacer en el worker de gunicorn, no en el maestro que lo bifurca. Si uno de sus procesos murió, el pool queda
+    roto y se sustituye por uno nuevo en la siguiente petición.
+    """
+    global _inference_pool
+    with _inference_pool_lock:
+        if _inference_pool is not None and _inference_pool.broken is not None:
+            logger.error(f"Pool de inferencia roto ({_inference_pool.broken}), se arranca uno nuevo")
+            atexit.unregister(_inference_pool.close)
+            _inference_pool.close()
+            _inference_pool = None
+        if _inference_pool is None:
+            _inference_pool = InferencePool(
+                model_path,
+                workers=INFERENCE_POOL_WORKERS,
+                threads_per_worker=INFERENCE_POOL_THREADS,
+                chunk_cache_dir=CHUNK_CACHE_FOLDER,
+                duration_predictor_ckpt=DURATION_PREDICTOR_CKPT
+            )
+            atexit.register(_inference_pool.close)
+        return _inference_pool
+
+def synthesize(voice, gen_text, model, **kwargs):
+    """
+    infer_process con un perfil de voz resuelto (ver resolve_voice_profile), en este proceso, en el daemon de
+    inferencia o en el pool de procesos; mismos argumentos y mismo resultado.
+    """
+    if inference_daemon is not None:
+        return inference_daemon.synthesize(voice, gen_text, **kwargs)
+    if INFERENCE_POOL_WORKERS:
+        return inference_pool().synthesize(voice, gen_text, **kwargs)
+    return infer_process(
+        voice['audio'],
+        voice['ref_text'],
+        gen_text,
+        model,
+        vocoder,
+        ref_mel=np.load(voice['mel'], mmap_mode='r') if voice['mel'] else None,
+        duration_estimator=DurationEstimator(**voice['duration']) if voice['duration'] else None,
+        chunk_cache=chunk_cache,
+        **kwargs
+    )
+
+def prepare_gen_text(gen_text):
+    if not gen_text.endswith(". "):
+        gen_text += ". "
+
+    gen_text = gen_text.lower()
+    return traducir_numero_a_texto(gen_text)
+
 @gpu_decorator
 def infer(
-    ref_audio_orig, ref_text, gen_text, model, remove_silence, cross_fade_duration=0.15, speed=1
+    voice, gen_text, model, remove_silence, cross_fade_duration=0.15, speed=1, sink=None, spectrogram=False,
+    progress_callback=None, cancel_token=None, seed=0
 ):
+    """
+    Genera gen_text con un perfil de voz ya resuelto (ver resolve_voice_profile); no vuelve a procesar la referencia.
+    """
     try:
-        ref_audio, ref_text = preprocess_ref_audio_text(ref_audio_orig, ref_text)
-
-        if not gen_text.endswith(". "):
-            gen_text += ". "
-
-        gen_text = gen_text.lower()
-        gen_text = traducir_numero_a_texto(gen_text)
+        gen_text = prepare_gen_text(gen_text)
 
-        final_wave, final_sample_rate, combined_spectrogram = infer_process(
-            ref_audio,
-            ref_text,
+        final_wave, final_sample_rate, combined_spectrogram = synthesize(
+            voice,
             gen_text,
             model,
-            vocoder,
             cross_fade_duration=cross_fade_duration,
-            speed=speed
+            speed=speed,
+            # Los silencios se recortan sobre el mel antes del vocoder; no hace falta la pasada con pydub
+            trim_internal_silence=remove_silence,
+            # Con un sink el audio se escribe a disco por fragmentos y no se acumula en memoria
+            sink=sink,
+            # El mel solo se conserva si se pidió el espectrograma; el PNG se genera al consultarlo
+            return_spectrogram=spectrogram,
+            # Progreso por paso del ODE y cancelación entre pasos
+            progress_callback=progress_callback,
+            cancel_token=cancel_token,
+            # Semilla determinista por fragmento: un fragmento ya generado se lee de la caché
+            seed=seed
         )
 
-        if remove_silence:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
-                sf.write(f.name, final_wave, final_sample_rate)
-                remove_silence_for_generated_wav(f.name)
-                final_wave, _ = torchaudio.load(f.name)
-            final_wave = final_wave.squeeze().cpu().numpy()
-
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_spectrogram:
-            spectrogram_path = tmp_spectrogram.name
-            save_spectrogram(combined_spectrogram, spectrogram_path)
-
-        return (final_sample_rate, final_wave), spectrogram_path
+        return (final_sample_rate, final_wave), combined_spectrogram
     except Exception as e:
         logger.exception(f"Error en infer: {str(e)}")
         raise
@@ -273,7 +539,10 @@ def analyze_audio():
         if not audio_path or not os.path.exists(audio_path):
             return jsonify({'success': False, 'error': 'audio_path no válido'}), 400
         
-        transcription = transcribe_audio_with_timestamps(audio_path, language='es')
+        transcription = single_flight.do(
+            request_key('analyze_audio', {'language': 'es'}, files=[audio_path]),
+            transcribe_audio_with_timestamps, audio_path, language='es'
+        )
         if transcription is None:
             return jsonify({'success': False, 'error': 'Error en transcripción'}), 500
         
@@ -301,6 +570,18 @@ def parse_speechtypes_text(gen_text):
             current_style = tokens[i].strip()
     return segments
 
+def merge_adjacent_segments(segments):
+    merged = []
+    for segment in segments:
+        if merged and merged[-1]["style"] == segment["style"]:
+            previous = merged[-1]["text"]
+            if previous[-1] not in ".!?…;:":
+                previous += "."
+            merged[-1]["text"] = f"{previous} {segment['text']}"
+        else:
+            merged.append(dict(segment))
+    return merged
+
 
 
 @app.route('/api/upload_audio', methods=['POST'])
@@ -330,43 +611,55 @@ def upload_audio():
             logger.error(f"Tipo de archivo no permitido: {file.filename}")
             return jsonify({'error': 'Tipo de archivo no permitido'}), 400
         
-        if not os.path.exists(UPLOAD_FOLDER):
-            os.makedirs(UPLOAD_FOLDER)
-        
-        timestamp = int(time.time())
-        filename = secure_filename(f"{speech_type}_{timestamp}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
+        # Una sola copia por contenido: volver a subir la misma grabación (con otro nombre o para otro
+        # tipo de habla) reutiliza el archivo guardado y todo lo que se derivó de él
         try:
-            file.save(filepath)
-            logger.info(f"Archivo guardado en: {filepath}")
+            digest, filepath = audio_store.add_stream(file.stream, os.path.splitext(secure_filename(file.filename))[1])
+            logger.info(f"Archivo guardado en: {filepath} (sha256 {digest})")
         except Exception as e:
             logger.error(f"Error al guardar el archivo: {str(e)}")
             return jsonify({'error': f'Error al guardar el archivo: {str(e)}'}), 500
-        
-        if not os.path.exists(filepath):
-            logger.error("El archivo no se guardó correctamente")
-            return jsonify({'error': 'Error al guardar el archivo'}), 500
-        
+
+        # Decodificar una sola vez a 24 kHz mono float32; la inferencia usará el .npy mapeado en memoria
+        canonical_path = canonical_path_for(filepath)
+        if not os.path.exists(canonical_path):
+            try:
+                save_canonical_audio(filepath, canonical_path)
+                logger.info(f"Audio canónico guardado en: {canonical_path}")
+            except Exception as e:
+                logger.error(f"Error al transcodificar el audio: {str(e)}")
+                return jsonify({'error': f'Error al transcodificar el audio: {str(e)}'}), 400
+
         try:
-            speech_types_dict[speech_type] = {
-                'audio': filepath,
-                'ref_text': ref_text
-            }
-            logger.info(f"Diccionario actualizado: {speech_types_dict}")
-            
-            with open(SPEECH_TYPES_FILE, 'w', encoding='utf-8') as f:
-                json.dump(speech_types_dict, f, ensure_ascii=False, indent=4)
-            logger.info("Tipos de habla guardados en JSON")
-            
+            def add_speech_type(speech_types):
+                speech_types[speech_type] = {
+                    'audio': filepath,
+                    'sha256': digest,
+                    'canonical': canonical_path,
+                    'ref_text': ref_text,
+                    'status': 'pending'
+                }
+                prepared = shared_preparation(speech_types, speech_type)
+                if prepared is not None:
+                    speech_types[speech_type].update(prepared=prepared, status='ready')
+                return speech_types[speech_type]['status']
+
+            status = speech_type_registry.update(add_speech_type)
+            logger.info(f"Tipo de habla {speech_type} guardado en JSON")
+
         except Exception as e:
             logger.error(f"Error al actualizar tipos de habla: {str(e)}")
             return jsonify({'error': f'Error al actualizar tipos de habla: {str(e)}'}), 500
+
+        # Recorte, transcripción y mel se calculan en segundo plano (salvo que ya existan para este audio)
+        if status != 'ready':
+            enqueue_reference_preparation(speech_type)
         
         return jsonify({
             'success': True,
             'filepath': filepath,
             'speechType': speech_type,
+            'status': status,
             'message': f'Tipo de habla {speech_type} guardado correctamente'
         })
         
@@ -374,99 +667,652 @@ def upload_audio():
         logger.exception(f"Error general en upload_audio: {str(e)}")
         return jsonify({'error': f'Error al procesar la solicitud: {str(e)}'}), 500
 
-@app.route('/api/generate_multistyle_speech', methods=['POST'])
-def generate_multistyle_speech():
+def plan_multistyle_request(data):
+    """
+    Valida una petición multi-estilo.
+    Devuelve (parámetros, None) o (None, (mensaje de error, código HTTP)).
+    """
+    gen_text = data.get('gen_text', 'Este es un texto por defecto para generar audio.')
+    if not gen_text:
+        logger.error('gen_text es requerido')
+        return None, ('gen_text es requerido', 400)
+
+    # Los segmentos seguidos del mismo estilo se generan juntos, así el plan de fragmentos los abarca
+    segments = merge_adjacent_segments(parse_speechtypes_text(gen_text))
+    logger.info(f"Segmentos obtenidos: {segments}")
+
+    speech_types = speech_type_registry.snapshot()
+    if "Regular" not in speech_types:
+        return None, ('No existe tipo de habla Regular configurado.', 400)
+
+    # Verificar que para cada estilo exista un audio de referencia
+    ref_audios = {}
+    for segment in segments:
+        style = segment["style"]
+        if style not in speech_types:
+            logger.error(f'Tipo de habla no encontrado: {style}')
+            return None, (f'Tipo de habla no encontrado: {style}', 400)
+        if style in ref_audios:
+            continue
+        ref_audio = resolve_reference_audio(style)
+        if ref_audio is None:
+            ref_audio = speech_types[style]['audio']
+            logger.error(f'Archivo de audio no encontrado para {style}: {ref_audio}')
+            return None, (f'Archivo de audio no encontrado para {style}: {ref_audio}', 404)
+        ref_audios[style] = ref_audio
+
+    if not segments:
+        logger.error('No se generó audio')
+        return None, ('No se generó audio', 400)
+
+    priority = data.get('priority')
+    if priority is not None and priority not in LANES:
+        return None, (f'Prioridad no válida: {priority} (opciones: {", ".join(LANES)})', 400)
+
+    # Valores no numéricos son un error del cliente, no un 500 al llegar al planificador
     try:
-        data = request.json
-        gen_text = data.get('gen_text', 'Este es un texto por defecto para generar audio.')
-        remove_silence = data.get('remove_silence', False)
-        cross_fade_duration = data.get('cross_fade_duration', 0.15)
-        speed = data.get('speed_change', 1.0)
-        ref_text_overrides = data.get('ref_text_overrides', {})
-        just_audio = data.get('just_audio', False)
-
-        if not gen_text:
-            logger.error('gen_text es requerido')
-            return jsonify({'error': 'gen_text es requerido'}), 400
-
-        segments = parse_speechtypes_text(gen_text)
-        logger.info(f"Segmentos obtenidos: {segments}")
-
-        if "Regular" not in speech_types_dict:
-            return jsonify({'error': 'No existe tipo de habla Regular configurado.'}), 400
-
-        # Verificar que para cada estilo exista un audio de referencia
-        for segment in segments:
-            style = segment["style"]
-            if style not in speech_types_dict:
-                logger.error(f'Tipo de habla no encontrado: {style}')
-                return jsonify({'error': f'Tipo de habla no encontrado: {style}'}), 400
-            ref_audio = speech_types_dict[style]['audio']
-            if not os.path.exists(ref_audio):
-                logger.error(f'Archivo de audio no encontrado para {style}: {ref_audio}')
-                return jsonify({'error': f'Archivo de audio no encontrado para {style}: {ref_audio}'}), 404
-
-        generated_audio_segments = []
-        sample_rate = None
-
-        for segment in segments:
-            style = segment["style"]
-            text = segment["text"]
-
-            speech_type_data = speech_types_dict[style]
-            ref_audio = speech_type_data['audio']
-            ref_text_original = speech_type_data.get('ref_text', '')
-            # Para estilos que NO sean "Regular", forzamos la transcripción ignorando el texto almacenado.
-            if style != "Regular":
-                ref_text = ""
-            else:
-                ref_text = ref_text_original
+        seed = int(data.get('seed', 0))
+    except (TypeError, ValueError):
+        return None, (f'Semilla no válida: {data.get("seed")!r}', 400)
+    deadline = data.get('deadline')
+    if deadline is not None:
+        try:
+            deadline = float(deadline)
+        except (TypeError, ValueError):
+            deadline = float('nan')
+        if not 0 < deadline < float('inf'):
+            return None, (f'Plazo no válido: {data.get("deadline")!r} (segundos, mayor que 0)', 400)
+
+    return {
+        'segments': segments,
+        'ref_audios': ref_audios,
+        'ref_text_overrides': data.get('ref_text_overrides', {}),
+        'remove_silence': data.get('remove_silence', False),
+        'cross_fade_duration': data.get('cross_fade_duration', 0.15),
+        'speed': data.get('speed_change', 1.0),
+        'spectrogram': data.get('spectrogram', False),
+        'priority': priority,
+        'deadline': deadline,
+        'defer': data.get('defer', False),
+        'seed': seed,
+    }, None
+
+def reference_budget(style, params):
+    """
+    Texto, longitud en frames y estimador de duración de la referencia de un estilo, sin procesar el audio:
+    los de referencias preparadas, o una aproximación a partir del audio canónico.
+    """
+    speech_type_data = speech_type_registry.get(style)
+    override = params['ref_text_overrides'].get(style, '').strip()
+    if not override and is_reference_ready(speech_type_data):
+        prepared = speech_type_data['prepared']
+        ref_frames = np.load(prepared['mel'], mmap_mode='r').shape[0]
+        return prepared['ref_text'], ref_frames, DurationEstimator(**prepared['duration'])
+    ref_frames = min(len(np.load(params['ref_audios'][style], mmap_mode='r')) // hop_length, MAX_REF_FRAMES)
+    if override:
+        return override, ref_frames, None
+    return '', ref_frames, DurationEstimator(DEFAULT_FRAMES_PER_BYTE)
+
+def estimate_multistyle_cost(params):
+    """
+    Coste previsto en frame-steps (frames × NFE × 2 por CFG) a partir del plan de fragmentos de cada segmento.
+    """
+    cost = 0
+    for segment in params['segments']:
+        ref_text, ref_frames, estimator = reference_budget(segment['style'], params)
+        gen_text = traducir_numero_a_texto(segment['text'].lower())
+        plan = plan_chunks(ref_text, ref_frames, gen_text, speed=params['speed'], duration_estimator=estimator)
+        cost += plan.frame_steps()
+    return cost
+
+def resolve_voice_profile(style, ref_audio, ref_text_override=None):
+    """
+    Resuelve una única vez la referencia de un estilo para toda la petición: audio listo para inferencia,
+    transcripción y, si la referencia está preparada, su mel y su modelo de duración.
+    """
+    speech_type_data = speech_type_registry.get(style)
+    if not ref_text_override and is_reference_ready(speech_type_data):
+        # Artefactos calientes: no se recorta, transcribe ni calcula el mel en esta petición
+        prepared = speech_type_data['prepared']
+        return {
+            'style': style,
+            'audio': prepared['audio'],
+            'ref_text': prepared['ref_text'],
+            'mel': prepared['mel'],
+            'duration': prepared.get('duration')
+        }
+
+    # Procesar el audio de referencia y obtener el texto final (se transcribe si ref_text está vacío)
+    ref_text = ref_text_override or reference_text_for(style, speech_type_data)
+    processed_audio, processed_text = preprocess_ref_audio_text(
+        ref_audio_orig=ref_audio,
+        ref_text=ref_text,
+        show_info=lambda msg: logger.info(f"[{style}] {msg}")
+    )
+    return {'style': style, 'audio': processed_audio, 'ref_text': processed_text, 'mel': None, 'duration': None}
 
+def resolve_voice_profiles(params):
+    """
+    Un perfil por estilo distinto del texto, compartido por todos sus segmentos.
+    Los estilos se resuelven en paralelo: la decodificación y el recorte de cada referencia se solapan
+    (la transcripción sigue siendo de una en una, ver asr_lock).
+    """
+    futures = {}
+    for segment in params['segments']:
+        style = segment['style']
+        if style not in futures:
             # Si se envía un override en el request, se prioriza.
-            if style in ref_text_overrides and ref_text_overrides[style].strip():
-                ref_text = ref_text_overrides[style].strip()
-
-            # Procesar el audio de referencia y obtener el texto final (se transcribe si ref_text está vacío)
-            processed_audio, processed_text = preprocess_ref_audio_text(
-                ref_audio_orig=ref_audio,
-                ref_text=ref_text,
-                show_info=lambda msg: logger.info(f"[{style}] {msg}")
+            override = params['ref_text_overrides'].get(style, '').strip()
+            futures[style] = voice_profile_executor.submit(
+                resolve_voice_profile, style, params['ref_audios'][style], override or None
             )
+    return {style: future.result() for style, future in futures.items()}
+
+def generate_segment_into(segment, sink, voice, remove_silence, cross_fade_duration, speed,
+                          spectrogram=False, progress_callback=None, cancel_token=None, seed=0):
+    """
+    Genera un segmento de estilo con su perfil de voz y lo escribe en el sink abierto.
+    Devuelve el mel del segmento si se pidió el espectrograma, o None.
+    """
+    # Generar el segmento de audio directamente en el archivo de salida
+    _, mel = infer(
+        voice,
+        segment["text"],
+        model=F5TTS_ema_model,
+        remove_silence=remove_silence,
+        cross_fade_duration=cross_fade_duration,
+        speed=speed,
+        sink=sink,
+        spectrogram=spectrogram,
+        progress_callback=progress_callback,
+        cancel_token=cancel_token,
+        seed=seed
+    )
+
+    logger.info(f"Segmento generado para {segment['style']} escrito en el archivo de salida.")
+    return mel
 
-            # Generar el segmento de audio
-            audio_output, _ = infer(
-                ref_audio_orig=processed_audio,
-                ref_text=processed_text,
-                gen_text=text,
-                model=F5TTS_ema_model,
-                remove_silence=remove_silence,
-                cross_fade_duration=cross_fade_duration,
-                speed=speed
+def render_multistyle(params, output_path, progress=None, cancel_token=None, on_audio=None):
+    """
+    Genera todos los segmentos de un plan multi-estilo en output_path.
+    progress(fracción, mensaje, force) se llama en cada paso del ODE (force=False) y al terminar cada segmento.
+    Con cancel_token cancelado se aborta en el siguiente paso (InferenceCancelled) y se borra la salida parcial.
+    on_audio(índice, segmento, bloque) recibe cada bloque de audio en cuanto se escribe (para streaming).
+    Devuelve la respuesta para el cliente; 'files' lista todo lo escrito.
+    """
+    segments = params['segments']
+    mels = []
+    voices = resolve_voice_profiles(params)
+
+    def step_progress(i, segment):
+        if progress is None:
+            return None
+
+        def report(info):
+            done = (info['chunk'] + info['step'] / max(info['steps'], 1)) / info['chunks']
+            progress(
+                (i + done) / len(segments),
+                f"Segmento {i + 1}/{len(segments)} ({segment['style']}), fragmento {info['chunk'] + 1}/"
+                f"{info['chunks']}, paso {info['step']}/{info['steps']}, {info['elapsed']:.1f}s",
+                force=False
             )
+        return report
 
-            if sample_rate is None:
-                sample_rate = audio_output[0]
-            generated_audio_segments.append(audio_output[1])
-            logger.info(f"Segmento generado para {style} guardado.")
-
-        if generated_audio_segments:
-            final_audio_data = np.concatenate(generated_audio_segments)
-            generated_audio_filename = f"multi_style_{uuid.uuid4().hex}.wav"
-            generated_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], generated_audio_filename)
-            sf.write(generated_audio_path, final_audio_data, sample_rate)
-            logger.info(f"Audio final multi-estilo guardado en: {generated_audio_path}")
-            return jsonify({
-                'success': True,
-                'audio_path': generated_audio_path
-            })
-        else:
-            logger.error('No se generó audio')
-            return jsonify({'error': 'No se generó audio'}), 400
+    try:
+        # Cada fragmento se añade al archivo en cuanto se genera (memoria acotada); los segmentos de estilo
+        # se escriben uno tras otro, sin cross-fade, como antes
+        with open_audio_sink(output_path) as file_sink:
+            for i, segment in enumerate(segments):
+                sink = file_sink
+                if on_audio is not None:
+                    sink = TeeSink(file_sink, lambda wave, i=i, segment=segment: on_audio(i, segment, wave))
+                mel = generate_segment_into(segment, sink, voices[segment['style']],
+                                            params['remove_silence'], params['cross_fade_duration'],
+                                            params['speed'], spectrogram=params['spectrogram'],
+                                            progress_callback=step_progress(i, segment), cancel_token=cancel_token,
+                                            seed=params['seed'])
+                if mel is not None:
+                    mels.append(mel)
+                if progress is not None:
+                    progress((i + 1) / len(segments), f"Segmento {i + 1}/{len(segments)} ({segment['style']})",
+                             force=True)
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    logger.info(f"Audio final multi-estilo guardado en: {output_path}")
+    response = {
+        'success': True,
+        'audio_path': output_path,
+        'files': [output_path]
+    }
+    if mels:
+        # Solo se guarda el mel (float16); el PNG se dibuja la primera vez que se pide
+        mel_path, png_path = spectrogram_paths(output_path, folder=os.path.dirname(output_path))
+        save_mel(np.concatenate(mels, axis=1), mel_path)
+        response['spectrogram_path'] = os.path.basename(png_path)
+        response['files'] += [mel_path, png_path]
+    return response
+
+def multistyle_request_key(params):
+    """Clave de coalescencia: todo lo que determina el audio; prioridad y plazo solo afectan a la planificación."""
+    fields = ('segments', 'ref_text_overrides', 'remove_silence', 'cross_fade_duration', 'speed', 'spectrogram', 'seed')
+    return request_key(
+        'generate_multistyle_speech',
+        {field: params[field] for field in fields},
+        files=[params['ref_audios'][style] for style in sorted(params['ref_audios'])]
+    )
+
+def run_multistyle(params):
+    generated_audio_filename = f"multi_style_{uuid.uuid4().hex}.wav"
+    generated_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], generated_audio_filename)
+    return inference_scheduler.run(
+        render_multistyle, params, generated_audio_path,
+        cost=estimate_multistyle_cost(params),
+        lane=params['priority'] or 'interactive',
+        deadline=params['deadline'],
+        defer=params['defer']
+    )
+
+@app.route('/api/generate_multistyle_speech', methods=['POST'])
+def generate_multistyle_speech():
+    try:
+        params, error = plan_multistyle_request(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # Las peticiones idénticas en curso se unen a la primera y reciben el mismo archivo
+        response = single_flight.do(multistyle_request_key(params), run_multistyle, params)
+        return jsonify({key: value for key, value in response.items() if key != 'files'})
 
+    except AdmissionError as e:
+        logger.warning(f"Generación multi-estilo rechazada: {e}")
+        return jsonify({'error': str(e), 'predicted_wait': e.predicted_wait}), 503
     except Exception as e:
         logger.exception(f'Error en generación multi-estilo: {str(e)}')
         return jsonify({'error': f'Error en generación multi-estilo: {str(e)}'}), 500
 
+def wav_base64(wave, sample_rate):
+    buffer = io.BytesIO()
+    sf.write(buffer, wave, sample_rate, format='WAV', subtype='PCM_16')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/generate_multistyle_speech/stream', methods=['POST'])
+def stream_multistyle_speech():
+    """
+    Variante en streaming (Server-Sent Events) de /api/generate_multistyle_speech.
+
+    Eventos: 'audio' con cada bloque en cuanto se vocodifica (WAV en base64, con su segmento y estilo),
+    'progress' intercalados, y al final 'done' (la misma respuesta que el endpoint normal) o 'error'.
+    Si el cliente se desconecta, la generación se cancela en el siguiente paso del ODE.
+    """
+    try:
+        params, error = plan_multistyle_request(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        events = queue.Queue()
+        token = CancellationToken()
+        last_progress = [0.0]
+
+        def on_progress(fraction, message, force=True):
+            now = time.time()
+            if force or now - last_progress[0] >= 0.25:
+                last_progress[0] = now
+                events.put(('progress', {'progress': fraction, 'message': message}))
+
+        def on_audio(index, segment, wave):
+            events.put(('audio', {
+                'segment': index,
+                'style': segment['style'],
+                'sample_rate': target_sample_rate,
+                'samples': len(wave),
+                'audio': wav_base64(wave, target_sample_rate)
+            }))
+
+        generated_audio_filename = f"multi_style_{uuid.uuid4().hex}.wav"
+        generated_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], generated_audio_filename)
+        future = inference_scheduler.submit(
+            render_multistyle, params, generated_audio_path,
+            progress=on_progress, cancel_token=token, on_audio=on_audio,
+            cost=estimate_multistyle_cost(params),
+            lane=params['priority'] or 'interactive',
+            deadline=params['deadline'],
+            defer=params['defer']
+        )
+        future.add_done_callback(lambda f: events.put(('end', f)))
+    except AdmissionError as e:
+        logger.warning(f"Streaming multi-estilo rechazado: {e}")
+        return jsonify({'error': str(e), 'predicted_wait': e.predicted_wait}), 503
+    except Exception as e:
+        logger.exception(f'Error en streaming multi-estilo: {str(e)}')
+        return jsonify({'error': f'Error en streaming multi-estilo: {str(e)}'}), 500
+
+    def stream():
+        finished = False
+        try:
+            while True:
+                kind, payload = events.get()
+                if kind != 'end':
+                    yield sse_event(kind, payload)
+                    continue
+                finished = True
+                if payload.exception() is not None:
+                    logger.error(f"Error en streaming multi-estilo: {payload.exception()}")
+                    yield sse_event('error', {'error': f'Error en generación multi-estilo: {payload.exception()}'})
+                else:
+                    response = payload.result()
+                    response.pop('files')
+                    yield sse_event('done', response)
+                return
+        finally:
+            if not finished:
+                # El cliente cerró la conexión: no seguir ocupando el modelo
+                logger.info("Cliente desconectado, se cancela la generación en streaming")
+                token.cancel()
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def model_checkpoint_id():
+    """Los pesos con los que se genera: los de este proceso o, con la inferencia delegada, los del daemon."""
+    if inference_daemon is not None:
+        return inference_daemon.info()['checkpoint']
+    return F5TTS_ema_model.checkpoint_id
+
+def voice_signature(voice, params, checkpoint):
+    """
+    Huella de todo lo que determina el audio de una oración además de su texto: contenido de la referencia,
+    transcripción, parámetros de generación (el cross-fade cambia el audio de cada bloque) y checkpoint.
+    """
+    h = hashlib.sha256()
+    for path in (voice['audio'], voice['mel']):
+        if path:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    h.update(voice['ref_text'].encode('utf-8'))
+    h.update(json.dumps([
+        params['speed'], params['seed'], params['remove_silence'], params['cross_fade_duration'], checkpoint
+    ]).encode('utf-8'))
+    return h.hexdigest()
+
+def project_units(params, voices):
+    """Unidades (estilo, oración, firma) del guion, con el mismo texto normalizado que recibe el modelo."""
+    units = []
+    checkpoint = model_checkpoint_id()
+    for segment in params['segments']:
+        style = segment['style']
+        signature = voice_signature(voices[style], params, checkpoint)
+        for sentence in split_sentences(prepare_gen_text(segment['text']).strip()):
+            units.append((style, sentence, signature))
+    return units
+
+def generate_project_blocks(doc_id, units, voice, params):
+    """
+    Genera un tramo de unidades seguidas del mismo estilo y lo guarda en bloques alineados con las oraciones:
+    cada bloque reúne los fragmentos del plan que cubren exactamente unas oraciones completas.
+    """
+    texts = [unit[1] for unit in units]
+    pieces = []
+    synthesize(
+        voice,
+        join_sentences(texts),
+        F5TTS_ema_model,
+        cross_fade_duration=params['cross_fade_duration'],
+        speed=params['speed'],
+        trim_internal_silence=params['remove_silence'],
+        # Los fragmentos se recogen con on_chunk y se ensamblan aquí, por bloques
+        assemble=False,
+        return_spectrogram=False,
+        seed=params['seed'],
+        on_chunk=lambda i, text, wave, mel: pieces.append((text, wave))
+    )
+
+    def collapse(text):
+        return " ".join(text.split())
+
+    blocks, start, chunk_texts, waves = [], 0, [], []
+    for text, wave in pieces:
+        chunk_texts.append(text)
+        waves.append(wave)
+        covered = collapse(" ".join(chunk_texts))
+        for end in range(start + 1, len(units) + 1):
+            if collapse(join_sentences(texts[start:end])) == covered:
+                blocks.append({
+                    'style': units[start][0],
+                    'units': [list(unit) for unit in units[start:end]],
+                    'file': project_store.save_audio(
+                        doc_id, crossfade_concat(waves, target_sample_rate, params['cross_fade_duration'])
+                    )
+                })
+                start, chunk_texts, waves = end, [], []
+                break
+    if waves:
+        # Sin alineación exacta: lo que queda forma un único bloque
+        blocks.append({
+            'style': units[start][0],
+            'units': [list(unit) for unit in units[start:]],
+            'file': project_store.save_audio(
+                doc_id, crossfade_concat(waves, target_sample_rate, params['cross_fade_duration'])
+            )
+        })
+    return blocks
+
+def estimate_project_cost(doc_id, params, voices):
+    """
+    Coste previsto de un render de proyecto en frame-steps: solo cuentan los tramos que hay que regenerar,
+    los bloques reutilizados no pasan por el modelo.
+    """
+    units = project_units(params, voices)
+    cost = 0
+    for kind, payload in diff_units(project_store.load(doc_id), units):
+        if kind == 'reuse':
+            continue
+        style = units[payload[0]][0]
+        ref_text, ref_frames, estimator = reference_budget(style, params)
+        gen_text = join_sentences([units[k][1] for k in payload])
+        plan = plan_chunks(ref_text, ref_frames, gen_text, speed=params['speed'], duration_estimator=estimator)
+        cost += plan.frame_steps()
+    return cost
+
+def render_project(doc_id, params, output_path, voices=None):
+    """
+    Renderiza un guion reutilizando el render anterior del mismo documento: solo se generan las oraciones
+    nuevas o editadas (y las que cambiaron de estilo o de voz), y todo se vuelve a ensamblar con cross-fades.
+    voices son los perfiles ya resueltos con resolve_voice_profiles, si se tienen.
+    """
+    voices = voices or resolve_voice_profiles(params)
+    units = project_units(params, voices)
+    # Un render a la vez por documento, también entre workers: al confirmar se borran los bloques que el
+    # manifiesto nuevo no usa, y serían los que otro render acaba de escribir
+    with project_store.lock(doc_id):
+        old_blocks = project_store.load(doc_id)
+
+        blocks, reused, generated = [], 0, 0
+        for kind, payload in diff_units(old_blocks, units):
+            if kind == 'reuse':
+                blocks.append(old_blocks[payload])
+                reused += 1
+            else:
+                group = [units[k] for k in payload]
+                new_blocks = generate_project_blocks(doc_id, group, voices[group[0][0]], params)
+                blocks += new_blocks
+                generated += len(new_blocks)
+
+        try:
+            # Bloques del mismo estilo con cross-fade entre ellos; entre estilos, uno tras otro como en multi-estilo
+            with open_audio_sink(output_path) as sink:
+                writer, style = None, None
+                for block in blocks:
+                    if block['style'] != style:
+                        if writer is not None:
+                            writer.close()
+                        writer = CrossfadeWriter(sink, target_sample_rate, params['cross_fade_duration'])
+                        style = block['style']
+                    writer.write(project_store.load_audio(doc_id, block))
+                if writer is not None:
+                    writer.close()
+        except Exception:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+
+        project_store.commit(doc_id, blocks)
+    logger.info(f"Proyecto {doc_id}: {reused} bloques reutilizados, {generated} generados")
+    return {
+        'success': True,
+        'audio_path': output_path,
+        'reused_blocks': reused,
+        'generated_blocks': generated
+    }
+
+@app.route('/api/projects/<doc_id>/render', methods=['POST'])
+def render_project_route(doc_id):
+    """
+    Modo proyecto de /api/generate_multistyle_speech: mismo cuerpo, pero el servidor guarda el render por
+    documento y en la siguiente petición solo regenera lo que cambió en el guion.
+    """
+    try:
+        doc_id = secure_filename(doc_id)
+        if not doc_id:
+            return jsonify({'error': 'Identificador de documento no válido.'}), 400
+        params, error = plan_multistyle_request(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        generated_audio_filename = f"project_{doc_id}_{uuid.uuid4().hex}.wav"
+        generated_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], generated_audio_filename)
+        voices = resolve_voice_profiles(params)
+        response = inference_scheduler.run(
+            render_project, doc_id, params, generated_audio_path, voices,
+            cost=estimate_project_cost(doc_id, params, voices),
+            lane=params['priority'] or 'interactive',
+            deadline=params['deadline'],
+            defer=params['defer']
+        )
+        return jsonify(response)
+
+    except AdmissionError as e:
+        logger.warning(f"Render de proyecto rechazado: {e}")
+        return jsonify({'error': str(e), 'predicted_wait': e.predicted_wait}), 503
+    except Exception as e:
+        logger.exception(f'Error en el render del proyecto {doc_id}: {str(e)}')
+        return jsonify({'error': f'Error en el render del proyecto: {str(e)}'}), 500
+
+@app.route('/api/projects/<doc_id>', methods=['DELETE'])
+def delete_project(doc_id):
+    doc_id = secure_filename(doc_id)
+    with project_store.lock(doc_id):
+        deleted = project_store.delete(doc_id)
+    if not deleted:
+        return jsonify({'error': 'Proyecto no encontrado.'}), 404
+    return jsonify({'success': True})
+
+def run_multistyle_job(ctx, params):
+    output_path = os.path.join(ctx.output_folder, f"{ctx.job_id}.wav")
+    return render_multistyle(params, output_path, progress=ctx.report, cancel_token=ctx.token)
+
+@app.route('/api/jobs/generate_multistyle_speech', methods=['POST'])
+def submit_multistyle_job():
+    """
+    Versión asíncrona de /api/generate_multistyle_speech: devuelve un job_id al instante;
+    el estado se consulta en /api/jobs/<job_id> y el audio en /api/jobs/<job_id>/result.
+    """
+    try:
+        params, error = plan_multistyle_request(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        lane = params['priority'] or 'batch'
+        cost = estimate_multistyle_cost(params)
+        predicted_wait = inference_scheduler.predicted_wait(cost, lane)
+        job_id = job_manager.submit(
+            'multistyle', run_multistyle_job, params, cost=cost, lane=lane, deadline=params['deadline']
+        )
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'lane': lane,
+            'predicted_wait': predicted_wait
+        }), 202
+    except AdmissionError as e:
+        logger.warning(f"Trabajo rechazado: {e}")
+        return jsonify({'error': str(e), 'predicted_wait': e.predicted_wait}), 503
+    except QueueFullError as e:
+        logger.warning(f"Trabajo rechazado: {e}")
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.exception(f'Error al encolar la generación multi-estilo: {str(e)}')
+        return jsonify({'error': f'Error al encolar la generación multi-estilo: {str(e)}'}), 500
+
+@app.route('/api/scheduler/status', methods=['GET'])
+def get_scheduler_status():
+    """Profundidad de cada carril, espera prevista para un trabajo nuevo y peticiones coalescidas."""
+    return jsonify({**inference_scheduler.stats(), 'single_flight': single_flight.stats()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado.'}), 404
+    result = dict(job['result'] or {})
+    result.pop('files', None)
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'error': job['error'],
+        'result': result or None,
+        'created': job['created'],
+        'updated': job['updated'],
+        'expires': job['expires']
+    })
+
+def finished_job_or_error(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return None, (jsonify({'error': 'Trabajo no encontrado.'}), 404)
+    if job['status'] == 'error':
+        return None, (jsonify({'error': job['error']}), 500)
+    if job['status'] == 'cancelled':
+        return None, (jsonify({'error': 'El trabajo fue cancelado.', 'status': job['status']}), 410)
+    if job['status'] != 'done':
+        return None, (jsonify({'error': 'El trabajo aún no ha terminado.', 'status': job['status']}), 409)
+    return job, None
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Detiene un trabajo en cola o en curso; la inferencia se corta en el siguiente paso del ODE."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado.'}), 404
+    return jsonify({'success': True, 'job_id': job['id'], 'status': job['status'],
+                    'cancel_requested': bool(job['cancel_requested'])})
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job, error = finished_job_or_error(job_id)
+    if error:
+        return error
+    audio_path = job['result']['audio_path']
+    if not os.path.exists(audio_path):
+        return jsonify({'error': 'Archivo de audio no encontrado.'}), 404
+    return send_file(audio_path, mimetype='audio/wav')
+
+@app.route('/api/jobs/<job_id>/spectrogram', methods=['GET'])
+def get_job_spectrogram(job_id):
+    job, error = finished_job_or_error(job_id)
+    if error:
+        return error
+    return send_spectrogram(*spectrogram_paths(job['result']['audio_path'], folder=JOB_OUTPUT_FOLDER))
+
 @app.route('/api/generate_timestamps_from_audio', methods=['POST'])
 def generate_timestamps_from_audio():
     try:
@@ -492,6 +1338,20 @@ def generate_timestamps_from_audio():
         logger.exception(f'Error al generar marcas de tiempo desde audio: {str(e)}')
         return jsonify({'error': f'Error al generar marcas de tiempo: {str(e)}'}), 500
 
+def modify_prosody_into_new_file(audio_path, modifications):
+    # Generar una ruta única para el audio modificado
+    modified_audio_filename = f"modified_{uuid.uuid4().hex}.wav"
+    modified_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], modified_audio_filename)
+
+    # Llamar a la función de modificación de prosodia con las claves originales. El cross-fade se acorta solo
+    # cuando un segmento es más corto que él, así que un ValueError aquí es una modificación no válida
+    modify_prosody(
+        audio_path=audio_path,
+        modifications=modifications,
+        output_path=modified_audio_path
+    )
+    return modified_audio_path
+
 @app.route('/api/modify_prosody', methods=['POST'])
 def modify_prosody_route():
     data = request.json
@@ -505,34 +1365,12 @@ def modify_prosody_route():
         return jsonify({'error': 'audio_path no válido'}), 400
 
     try:
-        # Generar una ruta única para el audio modificado
-        modified_audio_filename = f"modified_{uuid.uuid4().hex}.wav"
-        modified_audio_path = os.path.join(app.config['GENERATED_AUDIO_FOLDER'], modified_audio_filename)
-
-        # Llamar a la función de modificación de prosodia con las claves originales
-        modify_prosody(
-            audio_path=audio_path,
-            modifications=modifications,
-            output_path=modified_audio_path
+        modified_audio_path = single_flight.do(
+            request_key('modify_prosody', {'modifications': modifications}, files=[audio_path]),
+            modify_prosody_into_new_file, audio_path, modifications
         )
-
         return jsonify({'success': True, 'output_audio_path': modified_audio_path}), 200
 
-    except ValueError as ve:
-        # Capturar error de crossfade y reintentar sin crossfade
-        logger.warning(f"Crossfade issue encountered: {ve}, trying without crossfade restrictions.")
-        try:
-            modify_prosody(
-                audio_path=audio_path,
-                modifications=modifications,
-                output_path=modified_audio_path,
-                cross_fade_duration=0  # Desactivar crossfade
-            )
-            return jsonify({'success': True, 'output_audio_path': modified_audio_path}), 200
-        except Exception as e2:
-            logger.exception(f'Error al modificar la prosodia sin crossfade: {e2}')
-            return jsonify({'success': False, 'message': f'Error al modificar la prosodia: {e2}'}), 500
-
     except Exception as e:
         logger.exception(f'Error al modificar la prosodia: {e}')
         return jsonify({'success': False, 'message': f'Error al modificar la prosodia: {e}'}), 500
@@ -558,6 +1396,9 @@ def delete_audio():
 
     try:
         os.remove(full_path)
+        for sidecar in spectrogram_paths(secure_path):
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
         logger.info(f"Audio eliminado: {full_path}")
         return jsonify({'success': True, 'message': 'Audio eliminado correctamente.'}), 200
     except Exception as e:
@@ -578,16 +1419,32 @@ def get_audio(filename):
         logger.exception(f"Error al servir archivo de audio {filename}: {str(e)}")
         return jsonify({'error': str(e)}), 404
 
+def spectrogram_paths(filename, folder=None):
+    """
+    Rutas del mel guardado y del PNG cacheado que acompañan a un audio generado (acepta el .wav o el .png).
+    """
+    stem = os.path.splitext(secure_filename(os.path.basename(filename)))[0]
+    folder = folder or app.config['GENERATED_AUDIO_FOLDER']
+    return os.path.join(folder, f"{stem}.mel.npy"), os.path.join(folder, f"{stem}.png")
+
+def send_spectrogram(mel_path, full_path):
+    if not os.path.exists(full_path) and os.path.exists(mel_path):
+        # Se dibuja solo la primera vez que se pide; las siguientes se sirve el PNG cacheado
+        with spectrogram_render_lock:
+            if not os.path.exists(full_path):
+                tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp.png"
+                save_spectrogram(np.load(mel_path).astype(np.float32), tmp_path)
+                os.replace(tmp_path, full_path)
+                logger.info(f"Espectrograma generado bajo demanda: {full_path}")
+    if not os.path.exists(full_path):
+        logger.error(f"Espectrograma no encontrado: {full_path}")
+        return jsonify({'error': 'Espectrograma no encontrado.'}), 404
+    return send_file(full_path, mimetype='image/png')
+
 @app.route('/api/get_spectrogram/<path:filename>')
 def get_spectrogram(filename):
     try:
-        # Verificar que el archivo existe
-        secure_path = secure_filename(os.path.basename(filename))
-        full_path = os.path.join(tempfile.gettempdir(), secure_path)
-        if not os.path.exists(full_path):
-            logger.error(f"Espectrograma no encontrado: {full_path}")
-            return jsonify({'error': 'Espectrograma no encontrado.'}), 404
-        return send_file(full_path, mimetype='image/png')
+        return send_spectrogram(*spectrogram_paths(filename))
     except Exception as e:
         logger.exception(f"Error al servir espectrograma {filename}: {str(e)}")
         return jsonify({'error': str(e)}), 404
@@ -595,13 +1452,18 @@ def get_spectrogram(filename):
 @app.route('/api/get_speech_types', methods=['GET'])
 def get_speech_types():
     try:
-        speech_types = list(speech_types_dict.keys())
+        speech_types = list(speech_type_registry.snapshot())
         logger.info(f"Tipos de habla solicitados: {speech_types}")
         return jsonify(speech_types)
     except Exception as e:
         logger.exception(f"Error al obtener tipos de habla: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
+@app.route('/api/get_speech_types_status', methods=['GET'])
+def get_speech_types_status():
+    statuses = {style: data.get('status', 'pending') for style, data in speech_type_registry.snapshot().items()}
+    return jsonify(statuses)
+
 @app.route('/api/generate_text', methods=['POST'])
 def generate_text_endpoint():
     if not text_generator_pipe: 
@@ -657,8 +1519,11 @@ def cleanup_temp_files():
             except Exception as e:
                 logger.error(f"Error al limpiar el archivo {f}: {e}")
 
-        # Limpiar audios generados que no se han modificado en la última hora
-        generated_audio_files = glob.glob(os.path.join(GENERATED_AUDIO_FOLDER, '*.wav'))
+        # Limpiar audios generados (y sus mel/PNG de espectrograma) que no se han modificado en la última hora
+        generated_audio_files = [
+            f for pattern in ('*.wav', '*.mel.npy', '*.png')
+            for f in glob.glob(os.path.join(GENERATED_AUDIO_FOLDER, pattern))
+        ]
         for f in generated_audio_files:
             try:
                 if os.path.isfile(f) and os.path.getmtime(f) < time.time() - 3600:
@@ -669,7 +1534,11 @@ def cleanup_temp_files():
     except Exception as e:
         logger.error(f"Error en cleanup_temp_files: {e}")
 
-if __name__ == '__main__':
+def start_background_tasks():
+    """
+    Preparación de las referencias pendientes y limpieza periódica. Debe correr en un único proceso por
+    servidor (ver serve.py) y después del fork: arranca hilos.
+    """
     try:
         load_speech_types()
     except Exception as e:
@@ -677,8 +1546,18 @@ if __name__ == '__main__':
 
     scheduler = BackgroundScheduler()
     scheduler.add_job(func=cleanup_temp_files, trigger="interval", hours=1)
+    # Los resultados de trabajos tienen su propio TTL (también se purgan al encolar uno nuevo)
+    scheduler.add_job(func=job_manager.cleanup, trigger="interval", minutes=5)
     scheduler.start()
     logger.info("Scheduler de limpieza iniciado.")
 
     atexit.register(lambda: scheduler.shutdown())
+    return scheduler
+
+if __name__ == '__main__':
+    # Servidor de desarrollo; en producción: python -m f5_tts.infer.serve
+    if INFERENCE_POOL_WORKERS:
+        # Los procesos del pool (spawn) volverían a importar este script como __main__ y cargarían todos sus modelos
+        raise SystemExit("El pool de inferencia requiere python -m f5_tts.infer.serve --pool-workers N")
+    start_background_tasks()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,285 @@
+# Asynchronous generation jobs: bounded queue, progress and results persisted in SQLite
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from f5_tts.infer.utils_infer import CancellationToken, InferenceCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """The job queue is full; the client should retry later."""
+
+
+class JobStore:
+    """
+    Job state in a shared SQLite file, so any gunicorn worker can answer the polling of a job started by
+    another one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    worker INTEGER,
+                    worker_started TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    expires REAL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "cancel_requested" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+            if "worker_started" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker_started TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, kind):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, worker, worker_started, created, updated)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, os.getpid(), process_identity(os.getpid()), now, now),
+            )
+        return job_id
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def delete(self, job_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def pop_expired(self, now=None):
+        """Deletes and returns the finished jobs whose TTL has run out."""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,)).fetchall()
+            conn.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,))
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+        return jobs
+
+    def fail_orphaned(self, message, ttl):
+        """
+        Marks as failed the unfinished jobs whose process no longer exists (e.g. after a server restart);
+        jobs of other live workers are left alone. A process is matched by pid and start time, since after a
+        container restart the new workers usually get the same pids as the old ones.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, worker, worker_started FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        for row in rows:
+            if not _process_alive(row["worker"], row["worker_started"]):
+                self.update(row["id"], status="error", error=message, expires=time.time() + ttl)
+                logger.info(f"Orphaned job marked as failed: {row['id']}")
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def process_identity(pid):
+    """
+    Identity of a running process that survives pid reuse: boot id plus its start time (clock ticks since boot,
+    field 22 of /proc/<pid>/stat). None if the process does not exist or there is no /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command name (field 2) may contain spaces and parentheses: count fields after its closing one
+    start_time = stat[stat.rindex(")") + 2 :].split()[19]
+    return f"{_boot_id()}:{start_time}"
+
+
+def _process_alive(pid, identity=None):
+    if identity is not None and os.path.isdir("/proc/self"):
+        return process_identity(pid) == identity
+    # rows written without /proc (or before worker_started existed): only the pid can be checked
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobContext:
+    """
+    Handed to the job function so it can report its progress.
+    token goes to the inference: it is cancelled when anyone asks to cancel the job, from any worker.
+    """
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.token = CancellationToken()
+        self.last_sync = 0.0
+
+    @property
+    def output_folder(self):
+        return self.manager.output_folder
+
+    def report(self, progress, message=None, force=True):
+        """
+        Stores the progress and checks whether a cancellation was requested. With force=False (per ODE step
+        progress) it is written at most once every report_interval seconds.
+        """
+        now = time.time()
+        if not force and now - self.last_sync < self.manager.report_interval:
+            return
+        self.last_sync = now
+        self.manager.store.update(self.job_id, progress=float(progress), message=message)
+        if self.manager.store.get(self.job_id)["cancel_requested"]:
+            self.token.cancel()
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded pool (or on an InferenceScheduler, which decides order and admission) and keeps
+    their state in a JobStore.
+
+    Finished jobs (and the files listed in result["files"]) are deleted when their TTL runs out.
+    """
+
+    def __init__(
+        self, store, output_folder, max_workers=1, max_pending=16, ttl=3600, scheduler=None, report_interval=0.5
+    ):
+        self.store = store
+        self.scheduler = scheduler
+        self.report_interval = report_interval
+        self.contexts = {}  # jobs running in this process
+        self.output_folder = output_folder
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-job")
+        self.pending = 0
+        self.lock = threading.Lock()
+        os.makedirs(output_folder, exist_ok=True)
+        store.fail_orphaned("Job interrupted: the process running it exited", ttl)
+
+    def submit(self, kind, fn, *args, cost=0.0, lane="batch", deadline=None, **kwargs):
+        """
+        Queues fn(ctx, *args, **kwargs) and returns the job id right away.
+        fn returns a JSON dict with the result; the paths in result["files"] are deleted with the job.
+        With a scheduler, cost/lane/deadline are passed through and it may reject the job (AdmissionError).
+        """
+        self.cleanup()
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise QueueFullError(f"{self.pending} jobs queued (at most {self.max_pending})")
+            self.pending += 1
+        job_id = self.store.create(kind)
+        try:
+            if self.scheduler is not None:
+                self.scheduler.submit(self._run, job_id, fn, args, kwargs, cost=cost, lane=lane, deadline=deadline)
+            else:
+                self.executor.submit(self._run, job_id, fn, args, kwargs)
+        except Exception:
+            self.store.delete(job_id)
+            with self.lock:
+                self.pending -= 1
+            raise
+        logger.info(f"Queued {kind} job: {job_id}")
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        ctx = JobContext(self, job_id)
+        self.contexts[job_id] = ctx
+        try:
+            if self.store.get(job_id)["cancel_requested"]:
+                raise InferenceCancelled("Job cancelled before it started")
+            self.store.update(job_id, status="running")
+            result = fn(ctx, *args, **kwargs)
+            self.store.update(job_id, status="done", progress=1.0, result=result, expires=time.time() + self.ttl)
+            logger.info(f"Job finished: {job_id}")
+        except InferenceCancelled:
+            logger.info(f"Job cancelled: {job_id}")
+            self.store.update(job_id, status="cancelled", expires=time.time() + self.ttl)
+            raise  # so the scheduler does not learn its throughput from a job that stopped early
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status="error", error=str(e), expires=time.time() + self.ttl)
+            raise
+        finally:
+            self.contexts.pop(job_id, None)
+            with self.lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Requests the cancellation of a queued or running job. In this process it stops at the next ODE step;
+        in another worker, as soon as that worker syncs its progress. Returns the job, or None if it does not exist.
+        """
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return job
+        self.store.update(job_id, cancel_requested=1)
+        ctx = self.contexts.get(job_id)
+        if ctx is not None:
+            ctx.token.cancel()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return self.store.get(job_id)
+
+    def cleanup(self):
+        """Removes expired jobs and their output files."""
+        for job in self.store.pop_expired():
+            for path in (job["result"] or {}).get("files", []):
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    logger.error(f"Could not delete {path} of job {job['id']}: {e}")
+            logger.info(f"Expired job removed: {job['id']}")
@@ -0,0 +1,139 @@
+# Incremental script rendering: the audio of the passages that did not change is reused
+import difflib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, enough for single-process development
+    fcntl = None
+
+
+def diff_units(old_blocks, new_units):
+    """
+    Compares the previous render with the new script at sentence and style level.
+
+    Args:
+        old_blocks (list[dict]): Blocks of the previous render, each with 'units' (list of [style, sentence,
+            signature]) and the audio that covers them.
+        new_units (list[tuple]): (style, sentence, signature) units of the new script, in order.
+
+    Returns:
+        list[tuple]: In the order of the new script, ('reuse', old block index) for the blocks whose units are
+        all still present and contiguous, or ('generate', [new unit indices]) for the gaps, split by style.
+    """
+    old_units, owner = [], []
+    for b, block in enumerate(old_blocks):
+        for unit in block["units"]:
+            old_units.append(tuple(unit))
+            owner.append(b)
+
+    matcher = difflib.SequenceMatcher(a=old_units, b=[tuple(u) for u in new_units], autojunk=False)
+    old_to_new = {}
+    for tag, i1, i2, j1, _ in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                old_to_new[i1 + k] = j1 + k
+
+    reused_at = {}
+    start = 0
+    for b, block in enumerate(old_blocks):
+        positions = [old_to_new.get(k) for k in range(start, start + len(block["units"]))]
+        start += len(block["units"])
+        if positions and None not in positions and positions == list(range(positions[0], positions[-1] + 1)):
+            reused_at[positions[0]] = b
+
+    items, pending = [], []
+
+    def flush():
+        if pending:
+            items.append(("generate", list(pending)))
+            pending.clear()
+
+    j = 0
+    while j < len(new_units):
+        if j in reused_at:
+            flush()
+            b = reused_at[j]
+            items.append(("reuse", b))
+            j += len(old_blocks[b]["units"])
+            continue
+        if pending and new_units[pending[-1]][0] != new_units[j][0]:
+            flush()
+        pending.append(j)
+        j += 1
+    flush()
+    return items
+
+
+class ProjectStore:
+    """
+    Keeps the last render of each document: a manifest.json with the blocks (the units they cover and their
+    audio file) and one .npy per block.
+
+    Renders of the same document must run under lock(doc_id), from reading the previous manifest to commit:
+    commit deletes every file the new manifest does not use, including blocks another render just wrote.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _dir(self, doc_id):
+        return os.path.join(self.folder, doc_id)
+
+    @contextmanager
+    def lock(self, doc_id):
+        """Exclusive lock (fcntl) on one document, shared by every process using the same folder."""
+        with open(os.path.join(self.folder, f"{doc_id}.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self, doc_id):
+        path = os.path.join(self._dir(doc_id), "manifest.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["blocks"]
+
+    def load_audio(self, doc_id, block):
+        return np.load(os.path.join(self._dir(doc_id), block["file"]))
+
+    def save_audio(self, doc_id, wave):
+        os.makedirs(self._dir(doc_id), exist_ok=True)
+        name = f"{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self._dir(doc_id), name), np.asarray(wave, dtype=np.float32))
+        return name
+
+    def commit(self, doc_id, blocks):
+        """Replaces the manifest atomically and deletes the audio of the blocks no longer used."""
+        folder = self._dir(doc_id)
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = os.path.join(folder, f"manifest.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"blocks": blocks}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(folder, "manifest.json"))
+        keep = {block["file"] for block in blocks} | {"manifest.json"}
+        for name in os.listdir(folder):
+            if name not in keep and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except FileNotFoundError:
+                    pass
+
+    def delete(self, doc_id):
+        folder = self._dir(doc_id)
+        if not os.path.isdir(folder):
+            return False
+        shutil.rmtree(folder)
+        return True
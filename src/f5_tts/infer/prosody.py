@@ -1,8 +1,10 @@
 import os
 import tempfile
 import logging
+import numpy as np
 from pydub import AudioSegment, effects
 import subprocess
+from f5_tts.infer.audio_assembly import crossfade_concat
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -58,6 +60,24 @@ def change_speed_ffmpeg(segment, speed=1.0):
         os.unlink(temp_out.name)
         return changed
 
+def join_segments(segments, cross_fade_duration=0.15):
+    """
+    Une segmentos de PyDub con cross-fade lineal en una sola pasada sobre un búfer preasignado,
+    en lugar de copiar todo el audio acumulado con cada append.
+    El resultado conserva el ancho de muestra más alto de la entrada (un audio de 32 bits no se reduce a 16).
+    """
+    frame_rate, channels = segments[0].frame_rate, segments[0].channels
+    sample_width = max(segment.sample_width for segment in segments)
+    scale = float(1 << (8 * sample_width - 1))
+    waves = []
+    for segment in segments:
+        segment = segment.set_frame_rate(frame_rate).set_channels(channels).set_sample_width(sample_width)
+        samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+        waves.append(samples.reshape(-1, channels) / scale)
+    wave = crossfade_concat(waves, frame_rate, cross_fade_duration)
+    pcm = np.clip(wave.astype(np.float64) * scale, -scale, scale - 1).astype(f"<i{sample_width}")
+    return AudioSegment(pcm.tobytes(), frame_rate=frame_rate, sample_width=sample_width, channels=channels)
+
 def modify_prosody(
     audio_path,
     modifications,
@@ -180,15 +200,12 @@ def modify_prosody(
         segments.append(unmodified_segment)
         logger.debug(f"Agregado segmento sin modificar al final: {last_end_ms}ms - {len(audio)}ms")
 
-    # Concatenar todos los segmentos con cross-fade si es necesario
-    if cross_fade_duration > 0 and len(segments) > 1:
-        cross_fade_ms = int(cross_fade_duration * 1000)
-        final_audio = segments[0]
-        for seg in segments[1:]:
-            final_audio = final_audio.append(seg, crossfade=cross_fade_ms)
-            logger.debug(f"Aplicado cross-fade de {cross_fade_ms}ms entre segmentos")
+    # Concatenar todos los segmentos (con cross-fade si es necesario) en una sola pasada
+    if segments:
+        final_audio = join_segments(segments, cross_fade_duration)
+        logger.debug(f"Unidos {len(segments)} segmentos con cross-fade de {cross_fade_duration}s")
     else:
-        final_audio = sum(segments)
+        final_audio = audio
 
     # Aplicar cambio de velocidad global si es necesario
     if global_speed_change != 1.0:
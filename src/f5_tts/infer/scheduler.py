@@ -0,0 +1,157 @@
+# Inference scheduler: priority lanes, shortest job first and deadline-based admission
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+LANES = ("interactive", "batch")  # in priority order
+
+
+class AdmissionError(Exception):
+    """The task would not finish within its deadline with the current queue."""
+
+    def __init__(self, message, predicted_wait):
+        super().__init__(message)
+        self.predicted_wait = predicted_wait
+
+
+class InferenceScheduler:
+    """
+    Runs the work on the TTS model on `concurrency` threads (one for a model in this process; as many as pool
+    workers when the model runs in an InferencePool) and orders the pending work.
+
+    The cost of a task is measured in frame-steps (prompt + generated frames x NFE x 2 for CFG, see
+    ChunkPlan.frame_steps). The interactive lane always goes before the batch lane and, within a lane, the
+    cheapest task goes first. Throughput (frame-steps per second) is learned as a moving average of the
+    tasks that completed successfully and is used to predict waits and decide admission.
+    """
+
+    def __init__(self, deadlines=None, throughput=50000.0, smoothing=0.2, concurrency=1):
+        self.deadlines = {"interactive": 60.0, "batch": 3600.0}
+        self.deadlines.update(deadlines or {})
+        self.throughput = throughput
+        self.smoothing = smoothing
+        self.queues = {lane: [] for lane in LANES}
+        self.counter = itertools.count()
+        self.concurrency = concurrency
+        self.running = {}  # task number -> (cost, start time)
+        self.cond = threading.Condition()
+        self.thread_pid = None
+
+    def submit(self, fn, *args, cost, lane="interactive", deadline=None, defer=False, **kwargs):
+        """
+        Queues fn(*args, **kwargs) and returns a Future.
+
+        A task that would not finish before its deadline (deadline, or the lane's) is rejected with
+        AdmissionError; with defer=True an interactive task is moved to the batch lane instead.
+        """
+        with self.cond:
+            self._ensure_thread_locked()
+            wait = self._predicted_wait_locked(cost, lane)
+            limit = deadline if deadline is not None else self.deadlines[lane]
+            if wait + cost / self.throughput > limit and defer and lane != "batch":
+                logger.info(f"Task of cost {cost:.3g} deferred to the batch lane (predicted wait {wait:.1f}s)")
+                lane, limit = "batch", self.deadlines["batch"]
+                wait = self._predicted_wait_locked(cost, lane)
+            if wait + cost / self.throughput > limit:
+                raise AdmissionError(
+                    f"The queue does not allow finishing within {limit:.0f}s (predicted wait {wait:.1f}s)", wait
+                )
+            future = Future()
+            heapq.heappush(self.queues[lane], (cost, next(self.counter), future, fn, args, kwargs))
+            self.cond.notify()
+        return future
+
+    def run(self, fn, *args, cost, lane="interactive", deadline=None, defer=False, **kwargs):
+        """Like submit, but waits for the result."""
+        return self.submit(fn, *args, cost=cost, lane=lane, deadline=deadline, defer=defer, **kwargs).result()
+
+    def predicted_wait(self, cost=float("inf"), lane="batch"):
+        """Seconds until a task of that cost would start in that lane."""
+        with self.cond:
+            return self._predicted_wait_locked(cost, lane)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "throughput": self.throughput,
+                "running": len(self.running),
+                "concurrency": self.concurrency,
+                "lanes": {
+                    lane: {
+                        "depth": len(self.queues[lane]),
+                        "queued_cost": sum(task[0] for task in self.queues[lane]),
+                        "predicted_wait": self._predicted_wait_locked(float("inf"), lane),
+                        "deadline": self.deadlines[lane],
+                    }
+                    for lane in LANES
+                },
+            }
+
+    def _predicted_wait_locked(self, cost, lane):
+        # when each slot frees up: what is left of the running tasks, then the queued tasks that go first, each
+        # given to the earliest free slot (with a single slot this is the sum of the work ahead)
+        now = time.time()
+        slots = [max(c / self.throughput - (now - started), 0.0) for c, started in self.running.values()]
+        slots += [0.0] * (self.concurrency - len(slots))
+        heapq.heapify(slots)
+        for other in LANES:
+            ahead = sorted(self.queues[other])
+            if other == lane:
+                ahead = [task for task in ahead if task[0] <= cost]
+            for task in ahead:
+                heapq.heappush(slots, heapq.heappop(slots) + task[0] / self.throughput)
+            if other == lane:
+                break
+        return slots[0]
+
+    def _ensure_thread_locked(self):
+        # The threads start with the first task of each process: the scheduler may be created before a fork
+        # (gunicorn with preload_app) and every worker then gets its own threads
+        if self.thread_pid != os.getpid():
+            self.thread_pid = os.getpid()
+            self.running = {}
+            for i in range(self.concurrency):
+                threading.Thread(target=self._loop, name=f"tts-scheduler-{i}", daemon=True).start()
+
+    def _next_task_locked(self):
+        for lane in LANES:
+            if self.queues[lane]:
+                return heapq.heappop(self.queues[lane])
+        return None
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                task = self._next_task_locked()
+                while task is None:
+                    self.cond.wait()
+                    task = self._next_task_locked()
+                cost, number, future, fn, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                started = time.time()
+                self.running[number] = (cost, started)
+
+            succeeded = False
+            try:
+                future.set_result(fn(*args, **kwargs))
+                succeeded = True
+            except BaseException as e:
+                future.set_exception(e)
+
+            elapsed = time.time() - started
+            with self.cond:
+                del self.running[number]
+                # a cancelled or failed task stops early: its cost/elapsed would overstate the throughput
+                if succeeded and cost > 0 and elapsed > 0.1:
+                    self.throughput += self.smoothing * (cost / elapsed - self.throughput)
+            if succeeded:
+                logger.info(f"Task of cost {cost:.3g} finished in {elapsed:.1f}s ({cost / max(elapsed, 1e-6):.3g}/s)")
+            else:
+                logger.info(f"Task of cost {cost:.3g} failed after {elapsed:.1f}s")
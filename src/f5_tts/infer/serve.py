@@ -0,0 +1,138 @@
+# Production server: gunicorn with the models loaded once, before the fork
+#
+#   python -m f5_tts.infer.serve --workers 2 --bind 0.0.0.0:5000
+#
+# On CPU the master imports infer_gradio (F5 with its checkpoint memory-mapped, Vocos, Whisper and Qwen) and then
+# forks the workers, which share those pages copy-on-write: every extra worker only adds its own state. With
+# CUDA a process that already used the GPU cannot be forked, so every worker loads its own copy and a single
+# worker is the default.
+#
+#   python -m f5_tts.infer.serve --pool-workers 4 --pool-threads 4
+#
+# With --pool-workers the DiT and Vocos run in an InferencePool (see worker_pool.py) instead: a single gunicorn
+# worker serves the app and its scheduler runs as many requests at once as the pool has processes, each pinned
+# to its own cores; the chunks of a long request spread over whichever processes are idle.
+import argparse
+import fcntl
+import gc
+import logging
+import os
+
+# Before importing torch: the master must not create an OpenMP pool that the workers would inherit half-way
+# (every worker sets its own thread count in post_fork)
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+# Check for a GPU without initializing CUDA in the master, which forks afterwards
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+
+import torch
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_LOCK_FILE = "serve.background.lock"
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def claim_background_role(path=BACKGROUND_LOCK_FILE):
+    """
+    Non-blocking lock that only one worker gets: that worker prepares references and cleans up files.
+    Returns the open file (keep it: the lock lasts as long as the process) or None.
+    """
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class TTSServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from f5_tts.infer.infer_gradio import app
+
+        return app
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Objects loaded in the master are kept out of the workers' GC, so their pages are not copied
+        gc.freeze()
+    logger.info("TTS server ready")
+
+
+def post_fork(server, worker):
+    threads = os.environ.get("F5_TORCH_THREADS") or max(available_cpus() // server.cfg.workers, 1)
+    torch.set_num_threads(int(threads))
+    logger.info(f"Worker {worker.pid}: torch with {torch.get_num_threads()} threads")
+
+
+def post_worker_init(worker):
+    worker.background_lock = claim_background_role()
+    if worker.background_lock is not None:
+        from f5_tts.infer.infer_gradio import start_background_tasks
+
+        logger.info(f"Worker {worker.pid}: background tasks (reference preparation and cleanup)")
+        start_background_tasks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Production TTS server")
+    parser.add_argument("--bind", default=os.environ.get("F5_BIND", "0.0.0.0:5000"))
+    parser.add_argument("--workers", type=int, default=None, help="2 on CPU and 1 with CUDA by default")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker serving requests")
+    parser.add_argument("--torch-threads", type=int, default=None, help="torch threads per worker")
+    parser.add_argument("--timeout", type=int, default=600)
+    parser.add_argument("--no-preload", action="store_true", help="load the models in every worker")
+    parser.add_argument("--pool-workers", type=int, default=0, help="run inference in a pool of N CPU processes")
+    parser.add_argument("--pool-threads", type=int, default=None, help="torch threads per pool process")
+    args = parser.parse_args()
+
+    cuda = torch.cuda.is_available()
+    preload = not cuda and not args.no_preload
+    workers = args.workers or (1 if cuda else 2)
+
+    if args.pool_workers:
+        # every gunicorn worker would start its own pool: one worker owns it
+        if args.workers not in (None, 1):
+            parser.error("--pool-workers runs a single gunicorn worker, --workers must be 1")
+        workers = 1
+        os.environ["F5_TTS_POOL_WORKERS"] = str(args.pool_workers)
+        if args.pool_threads:
+            os.environ["F5_TTS_POOL_THREADS"] = str(args.pool_threads)
+
+    if args.torch_threads:
+        os.environ["F5_TORCH_THREADS"] = str(args.torch_threads)
+
+    TTSServer(
+        {
+            "bind": args.bind,
+            "workers": workers,
+            # Threads for SSE and job polling; inference goes through each worker's scheduler
+            "worker_class": "gthread",
+            "threads": args.threads,
+            "timeout": args.timeout,
+            "preload_app": preload,
+            "when_ready": when_ready,
+            "post_fork": post_fork,
+            "post_worker_init": post_worker_init,
+        }
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
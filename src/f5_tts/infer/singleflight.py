@@ -0,0 +1,68 @@
+# Request coalescing: identical in-flight requests share a single computation
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(kind, params, files=()):
+    """
+    Canonical hash of a request: kind, parameters (JSON with sorted keys) and the path, size and modification
+    time of every input file, so that a rewritten file is not mistaken for the previous one.
+    """
+    stamps = []
+    for path in files:
+        stat = os.stat(path)
+        stamps.append([path, stat.st_size, stat.st_mtime_ns])
+    payload = json.dumps([kind, params, stamps], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Deduplicates in-flight computations: the first call with a key runs it and the calls arriving meanwhile
+    with the same key wait and get the same result (or the same exception). The key is forgotten once the
+    call finishes; this is not a result cache.
+
+    The result is shared as is by everyone waiting, so it must not be modified. It is per process: with
+    several gunicorn workers only the requests that land on the same worker are coalesced.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Request {key[:12]} joined an in-flight computation")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.calls), "coalesced": self.coalesced}
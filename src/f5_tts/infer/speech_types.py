@@ -0,0 +1,128 @@
+# Speech-type registry shared between processes: a JSON file that is replaced atomically
+import copy
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, enough for single-process development
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SpeechTypeRegistry:
+    """
+    Speech types ({style: data}) in a JSON file read and written by every gunicorn worker.
+
+    Each process keeps the last version it read in memory and only parses the file again when its identity
+    (inode, size, mtime) changes. Since every write creates a new file and installs it with os.replace, each
+    version has its own inode, and one os.stat per lookup is enough to notice the changes of another worker.
+    Modifications are made under an exclusive lock (fcntl) on <file>.lock and start from the version on disk,
+    so the changes of other processes are not lost.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.lock = threading.RLock()
+        self.data = {}
+        self.stamp = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _refresh_locked(self):
+        if self._stat() == self.stamp:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stat = os.fstat(f.fileno())
+                data = json.load(f)
+        except FileNotFoundError:
+            self.data, self.stamp = {}, None
+            return
+        except ValueError as e:
+            # A JSON file half-edited by hand must not bring the server down: keep the last good version
+            logger.error(f"Could not read {self.path}, keeping the previous version: {e}")
+            self.stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            return
+        self.data, self.stamp = data, (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        logger.info(f"Speech types reloaded from {self.path}: {list(data)}")
+
+    def snapshot(self):
+        """Current version of the registry. It is shared between threads: do not modify it (see update)."""
+        with self.lock:
+            self._refresh_locked()
+            return self.data
+
+    def get(self, style, default=None):
+        return self.snapshot().get(style, default)
+
+    def __contains__(self, style):
+        return style in self.snapshot()
+
+    @contextmanager
+    def _exclusive(self):
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, fn):
+        """
+        Applies fn(data) to a copy of the version on disk and publishes it if anything changed.
+        Returns whatever fn returns.
+        """
+        with self.lock, self._exclusive():
+            self._refresh_locked()
+            data = copy.deepcopy(self.data)
+            result = fn(data)
+            if data != self.data:
+                self._write_locked(data)
+            return result
+
+    def set_prepared(self, style, audio, artifacts, status):
+        """
+        Records the outcome of preparing the reference of style from audio (artifacts may be None on error).
+        Ignored, returning False, if the style was deleted or got a new audio in the meantime: the job of the
+        new audio will prepare it.
+        """
+
+        def apply(data):
+            current = data.get(style)
+            if current is None or current.get("audio") != audio:
+                return False
+            if artifacts is not None:
+                current["prepared"] = artifacts
+            current["status"] = status
+            return True
+
+        return self.update(apply)
+
+    def _write_locked(self, data):
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.data, self.stamp = data, self._stat()
+        logger.info(f"Speech types saved to {self.path}")
@@ -6,19 +6,26 @@ import logging
 sys.path.append(f"../../{os.path.dirname(os.path.abspath(__file__))}/third_party/BigVGAN/")
 
 import hashlib
+import json
 import re
+import shutil
+import struct
+import subprocess
 import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
 from importlib.resources import files
 
-import matplotlib
-
-matplotlib.use("Agg")
-
-import matplotlib.pylab as plt
 import numpy as np
+import soundfile as sf
 import torch
 import torchaudio
 import tqdm
+
+from f5_tts.infer.audio_assembly import CrossfadeWriter, crossfade_concat
+from f5_tts.infer.chunk_cache import chunk_key, chunk_seed, voice_hash
+from f5_tts.model.modules import MelSpec
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,8 +34,9 @@ from pydub import AudioSegment, silence
 from transformers import pipeline
 from vocos import Vocos
 
-from f5_tts.model import CFM
+from f5_tts.model import CFM, DurationPredictor
 from f5_tts.model.utils import (
+    TextFrontend,
     get_tokenizer,
     convert_char_to_pinyin,
 )
@@ -53,8 +61,15 @@ cfg_strength = 2.0
 sway_sampling_coef = -1.0
 speed = 1.0
 fix_duration = None
-MIN_ADDITIONAL_SECONDS = 6.0  # duración mínima adicional en segundos
-min_additional_frames = int(MIN_ADDITIONAL_SECONDS * target_sample_rate / hop_length)
+duration_margin = 1.1  # headroom on the predicted duration, trailing silence is cheap to trim
+min_generated_frames = int(0.3 * target_sample_rate / hop_length)
+silence_keep_frames = int(0.1 * target_sample_rate / hop_length)  # tail kept after the last voiced frame
+max_silence_frames = int(0.5 * target_sample_rate / hop_length)  # longest internal pause kept when trimming
+REF_CLIP_TARGET_SECONDS = (5.0, 8.0)  # preferred reference length for automatic sub-clip selection
+REF_MAX_SECONDS = 15.0  # longer references are clipped by preprocess_ref_audio_text
+max_chunk_frames = int(25 * target_sample_rate / hop_length)  # prompt + generation per chunk, as trained
+min_chunk_budget_frames = int(4 * target_sample_rate / hop_length)  # generated frames per chunk, at least
+linear_cost_frames = 2048  # per-frame MLP cost of the DiT expressed in attention pairs (~2 * dim)
 
 # -----------------------------------------
 
@@ -92,6 +107,228 @@ def chunk_text(text, max_chars=135):
     return chunks
 
 
+# cancel a running generation
+
+
+class InferenceCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """
+    Checked before every ODE step of every chunk; cancel() makes the running generation raise InferenceCancelled.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise InferenceCancelled("Generation cancelled")
+
+
+# predict generated duration per voice
+
+
+class DurationEstimator:
+    """
+    Predicts how many mel frames a text takes in a given voice.
+
+    The default is a speaking-rate model fitted on the reference: frames per utf-8 byte of speech plus
+    a pause per punctuation mark (separated only when word timestamps are available). If a trained
+    DurationPredictor is given, its prediction is rescaled to the reference voice instead; voice_scale (the
+    rescaling, None when fitted without a predictor) is stored with the prepared reference, and bind() attaches
+    the predictor of the model that runs the inference.
+    """
+
+    pause_marks = ",;:.!?，；：。！？"
+
+    def __init__(self, frames_per_byte, pause_frames=0.0, predictor=None, text_frontend=None, voice_scale=None):
+        self.frames_per_byte = frames_per_byte
+        self.pause_frames = pause_frames
+        self.predictor = predictor
+        self.text_frontend = text_frontend
+        self.voice_scale = voice_scale
+
+    @classmethod
+    def from_reference(cls, ref_text, ref_frames, words=None, predictor=None, text_frontend=None):
+        """
+        Args:
+            ref_text (str): Reference transcript.
+            ref_frames (int): Reference length in mel frames.
+            words (list[dict] | None): Word timestamps of the reference ({"text", "start", "end"}, seconds).
+            predictor (DurationPredictor | None): Optional learned predictor, needs text_frontend to encode text.
+        """
+        frames_per_second = target_sample_rate / hop_length
+        if words:
+            speech_bytes = sum(len(w["text"].strip().encode("utf-8")) + 1 for w in words)
+            speech_frames = sum(w["end"] - w["start"] for w in words) * frames_per_second
+            pauses = [
+                b["start"] - a["end"]
+                for a, b in zip(words, words[1:])
+                if a["text"].strip()[-1:] in cls.pause_marks and b["start"] > a["end"]
+            ]
+            estimator = cls(
+                speech_frames / max(speech_bytes, 1),
+                sum(pauses) / len(pauses) * frames_per_second if pauses else 0.0,
+            )
+        else:
+            estimator = cls(ref_frames / max(len(ref_text.encode("utf-8")), 1))
+
+        if predictor is not None and text_frontend is not None:
+            estimator.predictor, estimator.text_frontend = predictor, text_frontend
+            estimator.voice_scale = ref_frames / estimator._predict(ref_text)
+        return estimator
+
+    def to_dict(self):
+        return {
+            "frames_per_byte": self.frames_per_byte,
+            "pause_frames": self.pause_frames,
+            "voice_scale": self.voice_scale,
+        }
+
+    def bind(self, model_obj):
+        """Uses the learned predictor of model_obj (see load_model) if this estimator was fitted with one."""
+        predictor = getattr(model_obj, "duration_predictor", None)
+        if predictor is None or model_obj.text_frontend is None:
+            return self
+        if self.predictor is None and self.voice_scale is not None:
+            self.predictor, self.text_frontend = predictor, model_obj.text_frontend
+        return self
+
+    def _predict(self, text):
+        with torch.inference_mode():
+            device = next(self.predictor.parameters()).device
+            return self.predictor.predict_frames(self.text_frontend.encode([text]).to(device)).item()
+
+    def frames(self, text):
+        # additive over text pieces, no margin: used to plan chunks
+        if self.predictor is not None and self.voice_scale is not None:
+            return self._predict(text) * self.voice_scale
+        pauses = sum(text.count(mark) for mark in self.pause_marks)
+        return len(text.encode("utf-8")) * self.frames_per_byte + pauses * self.pause_frames
+
+    def estimate(self, text, speed=1.0):
+        return max(int(self.frames(text) * duration_margin / speed), min_generated_frames)
+
+
+# plan chunks with a compute cost model instead of a character budget
+
+
+@dataclass
+class ChunkPlan:
+    chunks: list = field(default_factory=list)  # chunk texts
+    frames: list = field(default_factory=list)  # predicted generated frames per chunk (prompt excluded)
+    costs: list = field(default_factory=list)  # predicted cost per chunk, see chunk_cost()
+    ref_frames: int = 0
+
+    @property
+    def total_cost(self):
+        return sum(self.costs)
+
+    def frame_steps(self, nfe_step=nfe_step, cfg_strength=cfg_strength):
+        # frames pushed through the transformer to sample the plan: prompt + generation per chunk and ODE step,
+        # twice with classifier-free guidance (CFM.sample skips the unconditional pass below 1e-5)
+        passes = 2 if cfg_strength >= 1e-5 else 1
+        return sum(self.ref_frames + frames for frames in self.frames) * nfe_step * passes
+
+    def __str__(self):
+        lines = [f"{len(self.chunks)} chunks, ref {self.ref_frames} frames, total cost {self.total_cost:.3g}"]
+        for i, (text, frames, cost) in enumerate(zip(self.chunks, self.frames, self.costs)):
+            lines.append(f"  [{i}] {frames} frames, cost {cost:.3g}: {text}")
+        return "\n".join(lines)
+
+
+def chunk_cost(total_frames):
+    # one transformer pass: attention is quadratic in prompt + generated frames, the rest is linear
+    return total_frames * total_frames + linear_cost_frames * total_frames
+
+
+def split_sentences(text):
+    return [s for s in re.split(r"(?<=[;:,.!?])\s+|(?<=[；：，。！？])", text) if s]
+
+
+def join_sentences(sentences):
+    return "".join(s + " " if len(s[-1].encode("utf-8")) == 1 else s for s in sentences).strip()
+
+
+def plan_chunks(ref_text, ref_frames, gen_text, speed=1.0, max_duration=max_chunk_frames, duration_estimator=None):
+    """
+    Splits the text at sentence/clause boundaries so that the predicted total compute is minimal.
+
+    Every chunk re-processes the reference prompt, so many small chunks waste work, while a single long chunk
+    pays the quadratic attention term. The split is found with dynamic programming over boundaries; since the
+    cost is convex in the chunk length, equal-length chunks (which also batch well) are preferred.
+
+    Args:
+        ref_text (str): Reference transcript, used to fit the speaking rate when no estimator is given.
+        ref_frames (int): Reference length in mel frames.
+        gen_text (str): Text to generate.
+        max_duration (int): Maximum prompt + generated frames per chunk.
+        duration_estimator (DurationEstimator | None): Predicts the frames of a piece of text.
+
+    Returns:
+        ChunkPlan: chunk texts with predicted frames and cost.
+    """
+    if duration_estimator is None:
+        duration_estimator = DurationEstimator.from_reference(ref_text, ref_frames)
+
+    def predicted_frames(text):
+        return duration_estimator.frames(text) * duration_margin / speed
+
+    # a very long reference would leave room for a word or two per chunk; past that point longer chunks are
+    # cheaper than re-running the whole prompt for every word
+    budget = max(max_duration - ref_frames, min_chunk_budget_frames)
+
+    # units that do not fit on their own are split further at word boundaries
+    units = []
+    for sentence in split_sentences(gen_text):
+        words, piece = sentence.split(" "), ""
+        for word in words:
+            candidate = f"{piece} {word}" if piece else word
+            if piece and predicted_frames(candidate) > budget:
+                units.append(piece)
+                candidate = word
+            piece = candidate
+        if piece:
+            units.append(piece)
+
+    prefix = [0.0]
+    for unit in units:
+        prefix.append(prefix[-1] + predicted_frames(unit + " "))
+
+    n = len(units)
+    best = [0.0] + [float("inf")] * n
+    back = [0] * (n + 1)
+    for j in range(1, n + 1):
+        for i in range(j - 1, -1, -1):
+            frames = int(prefix[j] - prefix[i])
+            if frames > budget and i < j - 1:
+                break
+            cost = best[i] + chunk_cost(ref_frames + frames)
+            if cost < best[j]:
+                best[j], back[j] = cost, i
+
+    plan = ChunkPlan(ref_frames=ref_frames)
+    bounds, j = [], n
+    while j > 0:
+        bounds.append((back[j], j))
+        j = back[j]
+    for i, j in reversed(bounds):
+        frames = max(int(prefix[j] - prefix[i]), min_generated_frames)
+        plan.chunks.append(join_sentences(units[i:j]))
+        plan.frames.append(frames)
+        plan.costs.append(chunk_cost(ref_frames + frames))
+    return plan
+
+
 # load vocoder
 def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=device):
     if vocoder_name == "vocos":
@@ -123,6 +360,7 @@ def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=dev
 # load asr pipeline
 
 asr_pipe = None
+asr_lock = threading.Lock()  # references may be prepared from several threads; the ASR model runs one at a time
 
 
 def initialize_asr_pipeline(device=device, dtype=None):
@@ -139,23 +377,84 @@ def initialize_asr_pipeline(device=device, dtype=None):
     )
 
 
+def run_asr(inputs, device=device, **kwargs):
+    """
+    Runs the shared ASR pipeline (loaded on first use) under asr_lock. Every transcription goes through here:
+    the pipeline is not thread-safe, and references are prepared by request threads and by the background
+    preparation thread at the same time.
+    """
+    with asr_lock:
+        if asr_pipe is None:
+            initialize_asr_pipeline(device=device)
+        return asr_pipe(inputs, chunk_length_s=30, batch_size=128, generate_kwargs={"task": "transcribe"}, **kwargs)
+
+
 # load model checkpoint for inference
 
 
-def load_checkpoint(model, ckpt_path, device, dtype=None, use_ema=True):
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def mmap_safetensors(path):
+    """
+    Maps a .safetensors file copy-on-write and returns its tensors as views on the mapping.
+    Nothing is copied: the pages come from the page cache, so every process that maps the same file (or is
+    forked after mapping it) shares one physical copy of the weights until it writes to them.
+    """
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = (data_start + offset for offset in info["data_offsets"])
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if start % itemsize:
+            # misaligned for its dtype, cannot be viewed in place
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = bytearray(f.read(end - start))
+            tensors[name] = torch.frombuffer(data, dtype=dtype).reshape(info["shape"])
+        else:
+            tensors[name] = torch.empty(0, dtype=dtype).set_(storage, start // itemsize, info["shape"])
+    return tensors
+
+
+def load_checkpoint(model, ckpt_path, device, dtype=None, use_ema=True, mmap=False):
+    """
+    With mmap=True (CPU only) the weights are not copied into freshly allocated parameters: the parameters
+    become views on the memory-mapped checkpoint (see mmap_safetensors), except those stored in another dtype.
+    """
     if dtype is None:
         dtype = (
             torch.float16 if device == "cuda" and torch.cuda.get_device_properties(device).major >= 6 else torch.float32
         )
     model = model.to(dtype)
+    mmap = mmap and device == "cpu"
 
     ckpt_type = ckpt_path.split(".")[-1]
     if ckpt_type == "safetensors":
         from safetensors.torch import load_file
 
-        checkpoint = load_file(ckpt_path)
+        checkpoint = mmap_safetensors(ckpt_path) if mmap else load_file(ckpt_path)
     else:
-        checkpoint = torch.load(ckpt_path, weights_only=True)
+        checkpoint = torch.load(ckpt_path, weights_only=True, mmap=mmap)
 
     if use_ema:
         if ckpt_type == "safetensors":
@@ -170,12 +469,17 @@ def load_checkpoint(model, ckpt_path, device, dtype=None, use_ema=True):
         for key in ["mel_spec.mel_stft.mel_scale.fb", "mel_spec.mel_stft.spectrogram.window"]:
             if key in checkpoint["model_state_dict"]:
                 del checkpoint["model_state_dict"][key]
-
-        model.load_state_dict(checkpoint["model_state_dict"])
     else:
         if ckpt_type == "safetensors":
             checkpoint = {"model_state_dict": checkpoint}
-        model.load_state_dict(checkpoint["model_state_dict"])
+
+    state_dict = checkpoint["model_state_dict"]
+    if mmap:
+        # assign keeps the mapped tensors as parameters; only a dtype mismatch forces a copy
+        state_dict = {k: v.to(dtype) if v.is_floating_point() else v for k, v in state_dict.items()}
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model.load_state_dict(state_dict)
 
     return model.to(device)
 
@@ -183,6 +487,11 @@ def load_checkpoint(model, ckpt_path, device, dtype=None, use_ema=True):
 # load model for inference
 
 
+def checkpoint_id(ckpt_path, vocab_file):
+    """Identifies the weights in generated-chunk cache keys and project signatures."""
+    return f"{os.path.basename(ckpt_path)}:{os.path.getsize(ckpt_path)}:{os.path.basename(vocab_file)}"
+
+
 def load_model(
     model_cls,
     model_cfg,
@@ -192,6 +501,8 @@ def load_model(
     ode_method=ode_method,
     use_ema=True,
     device=device,
+    mmap=False,
+    duration_predictor_ckpt="",
 ):
     if vocab_file == "":
         vocab_file = str(files("f5_tts").joinpath("infer/examples/vocab.txt"))
@@ -219,11 +530,125 @@ def load_model(
     ).to(device)
 
     dtype = torch.float32 if mel_spec_type == "bigvgan" else None
-    model = load_checkpoint(model, ckpt_path, device, dtype=dtype, use_ema=use_ema)
+    model = load_checkpoint(model, ckpt_path, device, dtype=dtype, use_ema=use_ema, mmap=mmap)
+    model.checkpoint_id = checkpoint_id(ckpt_path, vocab_file)
+    # optional learned duration model, used by DurationEstimator instead of the speaking-rate fit
+    model.duration_predictor = (
+        load_duration_predictor(duration_predictor_ckpt, vocab_char_map, device=device)
+        if duration_predictor_ckpt
+        else None
+    )
 
     return model
 
 
+def load_duration_predictor(ckpt_path, vocab_char_map, device=device):
+    """
+    Loads a DurationPredictor trained through the Trainer duration_predictor hook, from a training checkpoint
+    (its duration_predictor_state_dict) or from a bare state dict (.pt or .safetensors). The layer sizes are
+    read from the weights.
+    """
+    if ckpt_path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+
+        state_dict = load_file(ckpt_path, device="cpu")
+    else:
+        checkpoint = torch.load(ckpt_path, map_location="cpu", weights_only=True)
+        state_dict = checkpoint.get("duration_predictor_state_dict", checkpoint)
+    n_embeds, dim = state_dict["text_embed.weight"].shape
+    conv_layers = len({key.split(".")[1] for key in state_dict if key.startswith("convs.")})
+    predictor = DurationPredictor(n_embeds - 1, dim=dim, conv_layers=conv_layers, vocab_char_map=vocab_char_map)
+    predictor.load_state_dict(state_dict)
+    print("duration predictor : ", ckpt_path)
+    return predictor.eval().to(device)
+
+
+# model front-end without weights, for processes that delegate inference
+
+
+class ModelFrontend:
+    """
+    The weightless parts of a model: text front-end (normalization, tokenization) and mel settings.
+    Enough to normalize text and prepare references in a process where the model itself lives elsewhere
+    (see daemon.py); duck-types the attributes of CFM that prepare_ref_artifacts and callers use.
+    """
+
+    def __init__(self, vocab_file="", mel_spec_type=mel_spec_type, duration_predictor_ckpt="", ckpt_path=""):
+        if vocab_file == "":
+            vocab_file = str(files("f5_tts").joinpath("infer/examples/vocab.txt"))
+        vocab_char_map, _ = get_tokenizer(vocab_file, "custom")
+        self.text_frontend = TextFrontend(vocab_char_map)
+        # the weights the delegated inference runs, when this process knows them
+        self.checkpoint_id = checkpoint_id(ckpt_path, vocab_file) if ckpt_path else None
+        # small enough to run here: references prepared in this process are fitted against it
+        self.duration_predictor = (
+            load_duration_predictor(duration_predictor_ckpt, vocab_char_map, device="cpu")
+            if duration_predictor_ckpt
+            else None
+        )
+        self.mel_spec = MelSpec(
+            n_fft=n_fft,
+            hop_length=hop_length,
+            win_length=win_length,
+            n_mel_channels=n_mel_channels,
+            target_sample_rate=target_sample_rate,
+            mel_spec_type=mel_spec_type,
+        )
+        self.device = torch.device("cpu")
+
+
+# canonical reference audio: uploads are decoded once into 24 kHz mono float32 and stored as .npy
+
+
+def save_canonical_audio(src_path, dst_path):
+    """
+    Decodes an audio file (any format ffmpeg understands) into the canonical 24 kHz mono float32
+    representation and stores it as a raw .npy array that can later be memory-mapped.
+
+    Args:
+        src_path (str): The uploaded audio file.
+        dst_path (str): Where to write the .npy array.
+
+    Returns:
+        str: dst_path.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", src_path,
+        "-f", "f32le", "-ac", "1", "-ar", str(target_sample_rate), "-",
+    ]  # fmt: skip
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {src_path}: {result.stderr.decode(errors='ignore').strip()}")
+    wave = np.frombuffer(result.stdout, dtype=np.float32)
+    if wave.size == 0:
+        raise RuntimeError(f"ffmpeg decoded no samples from {src_path}")
+    np.save(dst_path, wave)
+    return dst_path
+
+
+def is_canonical_audio(path):
+    return str(path).endswith(".npy")
+
+
+def load_canonical_audio(path):
+    # memory-mapped, read-only: no decode and no copy until samples are actually touched
+    return np.load(path, mmap_mode="r")
+
+
+def load_ref_audiosegment(path):
+    if not is_canonical_audio(path):
+        return AudioSegment.from_file(path)
+    wave = load_canonical_audio(path)
+    pcm = (np.clip(wave, -1.0, 1.0) * 32767).astype(np.int16)
+    return AudioSegment(pcm.tobytes(), frame_rate=target_sample_rate, sample_width=2, channels=1)
+
+
+def load_ref_audio_tensor(path):
+    if not is_canonical_audio(path):
+        return torchaudio.load(path)
+    return torch.from_numpy(np.array(load_canonical_audio(path)))[None, :], target_sample_rate
+
+
 def remove_silence_edges(audio, silence_threshold=-42):
     # Remove silence from the start
     non_silent_start_idx = silence.detect_leading_silence(audio, silence_threshold=silence_threshold)
@@ -247,7 +672,7 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
     show_info("Converting audio...")
     # Exportar el audio a un archivo WAV temporal
     with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
-        aseg = AudioSegment.from_file(ref_audio_orig)
+        aseg = load_ref_audiosegment(ref_audio_orig)
 
         if clip_short:
             # 1. Intentar encontrar silencio largo para recortar
@@ -305,16 +730,7 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
             final_ref_text = _ref_audio_cache[audio_hash]
         else:
             show_info("No reference text provided, transcribing reference audio...")
-            global asr_pipe
-            if asr_pipe is None:
-                initialize_asr_pipeline(device=device)
-            transcribed = asr_pipe(
-                temp_audio_path,
-                chunk_length_s=30,
-                batch_size=128,
-                generate_kwargs={"task": "transcribe"},
-                return_timestamps=False,
-            )["text"].strip()
+            transcribed = run_asr(temp_audio_path, device=device, return_timestamps=False)["text"].strip()
             show_info("Finished transcription")
             final_ref_text = transcribed
             _ref_audio_cache[audio_hash] = final_ref_text
@@ -329,6 +745,237 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
     return temp_audio_path, final_ref_text
 
 
+# transcribe reference with word timestamps
+
+
+def transcribe_ref_words(wave, sr, device=device):
+    """
+    Returns the word-level transcript of a mono waveform as [{"text", "start", "end"}] (seconds).
+    """
+    result = run_asr(
+        {"raw": np.asarray(wave, dtype=np.float32), "sampling_rate": sr}, device=device, return_timestamps="word"
+    )
+    words = []
+    for chunk in result.get("chunks", []):
+        start, end = chunk["timestamp"]
+        if start is None:
+            continue
+        words.append({"text": chunk["text"], "start": start, "end": end if end is not None else start})
+    return words
+
+
+# pick the best short sub-clip of a long reference
+
+
+def select_ref_clip(wave, sr, words=None, target_seconds=REF_CLIP_TARGET_SECONDS, frame_seconds=0.02):
+    """
+    Scores candidate sub-clips of a reference recording and picks the shortest one that reaches the
+    target length while conditioning well: mostly speech and with steady loudness. Every frame of
+    reference is paid for in every transformer pass, so shorter is better once quality is met.
+
+    Args:
+        wave (np.ndarray): Mono waveform.
+        sr (int): Sample rate of wave.
+        words (list[dict] | None): Word timestamps ({"text", "start", "end"}); clip edges snap to words and
+            the matching transcript span is returned. Without them, edges snap to pauses.
+        target_seconds (tuple[float, float]): Minimum and maximum clip length.
+
+    Returns:
+        tuple[float, float, str | None] | None: (start, end, text) in seconds, or None if the recording already
+            fits the target or no candidate qualifies.
+    """
+    min_seconds, max_seconds = target_seconds
+    if len(wave) / sr <= max_seconds:
+        return None
+
+    hop = int(sr * frame_seconds)
+    n_frames = len(wave) // hop
+    frames = np.asarray(wave[: n_frames * hop], dtype=np.float32).reshape(n_frames, hop)
+    db = 20 * np.log10(np.sqrt(np.mean(np.square(frames), axis=1)) + 1e-8)
+    active = db > max(db.max() - 35.0, -50.0)
+
+    # prefix sums give each window's speech ratio and loudness spread in O(1)
+    cum_active = np.concatenate([[0], np.cumsum(active)])
+    cum_db = np.concatenate([[0.0], np.cumsum(np.where(active, db, 0.0))])
+    cum_db2 = np.concatenate([[0.0], np.cumsum(np.where(active, np.square(db), 0.0))])
+
+    if words:
+        starts = [w["start"] for w in words]
+        ends = [w["end"] for w in words]
+    else:
+        edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+        starts = list(np.flatnonzero(edges == 1) * frame_seconds)
+        ends = list(np.flatnonzero(edges == -1) * frame_seconds)
+
+    best = None
+    for i, start in enumerate(starts):
+        for j in range(i if words else 0, len(ends)):
+            end = ends[j]
+            duration = end - start
+            if duration < min_seconds:
+                continue
+            if duration > max_seconds:
+                break
+            a, b = int(start / frame_seconds), min(n_frames, int(np.ceil(end / frame_seconds)))
+            n_active = cum_active[b] - cum_active[a]
+            if b <= a or n_active == 0:
+                continue
+            speech_ratio = n_active / (b - a)
+            if speech_ratio < 0.5:
+                continue
+            mean_db = (cum_db[b] - cum_db[a]) / n_active
+            std_db = np.sqrt(max((cum_db2[b] - cum_db2[a]) / n_active - mean_db**2, 0.0))
+            stability = 1.0 / (1.0 + std_db / 6.0)
+            shortness = 1.0 - (duration - min_seconds) / max(max_seconds - min_seconds, 1e-6)
+            score = speech_ratio + stability + 0.5 * shortness
+            if best is None or score > best[0]:
+                best = (score, start, end, i, j)
+
+    if best is None:
+        return None
+    _, start, end, i, j = best
+    text = "".join(w["text"] for w in words[i : j + 1]).strip() if words else None
+    return start, end, text
+
+
+# normalize reference loudness and sample rate the way the model expects it
+
+
+def normalize_ref_audio(audio, sr, target_rms=target_rms):
+    if audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0, keepdim=True)
+
+    rms = torch.sqrt(torch.mean(torch.square(audio)))
+    if rms < target_rms:
+        audio = audio * target_rms / rms
+    if sr != target_sample_rate:
+        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
+        audio = resampler(audio)
+    return audio, rms
+
+
+# prepare reference artifacts ahead of time: clipped & trimmed audio, final transcript and mel
+
+
+def prepare_ref_artifacts(
+    ref_audio_orig,
+    ref_text,
+    out_dir,
+    model_obj,
+    show_info=print,
+    device=device,
+    select_clip=True,
+    target_seconds=REF_CLIP_TARGET_SECONDS,
+):
+    """
+    Runs the expensive part of reference preprocessing once and keeps the results on disk,
+    so that inference only has to load warm artifacts.
+
+    Args:
+        ref_audio_orig (str): Reference audio (any format, or a canonical .npy).
+        ref_text (str): Reference transcript; transcribed with ASR if empty.
+        out_dir (str): Folder where the artifacts are written.
+        model_obj (CFM): Model whose mel_spec settings are used for the cached mel.
+        select_clip (bool): When the transcript has to be produced anyway, pick the best sub-clip of
+            target_seconds (see select_ref_clip) and keep the matching span of the transcript.
+
+    Returns:
+        dict: {"audio": trimmed .wav, "ref_text": final transcript, "mel": mel .npy (frames x n_mels),
+            "duration": fitted DurationEstimator parameters}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(ref_audio_orig))[0]
+
+    clip_short, words = True, None
+    if select_clip and not ref_text.strip():
+        audio, sr = load_ref_audio_tensor(ref_audio_orig)
+        wave = audio.mean(dim=0).numpy()
+        show_info("Transcribing reference audio with word timestamps...")
+        words = transcribe_ref_words(wave, sr, device=device)
+        clip = select_ref_clip(wave, sr, words, target_seconds)
+        if clip is not None and clip[2]:
+            start, end, ref_text = clip
+            show_info(f"Using reference sub-clip {start:.2f}s - {end:.2f}s")
+            ref_audio_orig = os.path.join(out_dir, f"{stem}.clip.wav")
+            torchaudio.save(ref_audio_orig, audio[:, int(start * sr) : int(end * sr)], sr)
+            clip_short = False
+            words = [w for w in words if w["start"] >= start and w["end"] <= end]
+        elif words:
+            # no sub-clip: reuse the transcript we already have instead of running ASR again on the same audio
+            if len(wave) / sr > REF_MAX_SECONDS:
+                # preprocess_ref_audio_text would cut speech here; cut at a word boundary ourselves so the
+                # transcript keeps matching the audio
+                words = [w for w in words if w["end"] <= REF_MAX_SECONDS] or words[:1]
+                end = min(words[-1]["end"] + 0.25, len(wave) / sr)
+                ref_audio_orig = os.path.join(out_dir, f"{stem}.clip.wav")
+                torchaudio.save(ref_audio_orig, audio[:, : int(end * sr)], sr)
+                clip_short = False
+            ref_text = "".join(w["text"] for w in words).strip()
+
+    processed_audio, final_ref_text = preprocess_ref_audio_text(
+        ref_audio_orig, ref_text, clip_short=clip_short, show_info=show_info, device=device
+    )
+    audio_path = os.path.join(out_dir, f"{stem}.wav")
+    shutil.move(processed_audio, audio_path)
+
+    audio, _ = normalize_ref_audio(*torchaudio.load(audio_path))
+    with torch.inference_mode():
+        mel = model_obj.mel_spec(audio.to(model_obj.device)).permute(0, 2, 1)[0]
+    mel_path = os.path.join(out_dir, f"{stem}.mel.npy")
+    np.save(mel_path, mel.to(torch.float32).cpu().numpy())
+
+    # speaking-rate model of this voice, fitted on word timestamps when the reference was transcribed
+    duration = DurationEstimator.from_reference(
+        final_ref_text,
+        audio.shape[-1] // hop_length,
+        words=words,
+        predictor=getattr(model_obj, "duration_predictor", None),
+        text_frontend=model_obj.text_frontend,
+    )
+
+    return {"audio": audio_path, "ref_text": final_ref_text, "mel": mel_path, "duration": duration.to_dict()}
+
+
+# end-point detection on the generated mel, before it is vocoded
+
+
+def trim_mel_silence(mel, silence_drop=4.0, keep_frames=silence_keep_frames, max_internal_frames=None):
+    """
+    Drops trailing silent frames (and optionally shortens long internal pauses) of a generated log-mel.
+
+    Args:
+        mel (torch.Tensor): Log-mel of shape (1, n_mels, n).
+        silence_drop (float): A frame is silent when its log energy is this far below the loudest frame
+            (natural log, 4.0 is about 35 dB).
+        keep_frames (int): Frames kept after the last voiced frame so the decay is not cut.
+        max_internal_frames (int | None): If set, internal pauses are shortened to this many frames.
+
+    Returns:
+        tuple[torch.Tensor, int]: The trimmed mel and the number of frames dropped.
+    """
+    energy = torch.logsumexp(mel[0].float(), dim=0)
+    silent = (energy < energy.max() - silence_drop).cpu().numpy()
+    voiced = np.flatnonzero(~silent)
+    n_frames = len(silent)
+    if len(voiced) == 0:
+        return mel, 0
+
+    keep = np.zeros(n_frames, dtype=bool)
+    keep[: min(n_frames, voiced[-1] + 1 + keep_frames)] = True
+
+    if max_internal_frames is not None:
+        edges = np.diff(np.concatenate([[0], silent[: voiced[-1]].astype(np.int8), [0]]))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            if start > voiced[0] and end - start > max_internal_frames:
+                half = max_internal_frames // 2
+                keep[start + half : end - (max_internal_frames - half)] = False
+
+    n_dropped = int(n_frames - keep.sum())
+    if n_dropped == 0:
+        return mel, 0
+    return mel[:, :, torch.from_numpy(keep).to(mel.device)], n_dropped
+
+
 # infer process: chunk text -> infer batches [i.e. infer_batch_process()]
 
 
@@ -349,13 +996,33 @@ def infer_process(
     speed=speed,
     fix_duration=fix_duration,
     device=device,
+    ref_mel=None,
+    duration_estimator=None,
+    trim_silence=True,
+    trim_internal_silence=False,
+    sink=None,
+    return_spectrogram=True,
+    progress_callback=None,
+    cancel_token=None,
+    seed=0,
+    chunk_cache=None,
+    on_chunk=None,
+    assemble=True,
 ):
     # Split the input text into batches
-    audio, sr = torchaudio.load(ref_audio)
-    max_chars = int(len(ref_text.encode("utf-8")) / (audio.shape[-1] / sr) * (25 - audio.shape[-1] / sr))
-    gen_text_batches = chunk_text(gen_text, max_chars=max_chars)
-    for i, gen_text in enumerate(gen_text_batches):
-        print(f"gen_text {i}", gen_text)
+    audio, sr = load_ref_audio_tensor(ref_audio)
+    ref_frames = int(audio.shape[-1] / sr * target_sample_rate) // hop_length
+    if duration_estimator is None:
+        duration_estimator = DurationEstimator.from_reference(
+            ref_text,
+            ref_frames,
+            predictor=getattr(model_obj, "duration_predictor", None),
+            text_frontend=model_obj.text_frontend,
+        )
+    duration_estimator.bind(model_obj)
+    plan = plan_chunks(ref_text, ref_frames, gen_text, speed=speed, duration_estimator=duration_estimator)
+    gen_text_batches = plan.chunks
+    logger.debug("%s", plan)
 
     show_info(f"Generating audio in {len(gen_text_batches)} batches...")
     return infer_batch_process(
@@ -374,9 +1041,31 @@ def infer_process(
         speed=speed,
         fix_duration=fix_duration,
         device=device,
+        ref_mel=ref_mel,
+        duration_estimator=duration_estimator,
+        trim_silence=trim_silence,
+        trim_internal_silence=trim_internal_silence,
+        sink=sink,
+        return_spectrogram=return_spectrogram,
+        progress_callback=progress_callback,
+        cancel_token=cancel_token,
+        seed=seed,
+        chunk_cache=chunk_cache,
+        on_chunk=on_chunk,
+        assemble=assemble,
     )
 
 
+# open a streaming output file
+
+
+def open_audio_sink(path, sample_rate=target_sample_rate, channels=1):
+    """
+    Opens a WAV/FLAC file (format taken from the extension) to be passed as `sink` to infer_process.
+    """
+    return sf.SoundFile(path, "w", samplerate=sample_rate, channels=channels)
+
+
 # infer batches
 
 def infer_batch_process(
@@ -395,107 +1084,173 @@ def infer_batch_process(
     speed=1,
     fix_duration=None,
     device=None,
+    ref_mel=None,
+    duration_estimator=None,
+    trim_silence=True,
+    trim_internal_silence=False,
+    sink=None,
+    return_spectrogram=True,
+    progress_callback=None,
+    cancel_token=None,
+    seed=0,
+    chunk_cache=None,
+    on_chunk=None,
+    assemble=True,
 ):
-    audio, sr = ref_audio
-    if audio.shape[0] > 1:
-        audio = torch.mean(audio, dim=0, keepdim=True)
+    """
+    Generates every text batch and joins the chunks with cross-fades.
 
-    rms = torch.sqrt(torch.mean(torch.square(audio)))
-    if rms < target_rms:
-        audio = audio * target_rms / rms
-    if sr != target_sample_rate:
-        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
-        audio = resampler(audio)
+    With a sink (e.g. open_audio_sink), each chunk is cross-faded and written as soon as it is vocoded and only
+    the fade tail is held in memory; the returned wave is then None. The combined spectrogram is only kept when
+    return_spectrogram is set, otherwise None is returned in its place.
+
+    progress_callback receives {"chunk", "chunks", "step", "steps", "elapsed"} before every ODE step; a cancelled
+    cancel_token (CancellationToken) aborts at the next step with InferenceCancelled.
+
+    Each chunk is sampled from a seed derived from `seed` and its text (chunk_seed), so with a chunk_cache
+    (ChunkCache) a chunk already generated with the same voice, text, sampling parameters and checkpoint is
+    read back instead of solved again.
+
+    on_chunk(index, text, wave, mel) is called with every finished chunk before it is joined. With assemble=False
+    the chunks only go to on_chunk: nothing is joined or written to a sink and None is returned as the wave.
+    """
+    audio, rms = normalize_ref_audio(*ref_audio, target_rms=target_rms)
+    voice = voice_hash(audio.numpy(), ref_text, ref_mel) if chunk_cache is not None else None
     audio = audio.to(device)
+    # a precomputed reference mel (see prepare_ref_artifacts) skips the mel transform of the prompt
+    cond = audio if ref_mel is None else torch.from_numpy(np.array(ref_mel))[None, :, :].to(device)
 
     generated_waves = []
     spectrograms = []
+    trimmed_frames = 0
+    writer = CrossfadeWriter(sink, target_sample_rate, cross_fade_duration) if sink is not None and assemble else None
 
     if len(ref_text[-1].encode("utf-8")) == 1:
         ref_text = ref_text + " "
+    ref_audio_len = audio.shape[-1] // hop_length
+    if duration_estimator is None:
+        duration_estimator = DurationEstimator.from_reference(
+            ref_text,
+            ref_audio_len,
+            predictor=getattr(model_obj, "duration_predictor", None),
+            text_frontend=model_obj.text_frontend,
+        )
+    duration_estimator.bind(model_obj)
+    started = time.time()
+
+    def on_step(chunk, step, steps):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        if progress_callback is not None:
+            progress_callback(
+                {
+                    "chunk": chunk,
+                    "chunks": len(gen_text_batches),
+                    "step": step,
+                    "steps": steps,
+                    "elapsed": time.time() - started,
+                }
+            )
+
     for i, gen_text in enumerate(progress.tqdm(gen_text_batches)):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
         # Prepare the text
         text_list = [ref_text + gen_text]
-        final_text_list = convert_char_to_pinyin(text_list)
+        if model_obj.text_frontend is not None:
+            final_text_list = model_obj.text_frontend.encode(text_list).to(device)
+        else:
+            final_text_list = convert_char_to_pinyin(text_list)
 
-        ref_audio_len = audio.shape[-1] // hop_length
         if fix_duration is not None:
             duration = int(fix_duration * target_sample_rate / hop_length)
         else:
-            ref_text_len = len(ref_text.encode("utf-8"))
-            gen_text_len = len(gen_text.encode("utf-8"))
-            # Evitar división por cero (aunque ref_text no debería estar vacío aquí)
-            ratio = ref_text_len > 0 and (ref_audio_len / ref_text_len) or 1
-            additional_duration = int(ratio * gen_text_len / speed)
-            # Forzar un mínimo de duración adicional
-            additional_duration = max(additional_duration, min_additional_frames)
-            duration = ref_audio_len + additional_duration
-        # inference
-        with torch.inference_mode():
-            generated, _ = model_obj.sample(
-                cond=audio,
-                text=final_text_list,
-                duration=duration,
-                steps=nfe_step,
+            duration = ref_audio_len + duration_estimator.estimate(gen_text, speed=speed)
+        seed_i = chunk_seed(seed, gen_text)
+
+        cached, key = None, None
+        if chunk_cache is not None:
+            key = chunk_key(
+                voice=voice,
+                text=gen_text,
+                nfe_step=nfe_step,
                 cfg_strength=cfg_strength,
                 sway_sampling_coef=sway_sampling_coef,
+                speed=speed,
+                seed=seed_i,
+                duration=duration,
+                checkpoint=getattr(model_obj, "checkpoint_id", None),
+                mel_spec_type=mel_spec_type,
+                target_rms=target_rms,
+                trim=[trim_silence, trim_internal_silence],
             )
-
-            generated = generated.to(torch.float32)
-            generated = generated[:, ref_audio_len:, :]
-            generated_mel_spec = generated.permute(0, 2, 1)
-            if mel_spec_type == "vocos":
-                generated_wave = vocoder.decode(generated_mel_spec)
-            elif mel_spec_type == "bigvgan":
-                generated_wave = vocoder(generated_mel_spec)
-            if rms < target_rms:
-                generated_wave = generated_wave * rms / target_rms
-
-            # wav -> numpy
-            generated_wave = generated_wave.squeeze().cpu().numpy()
-
+            cached = chunk_cache.get(key)
+        if cached is not None:
+            generated_wave, generated_mel = cached
+            logger.info(f"Chunk {i}: cache hit, sampling skipped")
+        else:
+            # inference
+            with torch.inference_mode():
+                generated, _ = model_obj.sample(
+                    cond=cond,
+                    text=final_text_list,
+                    duration=duration,
+                    steps=nfe_step,
+                    cfg_strength=cfg_strength,
+                    sway_sampling_coef=sway_sampling_coef,
+                    seed=seed_i,
+                    step_callback=lambda step, steps, chunk=i: on_step(chunk, step, steps),
+                )
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+                generated = generated.to(torch.float32)
+                generated = generated[:, ref_audio_len:, :]
+                generated_mel_spec = generated.permute(0, 2, 1)
+                if trim_silence:
+                    generated_mel_spec, n_trimmed = trim_mel_silence(
+                        generated_mel_spec, max_internal_frames=max_silence_frames if trim_internal_silence else None
+                    )
+                    trimmed_frames += n_trimmed
+                    logger.info(f"Chunk {i}: trimmed {n_trimmed} silent mel frames before vocoding")
+                if mel_spec_type == "vocos":
+                    generated_wave = vocoder.decode(generated_mel_spec)
+                elif mel_spec_type == "bigvgan":
+                    generated_wave = vocoder(generated_mel_spec)
+                if rms < target_rms:
+                    generated_wave = generated_wave * rms / target_rms
+
+                # wav -> numpy
+                generated_wave = generated_wave.squeeze().cpu().numpy()
+                generated_mel = generated_mel_spec[0].cpu().numpy()
+            if chunk_cache is not None:
+                chunk_cache.put(key, generated_wave, generated_mel)
+
+        if on_chunk is not None:
+            on_chunk(i, gen_text, generated_wave, generated_mel)
+        if writer is not None:
+            writer.write(generated_wave)
+        elif assemble:
             generated_waves.append(generated_wave)
-            spectrograms.append(generated_mel_spec[0].cpu().numpy())
-
-    # Combine all generated waves with cross-fading
-    if cross_fade_duration <= 0:
-        # Simply concatenate
-        final_wave = np.concatenate(generated_waves)
+        if return_spectrogram:
+            spectrograms.append(generated_mel)
+
+    if trim_silence:
+        logger.info(f"Trimmed {trimmed_frames} silent mel frames ({trimmed_frames * hop_length / target_sample_rate:.2f}s)")
+
+    if writer is not None:
+        # Flush the held-back cross-fade tail; the audio already lives in the sink
+        writer.close()
+        final_wave = None
+    elif not assemble:
+        final_wave = None
     else:
-        final_wave = generated_waves[0]
-        for i in range(1, len(generated_waves)):
-            prev_wave = final_wave
-            next_wave = generated_waves[i]
-
-            # Calculate cross-fade samples, ensuring it does not exceed wave lengths
-            cross_fade_samples = int(cross_fade_duration * target_sample_rate)
-            cross_fade_samples = min(cross_fade_samples, len(prev_wave), len(next_wave))
-
-            if cross_fade_samples <= 0:
-                # No overlap possible, concatenate
-                final_wave = np.concatenate([prev_wave, next_wave])
-                continue
-
-            # Overlapping parts
-            prev_overlap = prev_wave[-cross_fade_samples:]
-            next_overlap = next_wave[:cross_fade_samples]
-
-            # Fade out and fade in
-            fade_out = np.linspace(1, 0, cross_fade_samples)
-            fade_in = np.linspace(0, 1, cross_fade_samples)
-
-            # Cross-faded overlap
-            cross_faded_overlap = prev_overlap * fade_out + next_overlap * fade_in
-
-            # Combine
-            new_wave = np.concatenate(
-                [prev_wave[:-cross_fade_samples], cross_faded_overlap, next_wave[cross_fade_samples:]]
-            )
-
-            final_wave = new_wave
+        # Combine all generated waves with cross-fading, in one preallocated pass
+        final_wave = crossfade_concat(generated_waves, target_sample_rate, cross_fade_duration)
 
     # Create a combined spectrogram
-    combined_spectrogram = np.concatenate(spectrograms, axis=1)
+    combined_spectrogram = np.concatenate(spectrograms, axis=1) if return_spectrogram else None
 
     return final_wave, target_sample_rate, combined_spectrogram
 
@@ -518,7 +1273,20 @@ def remove_silence_for_generated_wav(filename):
 # save spectrogram
 
 
+def save_mel(spectrogram, path):
+    """
+    Stores a (n_mels, frames) spectrogram as float16 .npy, to be rendered by save_spectrogram only if asked for.
+    """
+    np.save(path, np.asarray(spectrogram, dtype=np.float16))
+
+
 def save_spectrogram(spectrogram, path):
+    # matplotlib is only needed here; importing it lazily keeps it out of every inference process
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pylab as plt
+
     plt.figure(figsize=(12, 4))
     plt.imshow(spectrogram, origin="lower", aspect="auto")
     plt.colorbar()
@@ -0,0 +1,404 @@
+# Multi-process inference pool: N worker processes, each pinned to its own cores and mapping the same
+# checkpoint read-only, pulling chunk-level tasks from one shared queue
+#
+#   python -m f5_tts.infer.worker_pool --ref_audio ref.wav --ref_text "..." --gen_file text.txt \
+#       --layouts 1x16,2x8,4x4 --requests 8
+#
+# The benchmark prints, per layout (workers x threads), the latency of a single request and the throughput of
+# `requests` concurrent ones: one wide process finishes a lone request fastest, several narrow ones usually
+# serve a queue of requests better, since the DiT does not scale linearly with torch threads.
+import argparse
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+import torch
+from cached_path import cached_path
+
+from f5_tts.infer.audio_assembly import CrossfadeWriter, crossfade_concat
+from f5_tts.infer.chunk_cache import ChunkCache
+from f5_tts.infer.daemon import DEFAULT_CKPT, F5TTS_MODEL_CFG
+from f5_tts.infer.utils_infer import (
+    DurationEstimator,
+    ModelFrontend,
+    hop_length,
+    infer_batch_process,
+    load_model,
+    load_ref_audio_tensor,
+    load_vocoder,
+    plan_chunks,
+    preprocess_ref_audio_text,
+    target_sample_rate,
+)
+from f5_tts.model import DiT
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def core_groups(workers, threads_per_worker=None, cores=None):
+    """
+    Splits the cores into `workers` groups of `threads_per_worker` (by default an even share). Groups are
+    disjoint as long as workers * threads_per_worker fits in the cores, otherwise they wrap around.
+    """
+    cores = available_cores() if cores is None else list(cores)
+    per_worker = threads_per_worker or max(len(cores) // workers, 1)
+    return [[cores[(i * per_worker + k) % len(cores)] for k in range(per_worker)] for i in range(workers)]
+
+
+def _worker_main(cores, ckpt_path, vocab_file, chunk_cache_dir, duration_predictor_ckpt, tasks, results):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    # mmap: every worker maps the same file, the weights sit once in the page cache however many workers there are
+    model = load_model(
+        DiT,
+        F5TTS_MODEL_CFG,
+        ckpt_path,
+        vocab_file=vocab_file,
+        device="cpu",
+        mmap=True,
+        duration_predictor_ckpt=duration_predictor_ckpt,
+    )
+    vocoder = load_vocoder(device="cpu")
+    chunk_cache = ChunkCache(chunk_cache_dir) if chunk_cache_dir else None
+    results.put((None, os.getpid(), None))
+
+    ref_path, ref_audio = None, None
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, voice, text, return_mel, params = task
+        try:
+            if voice["audio"] != ref_path:
+                ref_path, ref_audio = voice["audio"], load_ref_audio_tensor(voice["audio"])
+            chunks = []
+            infer_batch_process(
+                ref_audio,
+                voice["ref_text"],
+                [text],
+                model,
+                vocoder,
+                device="cpu",
+                ref_mel=np.load(voice["mel"], mmap_mode="r") if voice.get("mel") else None,
+                duration_estimator=DurationEstimator(**voice["duration"]),
+                return_spectrogram=False,
+                chunk_cache=chunk_cache,
+                on_chunk=lambda i, chunk_text, wave, mel: chunks.append((wave, mel if return_mel else None)),
+                assemble=False,
+                **params,
+            )
+            results.put((task_id, chunks[0], None))
+        except Exception as e:
+            logger.exception(f"Chunk task {task_id} failed")
+            results.put((task_id, None, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """
+    CPU inference on N worker processes instead of one process with all the cores.
+
+    Workers are started with spawn (nothing torch-related is inherited) and each one pins itself to its own
+    group of cores with a matching torch.set_num_threads. A request is planned here, split into its chunks and
+    the chunks are queued individually (a few at a time), so a long request spreads over all idle workers while
+    short ones do not wait behind it. Chunks are joined back in order with the same cross-fades as infer_process;
+    since each chunk is sampled from chunk_seed(seed, text), the audio does not depend on which worker produced it.
+
+    If a worker exits, the pool is marked broken: pending chunks fail, later submissions raise right away and the
+    owner is expected to close it and start a new one.
+
+    A voice is a dict {"audio", "ref_text", "mel", "duration"} like the ones the daemon takes.
+    """
+
+    liveness_interval = 5.0  # seconds between checks that the workers are still alive while waiting for results
+    closing = False  # set by close(), when workers exiting is expected
+
+    def __init__(
+        self,
+        ckpt_path,
+        workers=1,
+        threads_per_worker=None,
+        vocab_file="",
+        chunk_cache_dir=None,
+        duration_predictor_ckpt="",
+    ):
+        # text front-end and duration model of the same checkpoint, to plan requests in this process
+        self.frontend = ModelFrontend(vocab_file, duration_predictor_ckpt=duration_predictor_ckpt, ckpt_path=ckpt_path)
+        context = mp.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.groups = core_groups(workers, threads_per_worker)
+        self.processes = [
+            context.Process(
+                target=_worker_main,
+                args=(cores, ckpt_path, vocab_file, chunk_cache_dir, duration_predictor_ckpt, self.tasks, self.results),
+                daemon=True,
+            )
+            for cores in self.groups
+        ]
+        for process in self.processes:
+            process.start()
+
+        for _ in self.processes:
+            _, pid, _ = self._next_result()
+            logger.info(f"Pool worker {pid} ready")
+        self._start_dispatcher()
+
+    def _start_dispatcher(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.broken = None  # why the pool stopped serving, once a worker has exited
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def _next_result(self):
+        while True:
+            # checked before every read too: the survivors can keep results flowing while the chunk a dead worker
+            # took is never answered
+            dead = [p.pid for p in self.processes if not p.is_alive()]
+            if dead and not self.closing:
+                raise RuntimeError(f"pool workers {dead} exited")
+            try:
+                return self.results.get(timeout=self.liveness_interval)
+            except queue.Empty:
+                pass
+
+    def _dispatch(self):
+        while True:
+            try:
+                task_id, wave, error = self._next_result()
+            except (RuntimeError, EOFError, OSError) as e:
+                logger.error(f"Inference pool broken: {e}")
+                with self.lock:
+                    self.broken = str(e)
+                    futures, self.futures = self.futures, {}
+                for future in futures.values():
+                    future.set_exception(RuntimeError(str(e)))
+                return
+            if task_id is None:  # close()
+                return
+            with self.lock:
+                future = self.futures.pop(task_id)
+            if error is None:
+                future.set_result(wave)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    @property
+    def checkpoint_id(self):
+        return self.frontend.checkpoint_id
+
+    def submit_chunk(self, voice, text, return_mel=False, **params):
+        """Queues one chunk; the future resolves to (wave, mel or None), float32 and before cross-fading."""
+        future = Future()
+        with self.lock:
+            if self.broken is not None:
+                raise RuntimeError(f"inference pool is broken: {self.broken}")
+            task_id = next(self.ids)
+            self.futures[task_id] = future
+        self.tasks.put((task_id, voice, text, return_mel, params))
+        return future
+
+    def synthesize(
+        self,
+        voice,
+        gen_text,
+        speed=1.0,
+        cross_fade_duration=0.15,
+        sink=None,
+        return_spectrogram=False,
+        progress_callback=None,
+        cancel_token=None,
+        on_chunk=None,
+        assemble=True,
+        **params,
+    ):
+        """
+        Same contract as infer_process: with a sink the audio is written to it as the chunks complete (in
+        order) and None is returned, otherwise the whole wave; with assemble=False the chunks only go to
+        on_chunk(i, text, wave, mel). Returns (wave or None, sample rate, mel or None).
+
+        At most one chunk per worker is queued ahead of the one being joined, so a long request keeps every
+        worker busy without holding the queue against the requests that come after it. A cancelled cancel_token
+        stops the request while it waits for a chunk; progress_callback is called once per finished chunk.
+        Remaining params (nfe_step, cfg_strength, sway_sampling_coef, target_rms, seed, ...) go to every chunk.
+        """
+        audio, sr = load_ref_audio_tensor(voice["audio"])
+        ref_frames = int(audio.shape[-1] / sr * target_sample_rate) // hop_length
+        if voice.get("duration"):
+            duration_estimator = DurationEstimator(**voice["duration"])
+        else:
+            duration_estimator = DurationEstimator.from_reference(
+                voice["ref_text"],
+                ref_frames,
+                predictor=self.frontend.duration_predictor,
+                text_frontend=self.frontend.text_frontend,
+            )
+        duration_estimator.bind(self.frontend)
+        plan = plan_chunks(voice["ref_text"], ref_frames, gen_text, speed=speed, duration_estimator=duration_estimator)
+
+        voice = {"audio": voice["audio"], "ref_text": voice["ref_text"], "mel": voice.get("mel")}
+        voice["duration"] = duration_estimator.to_dict()
+        window = len(self.processes)
+        futures = {}
+
+        def submit(i):
+            if i < len(plan.chunks):
+                futures[i] = self.submit_chunk(
+                    voice, plan.chunks[i], return_mel=return_spectrogram, speed=speed, **params
+                )
+
+        for i in range(window):
+            submit(i)
+        writer = (
+            CrossfadeWriter(sink, target_sample_rate, cross_fade_duration) if sink is not None and assemble else None
+        )
+        waves, mels = [], []
+        started = time.time()
+        for i, text in enumerate(plan.chunks):
+            wave, mel = self._wait(futures.pop(i), cancel_token)
+            submit(i + window)
+            if progress_callback is not None:
+                steps = params.get("nfe_step", 32)
+                progress_callback(
+                    {
+                        "chunk": i,
+                        "chunks": len(plan.chunks),
+                        "step": steps,
+                        "steps": steps,
+                        "elapsed": time.time() - started,
+                    }
+                )
+            if on_chunk is not None:
+                on_chunk(i, text, wave, mel)
+            if writer is not None:
+                writer.write(wave)
+            elif assemble:
+                waves.append(wave)
+            if return_spectrogram:
+                mels.append(mel)
+
+        if writer is not None:
+            writer.close()
+        wave = crossfade_concat(waves, target_sample_rate, cross_fade_duration) if assemble and writer is None else None
+        mel = np.concatenate(mels, axis=1) if return_spectrogram else None
+        return wave, target_sample_rate, mel
+
+    def _wait(self, future, cancel_token):
+        """
+        future.result(), checking cancel_token and the pool while waiting; a cancelled request leaves the chunk
+        running on a worker to finish.
+        """
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except FutureTimeoutError:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if self.broken is not None and not future.done():
+                    raise RuntimeError(f"inference pool is broken: {self.broken}")
+
+    def close(self):
+        self.closing = True
+        if self.broken is not None:
+            # the survivors may be in the middle of a chunk nobody is waiting for any more
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
+        else:
+            for _ in self.processes:
+                self.tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.results.put((None, None, None))
+        self.dispatcher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_layout(layout):
+    workers, threads = layout.lower().split("x")
+    return int(workers), int(threads)
+
+
+def benchmark(pool, voice, gen_text, requests, **params):
+    """Returns (single-request latency in s, seconds of audio produced per wall-clock second under load)."""
+    pool.synthesize(voice, gen_text, **params)  # warm-up: first touch of the mapped weights, allocator, etc.
+
+    started = time.perf_counter()
+    wave, sr, _ = pool.synthesize(voice, gen_text, **params)
+    latency = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        waves = list(executor.map(lambda _: pool.synthesize(voice, gen_text, **params)[0], range(requests)))
+    elapsed = time.perf_counter() - started
+    return latency, sum(len(w) for w in waves) / sr / elapsed, len(wave) / sr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of worker-pool layouts (workers x torch threads)")
+    parser.add_argument("-p", "--ckpt_file", default=DEFAULT_CKPT, help="checkpoint (.safetensors/.pt or hf:// url)")
+    parser.add_argument("-v", "--vocab_file", default="", help="vocab .txt")
+    parser.add_argument("-r", "--ref_audio", required=True)
+    parser.add_argument("-s", "--ref_text", default="", help="transcribed with ASR if empty")
+    parser.add_argument("-t", "--gen_text", default="")
+    parser.add_argument("-f", "--gen_file", default="")
+    parser.add_argument("--layouts", default=None, help="comma-separated WORKERSxTHREADS, e.g. 1x16,2x8,4x4")
+    parser.add_argument("--requests", type=int, default=8, help="concurrent requests of the throughput run")
+    parser.add_argument("--nfe_step", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration_predictor", default="", help="trained DurationPredictor checkpoint (optional)")
+    # off by default: with a cache every run after the first would measure cache reads
+    parser.add_argument("--chunk_cache", default="", help="folder of the generated-chunk cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    gen_text = open(args.gen_file, encoding="utf-8").read() if args.gen_file else args.gen_text
+    if not gen_text:
+        parser.error("--gen_text or --gen_file is required")
+    cores = len(available_cores())
+    layouts = args.layouts or ",".join(f"{w}x{cores // w}" for w in (1, 2, 4) if cores // w)
+
+    ref_audio, ref_text = preprocess_ref_audio_text(args.ref_audio, args.ref_text, device="cpu")
+    voice = {"audio": ref_audio, "ref_text": ref_text, "mel": None, "duration": None}
+    ckpt_path = str(cached_path(args.ckpt_file))
+
+    rows = []
+    for layout in layouts.split(","):
+        workers, threads = parse_layout(layout)
+        with InferencePool(
+            ckpt_path, workers, threads, args.vocab_file, args.chunk_cache or None, args.duration_predictor
+        ) as pool:
+            latency, throughput, audio_seconds = benchmark(
+                pool, voice, gen_text, args.requests, nfe_step=args.nfe_step, seed=args.seed
+            )
+        rows.append((layout, latency, latency / audio_seconds, throughput))
+        logger.info(f"{layout}: latency {latency:.2f}s, throughput {throughput:.2f} audio s/s")
+
+    print(f"\n{'layout':>8} {'latency (s)':>12} {'RTF':>6} {'audio s/s':>10}")
+    for layout, latency, rtf, throughput in rows:
+        print(f"{layout:>8} {latency:>12.2f} {rtf:>6.2f} {throughput:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ from torchdiffeq import odeint
 
 from f5_tts.model.modules import MelSpec
 from f5_tts.model.utils import (
+    TextFrontend,
     default,
     exists,
     lens_to_mask,
@@ -28,6 +29,9 @@ from f5_tts.model.utils import (
     mask_from_frac_lengths,
 )
 
+# function evaluations per step of the torchdiffeq fixed-grid solvers, to report sampling progress in steps
+SOLVER_EVALUATIONS_PER_STEP = {"euler": 1, "midpoint": 2, "heun2": 2, "heun3": 3, "rk4": 4}
+
 
 class CFM(nn.Module):
     def __init__(
@@ -73,6 +77,7 @@ class CFM(nn.Module):
 
         # vocab map for tokenization
         self.vocab_char_map = vocab_char_map
+        self.text_frontend = TextFrontend(vocab_char_map) if exists(vocab_char_map) else None
 
     @property
     def device(self):
@@ -96,6 +101,7 @@ class CFM(nn.Module):
         duplicate_test=False,
         t_inter=0.1,
         edit_mask=None,
+        step_callback: Callable[[int, int], None] | None = None,
     ):
         self.eval()
         # raw wave
@@ -111,11 +117,13 @@ class CFM(nn.Module):
         if not exists(lens):
             lens = torch.full((batch,), cond_seq_len, device=device, dtype=torch.long)
 
-        # text
+        # text, either ids from text_frontend.encode() or a list of char lists
 
         if isinstance(text, list):
-            if exists(self.vocab_char_map):
-                text = list_str_to_idx(text, self.vocab_char_map).to(device)
+            if exists(self.text_frontend):
+                text = pad_sequence(
+                    [self.text_frontend.token_ids(t) for t in text], padding_value=-1, batch_first=True
+                ).to(device)
             else:
                 text = list_str_to_tensor(text).to(device)
             assert text.shape[0] == batch
@@ -159,7 +167,18 @@ class CFM(nn.Module):
 
         # neural ode
 
+        evaluations = 0
+        # adaptive or unknown solvers have no fixed count: their callback reports function evaluations instead
+        evaluations_per_step = SOLVER_EVALUATIONS_PER_STEP.get(self.odeint_kwargs.get("method"), 1)
+
         def fn(t, x):
+            # step_callback(step, steps) runs before the first function evaluation of every solver step;
+            # raising from it aborts sampling
+            nonlocal evaluations
+            if exists(step_callback) and evaluations % evaluations_per_step == 0:
+                step_callback(evaluations // evaluations_per_step, total_steps)
+            evaluations += 1
+
             # at each step, conditioning is fixed
             # step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
 
@@ -197,6 +216,7 @@ class CFM(nn.Module):
         if sway_sampling_coef is not None:
             t = t + sway_sampling_coef * (torch.cos(torch.pi / 2 * t) - 1 + t)
 
+        total_steps = len(t) - 1
         trajectory = odeint(fn, y0, t, **self.odeint_kwargs)
 
         sampled = trajectory[-1]
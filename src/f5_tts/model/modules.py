@@ -656,3 +656,42 @@ class TimestepEmbedding(nn.Module):
         time_hidden = time_hidden.to(timestep.dtype)
         time = self.time_mlp(time_hidden)  # b d
         return time
+
+
+# duration predictor: total mel frames from text, trained through the Trainer duration_predictor hook
+
+
+class DurationPredictor(nn.Module):
+    def __init__(self, text_num_embeds, dim=256, conv_layers=3, vocab_char_map: dict[str:int] | None = None):
+        super().__init__()
+        self.vocab_char_map = vocab_char_map
+        self.text_embed = nn.Embedding(text_num_embeds + 1, dim)  # use 0 as filler token
+        self.convs = nn.Sequential(*[ConvNeXtV2Block(dim, dim * 2) for _ in range(conv_layers)])
+        self.to_frames = nn.Linear(dim, 1)
+
+    def predict_frames(self, text: int["b nt"]) -> float["b"]:  # noqa: F722 F821
+        mask = text != -1
+        x = self.text_embed(text + 1)  # -1 padding -> 0 filler
+        x = self.convs(x.masked_fill(~mask[..., None], 0.0))
+        frames_per_token = F.softplus(self.to_frames(x)).squeeze(-1)  # b nt
+        return (frames_per_token * mask).sum(dim=-1).clamp(min=1.0)
+
+    def forward(
+        self,
+        inp: float["b n d"],  # mel  # noqa: F722
+        text: int["b nt"] | list[str],  # noqa: F722
+        *,
+        lens: int["b"] | None = None,  # noqa: F821
+    ):
+        if isinstance(text, list):
+            from f5_tts.model.utils import list_str_to_idx, list_str_to_tensor
+
+            if self.vocab_char_map is not None:
+                text = list_str_to_idx(text, self.vocab_char_map).to(inp.device)
+            else:
+                text = list_str_to_tensor(text).to(inp.device)
+        if lens is None:
+            lens = torch.full((inp.shape[0],), inp.shape[1], device=inp.device)
+
+        pred = self.predict_frames(text)
+        return F.l1_loss(pred.log(), lens.float().log())
@@ -121,6 +121,12 @@ class Trainer:
         else:
             self.optimizer = AdamW(model.parameters(), lr=learning_rate)
         self.model, self.optimizer = self.accelerator.prepare(self.model, self.optimizer)
+        if exists(duration_predictor):
+            # trained alongside the model on every process, with its own optimizer
+            self.duration_optimizer = AdamW(duration_predictor.parameters(), lr=learning_rate)
+            self.duration_predictor, self.duration_optimizer = self.accelerator.prepare(
+                duration_predictor, self.duration_optimizer
+            )
 
     @property
     def is_main(self):
@@ -136,6 +142,10 @@ class Trainer:
                 scheduler_state_dict=self.scheduler.state_dict(),
                 step=step,
             )
+            if exists(self.duration_predictor):
+                checkpoint["duration_predictor_state_dict"] = self.accelerator.unwrap_model(
+                    self.duration_predictor
+                ).state_dict()
             if not os.path.exists(self.checkpoint_path):
                 os.makedirs(self.checkpoint_path)
             if last:
@@ -171,6 +181,11 @@ class Trainer:
         if self.is_main:
             self.ema_model.load_state_dict(checkpoint["ema_model_state_dict"])
 
+        if exists(self.duration_predictor) and "duration_predictor_state_dict" in checkpoint:
+            self.accelerator.unwrap_model(self.duration_predictor).load_state_dict(
+                checkpoint["duration_predictor_state_dict"]
+            )
+
         if "step" in checkpoint:
             # patch for backward compatibility, 305e3ea
             for key in ["mel_spec.mel_stft.mel_scale.fb", "mel_spec.mel_stft.spectrogram.window"]:
@@ -284,15 +299,18 @@ class Trainer:
                     disable=not self.accelerator.is_local_main_process,
                 )
 
+            trained_models = [self.model] + ([self.duration_predictor] if exists(self.duration_predictor) else [])
             for batch in progress_bar:
-                with self.accelerator.accumulate(self.model):
+                with self.accelerator.accumulate(*trained_models):
                     text_inputs = batch["text"]
                     mel_spec = batch["mel"].permute(0, 2, 1)
                     mel_lengths = batch["mel_lengths"]
 
-                    # TODO. add duration predictor training
-                    if self.duration_predictor is not None and self.accelerator.is_local_main_process:
-                        dur_loss = self.duration_predictor(mel_spec, lens=batch.get("durations"))
+                    if exists(self.duration_predictor):
+                        dur_loss = self.duration_predictor(mel_spec, text=text_inputs, lens=mel_lengths)
+                        self.accelerator.backward(dur_loss)
+                        self.duration_optimizer.step()
+                        self.duration_optimizer.zero_grad()
                         self.accelerator.log({"duration loss": dur_loss.item()}, step=global_step)
 
                     loss, cond, pred = self.model(
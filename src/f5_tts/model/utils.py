@@ -2,15 +2,15 @@ from __future__ import annotations
 
 import os
 import random
+import re
 from collections import defaultdict
+from functools import lru_cache
 from importlib.resources import files
 
+import numpy as np
 import torch
 from torch.nn.utils.rnn import pad_sequence
 
-import jieba
-from pypinyin import lazy_pinyin, Style
-
 
 # seed everything
 
@@ -133,6 +133,39 @@ def get_tokenizer(dataset_name, tokenizer: str = "pinyin"):
 
 # convert char to pinyin
 
+# jieba's own block patterns, used to segment Latin-only text exactly like jieba.cut without loading it
+_jieba_re_han = re.compile("([\u4e00-\u9fd5a-zA-Z0-9+#&\\._%\\-]+)")
+_jieba_re_skip = re.compile("(\r\n|\\s)")
+_jieba_re_hmm_skip = re.compile("([a-zA-Z0-9]+(?:\\.\\d+)?%?)")
+# the only Latin-1 entries of jieba's bundled dictionary, they change its segmentation
+_jieba_latin_words = re.compile("AT&T|[cC](?:#|\\+\\+)")
+_non_latin = re.compile("[^\\x00-\\xff]")
+
+
+def is_latin_text(text):
+    return not _non_latin.search(text) and not _jieba_latin_words.search(text)
+
+
+def latin_segments(text):
+    """
+    Segments Latin/Latin-1 text exactly as jieba.cut (accurate mode, HMM) would: with no CJK characters
+    and no dictionary word inside a block, jieba falls back to splitting on alphanumeric runs.
+    """
+    for blk in _jieba_re_han.split(text):
+        if not blk:
+            continue
+        if _jieba_re_han.match(blk):
+            if len(blk) == 1:
+                yield blk
+            else:
+                yield from (x for x in _jieba_re_hmm_skip.split(blk) if x)
+        else:
+            for x in _jieba_re_skip.split(blk):
+                if _jieba_re_skip.match(x):
+                    yield x
+                else:
+                    yield from x
+
 
 def convert_char_to_pinyin(text_list, polyphone=True):
     final_text_list = []
@@ -144,6 +177,17 @@ def convert_char_to_pinyin(text_list, polyphone=True):
         char_list = []
         text = text.translate(god_knows_why_en_testset_contains_zh_quote)
         text = text.translate(custom_trans)
+        if is_latin_text(text):  # fast path, e.g. spanish: no jieba dictionary, no pinyin
+            for seg in latin_segments(text):
+                if seg.isascii() and len(seg) > 1 and char_list and char_list[-1] not in " :'\"":
+                    char_list.append(" ")
+                char_list.extend(seg)
+            final_text_list.append(char_list)
+            continue
+
+        import jieba
+        from pypinyin import Style, lazy_pinyin
+
         for seg in jieba.cut(text):
             seg_byte_len = len(bytes(seg, "UTF-8"))
             if seg_byte_len == len(seg):  # if pure alphabets and symbols
@@ -171,6 +215,57 @@ def convert_char_to_pinyin(text_list, polyphone=True):
     return final_text_list
 
 
+# text front-end for inference: normalization -> char/pinyin -> padded vocab ids
+
+
+class TextFrontend:
+    """
+    Owns everything needed to turn raw text into model input ids, built once per model:
+    precompiled normalization patterns, an LRU cache of normalized sentences and a dense
+    code point -> vocab id table (multi-char tokens such as pinyin fall back to the dict).
+    """
+
+    _letter_digit = re.compile(r"([A-Za-z])(\d)")
+    _digit_letter = re.compile(r"(\d)([A-Za-z])")
+    _number = re.compile(r"\b\d+\b")
+    _sentence_split = re.compile(r"(?<=[.!?;:])(\s+)")
+
+    def __init__(self, vocab_char_map: dict[str, int], lang="es", cache_size=4096):
+        self.vocab_char_map = vocab_char_map
+        self.lang = lang
+
+        single = {ord(c): i for c, i in vocab_char_map.items() if len(c) == 1}
+        self.char_table = np.zeros(max(single, default=0) + 1, dtype=np.int64)  # 0 is used for unknown char
+        for code, i in single.items():
+            self.char_table[code] = i
+
+        self._normalize_sentence = lru_cache(maxsize=cache_size)(self._normalize_sentence_uncached)
+
+    def _normalize_sentence_uncached(self, sentence):
+        from num2words import num2words
+
+        sentence = self._letter_digit.sub(r"\1 \2", sentence)
+        sentence = self._digit_letter.sub(r"\1 \2", sentence)
+        return self._number.sub(lambda m: num2words(int(m.group()), lang=self.lang), sentence)
+
+    def normalize(self, text):
+        # patterns never span whitespace, so normalizing sentence by sentence gives the same result
+        return "".join(self._normalize_sentence(part) for part in self._sentence_split.split(text))
+
+    def token_ids(self, chars: list[str]) -> int["nt"]:  # noqa: F821
+        joined = "".join(chars)
+        if len(joined) != len(chars):  # pinyin tokens present
+            return torch.tensor([self.vocab_char_map.get(c, 0) for c in chars], dtype=torch.long)
+        codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        ids = self.char_table[np.minimum(codes, len(self.char_table) - 1)]
+        ids[codes >= len(self.char_table)] = 0
+        return torch.from_numpy(ids)
+
+    def encode(self, text_list: list[str], padding_value=-1) -> int["b nt"]:  # noqa: F722
+        ids = [self.token_ids(chars) for chars in convert_char_to_pinyin(text_list)]
+        return pad_sequence(ids, padding_value=padding_value, batch_first=True)
+
+
 # filter func for dirty data with many repetitions
 
 
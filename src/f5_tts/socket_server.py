@@ -10,12 +10,14 @@ import traceback
 
 
 from infer.utils_infer import infer_batch_process, preprocess_ref_audio_text, load_vocoder, load_model
+from infer.daemon_client import InferenceDaemonClient
 from model.backbones.dit import DiT
 
 
 class TTSStreamingProcessor:
     def __init__(self, ckpt_file, vocab_file, ref_audio, ref_text, device=None, dtype=torch.float32):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.daemon = None
 
         # Load the model using the provided checkpoint and vocab files
         self.model = load_model(
@@ -54,6 +56,12 @@ class TTSStreamingProcessor:
         print("Warm-up completed.")
 
     def generate_stream(self, text, play_steps_in_s=0.5):
+        if self.daemon is not None:
+            yield from self._generate_stream_from_daemon(text)
+            return
+        yield from self._generate_stream_local(text, play_steps_in_s)
+
+    def _generate_stream_local(self, text, play_steps_in_s=0.5):
         """Generate audio in chunks and yield them in real-time."""
         # Preprocess the reference audio and text
         ref_audio, ref_text = preprocess_ref_audio_text(self.ref_audio, self.ref_text)
@@ -96,6 +104,22 @@ class TTSStreamingProcessor:
             yield packed_audio
 
 
+class DaemonStreamingProcessor(TTSStreamingProcessor):
+    """Same streaming interface, with the model living in the inference daemon instead of this process."""
+
+    def __init__(self, daemon_socket, ref_audio, ref_text):
+        self.daemon = InferenceDaemonClient(daemon_socket)
+        self.sampling_rate = 24000
+        # Preprocess the reference once, the daemon only gets its path and transcript
+        self.ref_audio, self.ref_text = preprocess_ref_audio_text(ref_audio, ref_text)
+
+    def _generate_stream_from_daemon(self, text):
+        """Forward the daemon's PCM blocks as they arrive, in the same float32 format as local generation."""
+        voice = {"audio": self.ref_audio, "ref_text": self.ref_text, "mel": None, "duration": None}
+        for block in self.daemon.stream(voice, text):
+            yield struct.pack(f"{len(block)}f", *block)
+
+
 def handle_client(client_socket, processor):
     try:
         while True:
@@ -147,15 +171,20 @@ if __name__ == "__main__":
         vocab_file = ""  # Add vocab file path if needed
         ref_audio = ""  # add ref audio"./tests/ref_audio/reference.wav"
         ref_text = ""
-
-        # Initialize the processor with the model and vocoder
-        processor = TTSStreamingProcessor(
-            ckpt_file=ckpt_file,
-            vocab_file=vocab_file,
-            ref_audio=ref_audio,
-            ref_text=ref_text,
-            dtype=torch.float32,
-        )
+        daemon_socket = ""  # socket of a running inference daemon (python -m f5_tts.infer.daemon), if any
+
+        if daemon_socket:
+            # Use the daemon's warm model instead of loading another copy here
+            processor = DaemonStreamingProcessor(daemon_socket, ref_audio=ref_audio, ref_text=ref_text)
+        else:
+            # Initialize the processor with the model and vocoder
+            processor = TTSStreamingProcessor(
+                ckpt_file=ckpt_file,
+                vocab_file=vocab_file,
+                ref_audio=ref_audio,
+                ref_text=ref_text,
+                dtype=torch.float32,
+            )
 
         # Start the server
         start_server("0.0.0.0", 9998, processor)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from f5_tts.infer.audio_assembly import CrossfadeWriter
+from f5_tts.infer.audio_assembly import TeeSink
+from f5_tts.infer.audio_assembly import crossfade_concat
+
+SR = 24000
+
+
+def reference_concat(waves, sample_rate, cross_fade_duration):
+    """The concatenate-per-chunk loop crossfade_concat replaced."""
+    if cross_fade_duration <= 0:
+        return np.concatenate(waves)
+    final_wave = waves[0]
+    for next_wave in waves[1:]:
+        n = min(int(cross_fade_duration * sample_rate), len(final_wave), len(next_wave))
+        if n <= 0:
+            final_wave = np.concatenate([final_wave, next_wave])
+            continue
+        faded = final_wave[-n:] * np.linspace(1, 0, n) + next_wave[:n] * np.linspace(0, 1, n)
+        final_wave = np.concatenate([final_wave[:-n], faded, next_wave[n:]])
+    return final_wave
+
+
+class ListSink:
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, wave):
+        self.blocks.append(wave.copy())
+
+    def joined(self):
+        return np.concatenate(self.blocks) if self.blocks else np.zeros(0, dtype=np.float32)
+
+
+def make_waves(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.uniform(-1, 1, n).astype(np.float32) for n in lengths]
+
+
+CASES = [
+    ([SR, SR // 2, 2 * SR], 0.15),
+    ([SR, 100, SR], 0.15),  # a chunk shorter than the cross-fade
+    ([50, SR, 3000], 0.15),  # the first chunk shorter than the cross-fade
+    ([SR, SR], 0.0),
+    ([SR], 0.15),
+    ([4000, 0, 4000], 0.15),
+]
+
+
+@pytest.mark.parametrize("lengths, cross_fade_duration", CASES)
+def test_crossfade_concat_matches_reference(lengths, cross_fade_duration):
+    waves = make_waves(lengths)
+    out = crossfade_concat(waves, SR, cross_fade_duration)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, reference_concat(waves, SR, cross_fade_duration), atol=1e-6)
+
+
+@pytest.mark.parametrize("lengths, cross_fade_duration", CASES)
+def test_writer_streams_the_same_audio(lengths, cross_fade_duration):
+    waves = make_waves(lengths, seed=1)
+    sink = ListSink()
+    writer = CrossfadeWriter(sink, SR, cross_fade_duration)
+    for wave in waves:
+        writer.write(wave)
+    total = writer.close()
+    assert total == len(sink.joined())
+    np.testing.assert_allclose(sink.joined(), crossfade_concat(waves, SR, cross_fade_duration), atol=1e-6)
+
+
+def test_writer_holds_back_only_the_cross_fade():
+    sink = ListSink()
+    writer = CrossfadeWriter(sink, SR, 0.1)
+    writer.write(np.ones(SR, dtype=np.float32))
+    assert len(sink.joined()) == SR - int(0.1 * SR)
+
+
+def test_multichannel_chunks():
+    waves = [np.stack([w, -w], axis=1) for w in make_waves([SR, SR // 3])]
+    out = crossfade_concat(waves, SR, 0.15)
+    assert out.shape == (SR + SR // 3 - int(0.15 * SR), 2)
+    np.testing.assert_allclose(out[:, 0], reference_concat([w[:, 0] for w in waves], SR, 0.15), atol=1e-6)
+    np.testing.assert_allclose(out[:, 1], -out[:, 0], atol=1e-6)
+
+
+def test_empty_input():
+    assert len(crossfade_concat([], SR)) == 0
+
+
+def test_tee_sink_forwards_to_writers_and_callables():
+    sink, seen = ListSink(), []
+    TeeSink(sink, seen.append).write(np.ones(3, dtype=np.float32))
+    assert len(sink.blocks) == 1 and len(seen) == 1
@@ -0,0 +1,43 @@
+import hashlib
+import io
+import os
+
+from f5_tts.infer.audio_store import AudioStore
+
+
+def test_same_bytes_are_stored_once(tmp_path):
+    store = AudioStore(str(tmp_path / "refs"))
+    data = b"RIFF....WAVEfmt " * 1000
+    digest, path = store.add_stream(io.BytesIO(data), ".WAV")
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert path == os.path.join(str(tmp_path / "refs"), digest[:2], f"{digest}.wav")
+
+    # another name, another extension: still the first copy
+    upload = tmp_path / "otro_nombre.mp3"
+    upload.write_bytes(data)
+    assert store.add_file(str(upload)) == (digest, path)
+    stored = [name for _, _, names in os.walk(tmp_path / "refs") for name in names]
+    assert stored == [os.path.basename(path)]
+
+
+def test_different_bytes_get_their_own_entry(tmp_path):
+    store = AudioStore(str(tmp_path))
+    first, _ = store.add_stream(io.BytesIO(b"one"), ".wav")
+    second, path = store.add_stream(io.BytesIO(b"two"), ".wav")
+    assert first != second
+    with open(path, "rb") as f:
+        assert f.read() == b"two"
+
+
+def test_find(tmp_path):
+    store = AudioStore(str(tmp_path))
+    digest, path = store.add_stream(io.BytesIO(b"audio"), ".ogg")
+    assert store.find(digest) == path
+    assert store.find(hashlib.sha256(b"other").hexdigest()) is None
+
+
+def test_no_temporary_files_left(tmp_path):
+    store = AudioStore(str(tmp_path))
+    store.add_stream(io.BytesIO(b"audio"), ".wav")
+    store.add_stream(io.BytesIO(b"audio"), ".wav")
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
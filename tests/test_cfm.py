@@ -0,0 +1,52 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchdiffeq")
+
+from torch import nn  # noqa: E402
+
+from f5_tts.model.cfm import CFM  # noqa: E402
+
+
+class Decay(nn.Module):
+    """Stand-in transformer: a flow that does not depend on the conditioning."""
+
+    dim = 8
+
+    def __init__(self):
+        super().__init__()
+        self.rate = nn.Parameter(torch.ones(()))
+
+    def forward(self, x, cond, text, time, mask, drop_audio_cond, drop_text):
+        return -x * self.rate
+
+
+def sample(method, steps, step_callback, cfg_strength=0.0):
+    model = CFM(Decay(), num_channels=4, odeint_kwargs=dict(method=method))
+    return model.sample(
+        torch.zeros(1, 5, 4), ["hola"], 20, steps=steps, cfg_strength=cfg_strength, step_callback=step_callback
+    )
+
+
+@pytest.mark.parametrize("method", ["euler", "midpoint", "rk4"])
+@pytest.mark.parametrize("cfg_strength", [0.0, 2.0])
+def test_step_callback_runs_once_per_solver_step(method, cfg_strength):
+    calls = []
+    sample(method, 9, lambda step, steps: calls.append((step, steps)), cfg_strength)
+    assert calls == [(step, 8) for step in range(8)]
+
+
+def test_raising_from_step_callback_aborts_sampling():
+    class Stop(Exception):
+        pass
+
+    calls = []
+
+    def callback(step, steps):
+        calls.append(step)
+        if step == 3:
+            raise Stop
+
+    with pytest.raises(Stop):
+        sample("midpoint", 9, callback)
+    assert calls == [0, 1, 2, 3]
@@ -0,0 +1,81 @@
+import os
+import time
+
+import numpy as np
+
+from f5_tts.infer.chunk_cache import ChunkCache
+from f5_tts.infer.chunk_cache import chunk_key
+from f5_tts.infer.chunk_cache import chunk_seed
+
+PARAMS = dict(voice="v1", text="Hola.", nfe_step=32, cfg_strength=2.0, speed=1.0, seed=7, checkpoint="model_a")
+
+
+def chunk(value):
+    return np.full(1000, value, dtype=np.float32), np.full((100, 10), value, dtype=np.float32)
+
+
+def age(cache, key, seconds_ago):
+    """Backdates a cached chunk, so the LRU order does not depend on the filesystem's mtime granularity."""
+    t = time.time() - seconds_ago
+    os.utime(cache._path(key), (t, t))
+
+
+def test_chunk_key_changes_with_model_voice_and_params():
+    key = chunk_key(**PARAMS)
+    assert chunk_key(**dict(reversed(PARAMS.items()))) == key
+    for name, value in [("checkpoint", "model_b"), ("voice", "v2"), ("nfe_step", 16), ("speed", 1.1), ("seed", 8)]:
+        assert chunk_key(**{**PARAMS, name: value}) != key
+
+
+def test_changed_params_miss(tmp_path):
+    cache = ChunkCache(str(tmp_path))
+    wave, mel = chunk(0.5)
+    cache.put(chunk_key(**PARAMS), wave, mel)
+    cached_wave, cached_mel = cache.get(chunk_key(**PARAMS))
+    assert np.array_equal(cached_wave, wave)
+    assert np.allclose(cached_mel, mel)
+    assert cache.get(chunk_key(**{**PARAMS, "checkpoint": "model_b"})) is None
+
+
+def test_chunk_seed_is_deterministic():
+    assert chunk_seed(7, "Hola.") == chunk_seed(7, "Hola.")
+    assert chunk_seed(7, "Hola.") != chunk_seed(8, "Hola.")
+    assert chunk_seed(7, "Hola.") != chunk_seed(7, "Adiós.")
+    assert 0 <= chunk_seed(7, "Hola.") < 2**31
+
+
+def test_least_recently_used_is_evicted_at_max_bytes(tmp_path):
+    probe = ChunkCache(str(tmp_path / "probe"))
+    probe.put("probe", *chunk(0))
+    size = os.path.getsize(probe._path("probe"))
+
+    cache = ChunkCache(str(tmp_path / "cache"), max_bytes=int(2.5 * size))
+    cache.put("a", *chunk(1))
+    age(cache, "a", 30)
+    cache.put("b", *chunk(2))
+    age(cache, "b", 20)
+    assert cache.get("a") is not None  # a hit makes "a" the most recent
+    cache.put("c", *chunk(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_bound_holds_across_instances_sharing_the_directory(tmp_path):
+    probe = ChunkCache(str(tmp_path / "probe"))
+    probe.put("probe", *chunk(0))
+    size = os.path.getsize(probe._path("probe"))
+
+    first = ChunkCache(str(tmp_path / "cache"), max_bytes=int(2.5 * size))
+    second = ChunkCache(str(tmp_path / "cache"), max_bytes=int(2.5 * size))
+    for i, key in enumerate(["a", "b", "c", "d"]):
+        (first if i % 2 == 0 else second).put(key, *chunk(i))
+        age(first, key, 40 - 10 * i)
+    assert sum(size for _, size, _ in first.usage()) <= first.max_bytes
+    assert first.get("a") is None and first.get("b") is None
+    assert second.get("c") is not None and second.get("d") is not None
+
+
+def test_no_temporary_files_left(tmp_path):
+    cache = ChunkCache(str(tmp_path))
+    cache.put("a", *chunk(1))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,56 @@
+import pytest
+
+jieba = pytest.importorskip("jieba")
+pytest.importorskip("pypinyin")
+
+from f5_tts.model.utils import convert_char_to_pinyin  # noqa: E402
+from f5_tts.model.utils import is_latin_text  # noqa: E402
+from f5_tts.model.utils import latin_segments  # noqa: E402
+
+LATIN_TEXTS = [
+    "Hola, ¿cómo estás? Muy bien, gracias.",
+    "El niño comió 3.5 kilos de piña; ¡increíble!",
+    "Tengo 25% de batería y son las 10:30.",
+    "Dijo: 'ya voy' y se fue... (sin más).",
+    "email: ana_perez@correo.com, tel +34-600-123-456",
+    "Ça va?  Oui,\tmerci.\nÀ demain, Müller.",
+    "“Comillas” y ‘apóstrofes’ tipográficos",
+    "",
+]
+
+
+def jieba_reference(text):
+    """The jieba path of convert_char_to_pinyin, restricted to Latin-1 segments."""
+    text = text.translate(str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'", ";": ","}))
+    char_list = []
+    for seg in jieba.cut(text):
+        seg_byte_len = len(bytes(seg, "UTF-8"))
+        if seg_byte_len == len(seg):
+            if char_list and seg_byte_len > 1 and char_list[-1] not in " :'\"":
+                char_list.append(" ")
+            char_list.extend(seg)
+        else:
+            char_list.extend(seg)
+    return char_list
+
+
+@pytest.mark.parametrize("text", LATIN_TEXTS)
+def test_latin_fast_path_matches_jieba(text):
+    assert convert_char_to_pinyin([text]) == [jieba_reference(text)]
+
+
+@pytest.mark.parametrize("text", [t for t in LATIN_TEXTS if t])
+def test_latin_segments_match_jieba(text):
+    text = text.translate(str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"}))
+    assert list(latin_segments(text)) == list(jieba.cut(text))
+
+
+def test_dictionary_words_and_cjk_take_the_jieba_path():
+    assert is_latin_text("Hola mundo")
+    assert not is_latin_text("Programo en C++ y C#")
+    assert not is_latin_text("AT&T")
+    assert not is_latin_text("你好 mundo")
+
+
+def test_chinese_still_converted_to_pinyin():
+    assert convert_char_to_pinyin(["你好"]) == [[" ", "ni2", " ", "hao3"]]  # tone sandhi: ni3 hao3 -> ni2 hao3
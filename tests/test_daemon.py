@@ -0,0 +1,58 @@
+import json
+import socket
+import struct
+import threading
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("cached_path")
+
+from f5_tts.infer.daemon import InferenceDaemon  # noqa: E402
+from f5_tts.infer.daemon_client import ERROR  # noqa: E402
+from f5_tts.infer.daemon_client import ERROR_UNKNOWN_VOICE  # noqa: E402
+from f5_tts.infer.daemon_client import OK  # noqa: E402
+from f5_tts.infer.daemon_client import SYNTH  # noqa: E402
+from f5_tts.infer.daemon_client import SYNTH_PARAMS  # noqa: E402
+from f5_tts.infer.daemon_client import VOICE  # noqa: E402
+from f5_tts.infer.daemon_client import read_frame  # noqa: E402
+from f5_tts.infer.daemon_client import write_frame  # noqa: E402
+
+
+def voice(vid):
+    return {"id": vid, "audio": f"/refs/{vid}.npy", "ref_text": "Hola.", "mel": None, "duration": None}
+
+
+def synth_request(vid, text="Hola."):
+    vid = vid.encode("ascii")
+    return SYNTH_PARAMS.pack(1.0, 0.15, 32, 2.0, -1.0, 0.1, 0, 0) + struct.pack("<H", len(vid)) + vid + text.encode()
+
+
+def test_voices_are_kept_in_lru_order():
+    daemon = InferenceDaemon(None, None, max_voices=2)
+    daemon.register_voice("a", voice("a"))
+    daemon.register_voice("b", voice("b"))
+    assert daemon.find_voice("a") is not None  # "a" becomes the most recent
+    daemon.register_voice("c", voice("c"))
+    assert list(daemon.voices) == ["a", "c"]
+    assert daemon.find_voice("b") is None
+
+
+def test_evicted_voice_is_reported_unknown():
+    daemon = InferenceDaemon(None, None, max_voices=2)
+    client, server = socket.socketpair()
+    thread = threading.Thread(target=daemon.handle, args=(server,), daemon=True)
+    thread.start()
+    with client:
+        for vid in ["a", "b", "c"]:
+            write_frame(client, VOICE, json.dumps(voice(vid)).encode("utf-8"))
+            assert read_frame(client) == (OK, b"")
+        assert list(daemon.voices) == ["b", "c"]
+        assert daemon.voices["c"] == {key: value for key, value in voice("c").items() if key != "id"}
+
+        write_frame(client, SYNTH, synth_request("a"))
+        frame_type, payload = read_frame(client)
+        assert frame_type == ERROR and payload[0] == ERROR_UNKNOWN_VOICE
+    thread.join(5)  # the closed connection ends handle()
+    assert not thread.is_alive()
+    server.close()
@@ -0,0 +1,134 @@
+import json
+import socket
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from f5_tts.infer.daemon_client import DONE
+from f5_tts.infer.daemon_client import ERROR
+from f5_tts.infer.daemon_client import ERROR_INTERNAL
+from f5_tts.infer.daemon_client import ERROR_UNKNOWN_VOICE
+from f5_tts.infer.daemon_client import FORMAT
+from f5_tts.infer.daemon_client import HEADER
+from f5_tts.infer.daemon_client import OK
+from f5_tts.infer.daemon_client import PCM
+from f5_tts.infer.daemon_client import SYNTH
+from f5_tts.infer.daemon_client import VOICE
+from f5_tts.infer.daemon_client import DaemonError
+from f5_tts.infer.daemon_client import InferenceDaemonClient
+from f5_tts.infer.daemon_client import decode_pcm
+from f5_tts.infer.daemon_client import encode_error
+from f5_tts.infer.daemon_client import encode_pcm
+from f5_tts.infer.daemon_client import read_frame
+from f5_tts.infer.daemon_client import write_frame
+
+VOICE_SPEC = {"audio": "/refs/a.npy", "ref_text": "Hola.", "mel": None, "duration": None}
+
+
+class TrickleSocket:
+    """Hands out at most a few bytes per recv_into, like a busy socket."""
+
+    def __init__(self, sock, size=3):
+        self.sock, self.size = sock, size
+
+    def recv_into(self, view, size):
+        return self.sock.recv_into(view, min(size, self.size))
+
+
+def test_frames_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        write_frame(a, SYNTH, b"payload")
+        write_frame(a, OK)
+        assert read_frame(b) == (SYNTH, b"payload")
+        assert read_frame(b) == (OK, b"")
+
+
+def test_header_is_type_and_little_endian_length():
+    a, b = socket.socketpair()
+    with a, b:
+        write_frame(a, PCM, b"\x00" * 300)
+        assert b.recv(HEADER.size) == bytes([PCM]) + struct.pack("<I", 300)
+
+
+def test_short_reads_are_reassembled():
+    a, b = socket.socketpair()
+    with a, b:
+        payload = encode_pcm(np.linspace(-1, 1, 1000))
+        write_frame(a, PCM, payload)
+        frame_type, received = read_frame(TrickleSocket(b))
+        assert frame_type == PCM and received == payload
+        np.testing.assert_allclose(decode_pcm(received), np.linspace(-1, 1, 1000), atol=1 / 32767)
+
+
+def test_peer_closing_mid_frame_is_a_connection_error():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(HEADER.pack(PCM, 100) + b"\x00" * 10)
+        a.close()
+        with pytest.raises(ConnectionError):
+            read_frame(b)
+
+
+class FakeDaemon:
+    """Answers each connection with serve(sock) on a Unix socket."""
+
+    def __init__(self, path, serve):
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.serve = serve
+        self.received = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                self.serve(conn, self.received)
+
+
+@pytest.fixture
+def daemon_path(tmp_path):
+    return str(tmp_path / "d.sock")
+
+
+def test_error_frame_raises_daemon_error(daemon_path):
+    def serve(sock, received):
+        received.append(read_frame(sock))
+        write_frame(sock, ERROR, encode_error(ERROR_INTERNAL, "sin memoria"))
+
+    FakeDaemon(daemon_path, serve)
+    client = InferenceDaemonClient(daemon_path, timeout=5)
+    with pytest.raises(DaemonError, match="sin memoria") as e:
+        client.synthesize(VOICE_SPEC, "Hola.")
+    assert e.value.code == ERROR_INTERNAL
+
+
+def test_unknown_voice_is_registered_and_the_request_sent_again(daemon_path):
+    def serve(sock, received):
+        frame_type, request = read_frame(sock)
+        received.append(frame_type)
+        write_frame(sock, ERROR, encode_error(ERROR_UNKNOWN_VOICE, "unknown voice"))
+        frame_type, voice = read_frame(sock)
+        received.append((frame_type, json.loads(voice)))
+        write_frame(sock, OK)
+        frame_type, retried = read_frame(sock)
+        received.append((frame_type, retried == request))
+        write_frame(sock, FORMAT, struct.pack("<I", 24000))
+        write_frame(sock, PCM, encode_pcm(np.full(10, 0.5)))
+        write_frame(sock, DONE, struct.pack("<Q", 10))
+
+    daemon = FakeDaemon(daemon_path, serve)
+    wave, sr, mel = InferenceDaemonClient(daemon_path, timeout=5).synthesize(VOICE_SPEC, "Hola.")
+    assert sr == 24000 and mel is None
+    np.testing.assert_allclose(wave, 0.5, atol=1 / 32767)
+    assert daemon.received[0] == SYNTH
+    frame_type, voice = daemon.received[1]
+    assert frame_type == VOICE and voice["ref_text"] == "Hola." and len(voice["id"]) == 32
+    assert daemon.received[2] == (SYNTH, True)
@@ -0,0 +1,72 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from f5_tts.infer.utils_infer import DurationEstimator  # noqa: E402
+from f5_tts.infer.utils_infer import duration_margin  # noqa: E402
+from f5_tts.infer.utils_infer import load_duration_predictor  # noqa: E402
+from f5_tts.infer.utils_infer import min_generated_frames  # noqa: E402
+from f5_tts.model.modules import DurationPredictor  # noqa: E402
+
+VOCAB = {c: i for i, c in enumerate(" abcdefghijklmnopqrstuvwxyz.,", start=1)}
+TEXT = "el perro corre por el parque cada mañana temprano"
+
+
+class CharFrontend:
+    """Just enough of TextFrontend for the predictor: one token per known character."""
+
+    def encode(self, texts):
+        return torch.tensor([[VOCAB.get(c, 0) for c in text] for text in texts])
+
+
+def tiny_predictor():
+    torch.manual_seed(0)
+    return DurationPredictor(len(VOCAB), dim=16, conv_layers=2, vocab_char_map=VOCAB).eval()
+
+
+def test_rate_estimate_scales_with_text_length():
+    estimator = DurationEstimator(frames_per_byte=6.0, pause_frames=10.0)
+    assert estimator.frames("hola") == 24.0
+    assert estimator.frames(TEXT * 2) == 2 * estimator.frames(TEXT)
+    assert estimator.frames("hola, hola.") == 11 * 6.0 + 2 * 10.0
+
+
+def test_rate_estimate_scales_with_speed():
+    estimator = DurationEstimator(frames_per_byte=6.0)
+    frames = estimator.frames(TEXT)
+    assert estimator.estimate(TEXT) == int(frames * duration_margin)
+    assert estimator.estimate(TEXT, speed=2.0) == int(frames * duration_margin / 2.0)
+    assert estimator.estimate("a", speed=4.0) == min_generated_frames
+
+
+def test_rate_is_fitted_on_the_reference():
+    estimator = DurationEstimator.from_reference("hola mundo", 100)
+    assert estimator.frames_per_byte == 10.0
+    words = [{"text": " hola,", "start": 0.0, "end": 0.5}, {"text": " mundo", "start": 1.0, "end": 1.5}]
+    estimator = DurationEstimator.from_reference("hola, mundo", 150, words=words)
+    assert estimator.pause_frames == pytest.approx(0.5 * 24000 / 256)
+
+
+def test_predictor_is_rescaled_to_the_reference_voice():
+    estimator = DurationEstimator.from_reference(TEXT, 400, predictor=tiny_predictor(), text_frontend=CharFrontend())
+    assert estimator.frames(TEXT) == pytest.approx(400, rel=1e-4)
+
+
+@pytest.mark.parametrize("name", ["predictor.pt", "checkpoint.pt", "predictor.safetensors"])
+def test_load_duration_predictor_round_trip(tmp_path, name):
+    predictor = tiny_predictor()
+    path = str(tmp_path / name)
+    if name.endswith(".safetensors"):
+        from safetensors.torch import save_file
+
+        save_file(predictor.state_dict(), path)
+    elif name == "checkpoint.pt":
+        torch.save({"duration_predictor_state_dict": predictor.state_dict(), "update": 10}, path)
+    else:
+        torch.save(predictor.state_dict(), path)
+
+    loaded = load_duration_predictor(path, VOCAB, device="cpu")
+    assert len(loaded.convs) == 2
+    tokens = CharFrontend().encode([TEXT])
+    with torch.inference_mode():
+        assert torch.allclose(loaded.predict_frames(tokens), predictor.predict_frames(tokens))
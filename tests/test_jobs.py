@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+
+from f5_tts.infer.jobs import JobManager  # noqa: E402
+from f5_tts.infer.jobs import JobStore  # noqa: E402
+from f5_tts.infer.jobs import QueueFullError  # noqa: E402
+from f5_tts.infer.jobs import process_identity  # noqa: E402
+
+needs_proc = pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="needs /proc")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def wait_for(store, job_id, statuses=("done", "error", "cancelled"), timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {store.get(job_id)['status']}")
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_create_update_get(store):
+    job_id = store.create("multistyle")
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["worker"] == os.getpid() and job["progress"] == 0
+
+    store.update(job_id, status="done", progress=1.0, result={"files": ["a.wav"], "texto": "ñ"})
+    job = store.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"files": ["a.wav"], "texto": "ñ"}
+    assert store.get("missing") is None
+
+
+def test_pop_expired_returns_and_deletes(store):
+    expired, alive, running = store.create("a"), store.create("b"), store.create("c")
+    store.update(expired, status="done", expires=100.0)
+    store.update(alive, status="done", expires=300.0)
+    jobs = store.pop_expired(now=200.0)
+    assert [job["id"] for job in jobs] == [expired]
+    assert store.get(expired) is None
+    assert store.get(alive) is not None and store.get(running) is not None
+
+
+def test_fail_orphaned_leaves_live_jobs(store):
+    job_id = store.create("a")
+    store.fail_orphaned("interrupted", ttl=60)
+    assert store.get(job_id)["status"] == "queued"
+
+
+def test_fail_orphaned_marks_jobs_of_exited_processes(store):
+    job_id = store.create("a")
+    store.update(job_id, status="running", worker=exited_pid(), worker_started=None)
+    store.fail_orphaned("interrupted", ttl=60)
+    job = store.get(job_id)
+    assert job["status"] == "error" and job["error"] == "interrupted" and job["expires"] is not None
+
+
+@needs_proc
+def test_process_identity_tells_reused_pids_apart(store):
+    assert process_identity(os.getpid()) == process_identity(os.getpid())
+    assert process_identity(exited_pid()) is None
+
+    # same pid as a live process (ours), but recorded by a process that started at another time
+    job_id = store.create("a")
+    store.update(job_id, worker_started=process_identity(os.getpid()) + "0")
+    store.fail_orphaned("interrupted", ttl=60)
+    assert store.get(job_id)["status"] == "error"
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, progress REAL NOT NULL"
+            " DEFAULT 0, message TEXT, result TEXT, error TEXT, worker INTEGER, created REAL NOT NULL,"
+            " updated REAL NOT NULL, expires REAL)"
+        )
+    store = JobStore(path)
+    job = store.get(store.create("a"))
+    assert job["cancel_requested"] == 0 and "worker_started" in job
+
+
+def test_manager_runs_jobs_to_done_or_error(store, tmp_path):
+    manager = JobManager(store, str(tmp_path / "out"))
+
+    def ok(ctx, value):
+        ctx.report(0.5, "half")
+        return {"value": value}
+
+    def fail(ctx):
+        raise ValueError("boom")
+
+    done = wait_for(store, manager.submit("ok", ok, 7))
+    assert done["status"] == "done" and done["result"] == {"value": 7} and done["progress"] == 1.0
+    failed = wait_for(store, manager.submit("fail", fail))
+    assert failed["status"] == "error" and failed["error"] == "boom"
+
+
+def test_manager_cancel(store, tmp_path):
+    manager = JobManager(store, str(tmp_path / "out"))
+
+    def slow(ctx):
+        while True:
+            ctx.token.raise_if_cancelled()
+            time.sleep(0.01)
+
+    job_id = manager.submit("slow", slow)
+    wait_for(store, job_id, statuses=("running",))
+    manager.cancel(job_id)
+    assert wait_for(store, job_id)["status"] == "cancelled"
+
+
+def test_manager_bounds_the_queue(store, tmp_path):
+    manager = JobManager(store, str(tmp_path / "out"), max_pending=1)
+    release = []
+
+    def hold(ctx):
+        while not release:
+            time.sleep(0.01)
+        return {}
+
+    job_id = manager.submit("hold", hold)
+    with pytest.raises(QueueFullError):
+        manager.submit("hold", hold)
+    release.append(True)
+    wait_for(store, job_id)
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("torch")
+
+from f5_tts.infer.utils_infer import (  # noqa: E402
+    DurationEstimator,
+    chunk_cost,
+    max_chunk_frames,
+    min_chunk_budget_frames,
+    min_generated_frames,
+    plan_chunks,
+)
+
+SENTENCE = "El perro corre por el parque cada mañana temprano."
+# ~6 mel frames per utf-8 byte is an ordinary speaking rate at 24 kHz / hop 256
+ESTIMATOR = DurationEstimator(frames_per_byte=6.0)
+
+
+def words(chunks):
+    return " ".join(chunks).split()
+
+
+def test_short_text_is_one_chunk():
+    plan = plan_chunks("", 400, SENTENCE, duration_estimator=ESTIMATOR)
+    assert plan.chunks == [SENTENCE]
+    assert plan.ref_frames == 400
+    assert plan.costs == [chunk_cost(400 + plan.frames[0])]
+
+
+def test_chunks_cover_the_text_in_order():
+    text = " ".join([SENTENCE, "¿Vienes conmigo?", "Sí, claro; vamos ya."] * 8)
+    plan = plan_chunks("", 400, text, duration_estimator=ESTIMATOR)
+    assert len(plan.chunks) > 1
+    assert words(plan.chunks) == text.split()
+
+
+def test_chunks_fit_the_trained_length():
+    text = " ".join([SENTENCE] * 20)
+    ref_frames = 600
+    plan = plan_chunks("", ref_frames, text, duration_estimator=ESTIMATOR)
+    assert all(ref_frames + frames <= max_chunk_frames for frames in plan.frames)
+    assert all(frames >= min_generated_frames for frames in plan.frames)
+
+
+def test_chunks_are_balanced():
+    plan = plan_chunks("", 400, " ".join([SENTENCE] * 12), duration_estimator=ESTIMATOR)
+    assert max(plan.frames) - min(plan.frames) <= max(plan.frames) // 2
+
+
+def test_long_reference_keeps_a_minimum_budget():
+    # 2300 reference frames leave almost nothing of the 25 s window; the sentence must not split per word
+    plan = plan_chunks("", 2300, SENTENCE, duration_estimator=ESTIMATOR)
+    assert plan.chunks == [SENTENCE]
+
+    plan = plan_chunks("", 2300, " ".join([SENTENCE] * 6), duration_estimator=ESTIMATOR)
+    assert len(plan.chunks) < len(" ".join([SENTENCE] * 6).split())
+    assert all(frames <= min_chunk_budget_frames for frames in plan.frames)
+
+
+def test_overlong_sentence_is_split_at_words():
+    sentence = " ".join(["palabra"] * 200) + "."
+    plan = plan_chunks("", 400, sentence, duration_estimator=ESTIMATOR)
+    assert len(plan.chunks) > 1
+    assert words(plan.chunks) == sentence.split()
+
+
+def test_estimator_fitted_from_reference():
+    ref_text = "Esta es la referencia."
+    plan = plan_chunks(ref_text, 200, SENTENCE)
+    # units are priced with the space that separates them from the next one
+    expected = DurationEstimator.from_reference(ref_text, 200).frames(SENTENCE + " ")
+    assert plan.frames[0] == max(int(expected * 1.1), min_generated_frames)
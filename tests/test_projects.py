@@ -0,0 +1,107 @@
+import os
+import threading
+
+import numpy as np
+
+from f5_tts.infer.projects import ProjectStore
+from f5_tts.infer.projects import diff_units
+
+
+def units(*sentences, style="narrador", signature="v1"):
+    return [(style, sentence, signature) for sentence in sentences]
+
+
+def blocks(*groups):
+    return [
+        {"style": group[0][0], "units": [list(unit) for unit in group], "file": f"{i}.npy"}
+        for i, group in enumerate(groups)
+    ]
+
+
+def test_first_render_generates_everything_by_style():
+    new = units("a.", "b.") + units("c.", style="niña") + units("d.")
+    assert diff_units([], new) == [("generate", [0, 1]), ("generate", [2]), ("generate", [3])]
+
+
+def test_unchanged_script_reuses_every_block():
+    old = blocks(units("a.", "b."), units("c."))
+    assert diff_units(old, units("a.", "b.", "c.")) == [("reuse", 0), ("reuse", 1)]
+
+
+def test_edited_sentence_regenerates_only_its_block():
+    old = blocks(units("a."), units("b.", "c."), units("d."))
+    assert diff_units(old, units("a.", "b.", "X.", "d.")) == [("reuse", 0), ("generate", [1, 2]), ("reuse", 2)]
+
+
+def test_inserted_and_appended_sentences():
+    old = blocks(units("a."), units("b."))
+    new = units("a.", "nueva.", "b.", "final.")
+    assert diff_units(old, new) == [("reuse", 0), ("generate", [1]), ("reuse", 1), ("generate", [3])]
+
+
+def test_deleted_sentence_drops_its_block():
+    old = blocks(units("a."), units("b."), units("c."))
+    assert diff_units(old, units("a.", "c.")) == [("reuse", 0), ("reuse", 2)]
+
+
+def test_style_or_signature_change_regenerates():
+    old = blocks(units("a."), units("b."))
+    assert diff_units(old, units("a.") + units("b.", style="niña")) == [("reuse", 0), ("generate", [1])]
+    assert diff_units(old, units("a.") + units("b.", signature="v2")) == [("reuse", 0), ("generate", [1])]
+
+
+def test_moved_block_is_regenerated_once():
+    # the longest common subsequence keeps one of the two blocks; the other one is generated again
+    old = blocks(units("a."), units("b."))
+    assert diff_units(old, units("b.", "a.")) == [("generate", [0]), ("reuse", 0)]
+
+
+def test_store_commit_keeps_only_used_audio(tmp_path):
+    store = ProjectStore(str(tmp_path))
+    first = store.save_audio("doc", np.ones(4))
+    second = store.save_audio("doc", np.zeros(4))
+    store.commit("doc", [{"style": "narrador", "units": [["narrador", "a.", "v1"]], "file": second}])
+
+    (block,) = store.load("doc")
+    assert block["file"] == second
+    np.testing.assert_array_equal(store.load_audio("doc", block), np.zeros(4, dtype=np.float32))
+    assert not (tmp_path / "doc" / first).exists()
+    assert store.delete("doc") and store.load("doc") == []
+
+
+def render(store, doc_id, value, saved, proceed):
+    """A render reduced to its store calls: write one block, wait for `proceed`, commit a manifest using it."""
+    with store.lock(doc_id):
+        name = store.save_audio(doc_id, np.full(4, value))
+        saved.set()
+        proceed.wait(5)
+        store.commit(doc_id, [{"style": "narrador", "units": [["narrador", str(value), "v1"]], "file": name}])
+
+
+def test_interleaved_renders_keep_a_consistent_manifest(tmp_path):
+    # without the lock: A saves, B saves, A commits (deleting B's block), B commits a manifest without audio
+    store = ProjectStore(str(tmp_path))
+    events = {doc: (threading.Event(), threading.Event()) for doc in "AB"}
+    first = threading.Thread(target=render, args=(store, "doc", 1.0, *events["A"]))
+    second = threading.Thread(target=render, args=(store, "doc", 2.0, *events["B"]))
+    first.start()
+    assert events["A"][0].wait(5)
+    second.start()
+    assert not events["B"][0].wait(0.2)  # B cannot write its block while A holds the document
+    events["A"][1].set()
+    first.join(5)
+    events["B"][1].set()
+    second.join(5)
+
+    (block,) = store.load("doc")
+    np.testing.assert_array_equal(store.load_audio("doc", block), np.full(4, 2.0, dtype=np.float32))
+    assert sorted(os.listdir(tmp_path / "doc")) == sorted(["manifest.json", block["file"]])
+
+
+def test_commit_tolerates_files_removed_meanwhile(tmp_path, monkeypatch):
+    store = ProjectStore(str(tmp_path))
+    name = store.save_audio("doc", np.ones(4))
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listdir(path) + ["gone.npy"])
+    store.commit("doc", [{"style": "narrador", "units": [], "file": name}])
+    assert store.load("doc")[0]["file"] == name
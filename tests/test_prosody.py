@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pydub = pytest.importorskip("pydub")
+
+from f5_tts.infer.prosody import join_segments  # noqa: E402
+
+SR = 24000
+
+
+def segment(samples, sample_width, channels=1):
+    dtype = f"<i{sample_width}"
+    return pydub.AudioSegment(
+        np.asarray(samples, dtype=dtype).tobytes(), frame_rate=SR, sample_width=sample_width, channels=channels
+    )
+
+
+def test_sample_width_is_kept():
+    # 32-bit samples below 16-bit resolution would be lost by a round trip through int16
+    samples = np.arange(0, 4000 * 1000, 1000, dtype=np.int64)
+    joined = join_segments([segment(samples, 4), segment(samples[::-1], 4)], cross_fade_duration=0)
+    assert joined.sample_width == 4
+    np.testing.assert_array_equal(joined.get_array_of_samples(), np.concatenate([samples, samples[::-1]]))
+
+
+def test_widest_input_wins():
+    joined = join_segments([segment(np.full(100, 1000), 2), segment(np.full(100, 1000 << 16), 4)], 0)
+    assert joined.sample_width == 4
+    assert list(joined.get_array_of_samples()[:2]) == [1000 << 16] * 2
+
+
+def test_cross_fade_shortens_the_result():
+    a, b = segment(np.full(SR, 8000), 2), segment(np.full(SR, 8000), 2)
+    joined = join_segments([a, b], cross_fade_duration=0.1)
+    assert len(joined.get_array_of_samples()) == 2 * SR - int(0.1 * SR)
+    # a linear cross-fade between equal levels keeps the level
+    assert abs(int(np.min(joined.get_array_of_samples())) - 8000) <= 1
+
+
+def test_full_scale_does_not_wrap_around():
+    joined = join_segments([segment([32767, -32768], 2)], 0)
+    assert list(joined.get_array_of_samples()) == [32767, -32768]
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from f5_tts.infer.scheduler import AdmissionError
+from f5_tts.infer.scheduler import InferenceScheduler
+
+
+def block(scheduler):
+    """Occupies the scheduler thread until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    future = scheduler.submit(hold, cost=0)
+    assert started.wait(5)
+    return release, future
+
+
+def test_interactive_lane_first_then_cheapest():
+    scheduler = InferenceScheduler(throughput=1e9)
+    release, _ = block(scheduler)
+    order = []
+    futures = [
+        scheduler.submit(order.append, name, cost=cost, lane=lane)
+        for name, cost, lane in [
+            ("batch-big", 300, "batch"),
+            ("interactive-big", 200, "interactive"),
+            ("batch-small", 100, "batch"),
+            ("interactive-small", 50, "interactive"),
+        ]
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["interactive-small", "interactive-big", "batch-small", "batch-big"]
+
+
+def test_equal_cost_keeps_submission_order():
+    scheduler = InferenceScheduler(throughput=1e9)
+    release, _ = block(scheduler)
+    order = []
+    futures = [scheduler.submit(order.append, i, cost=10) for i in range(5)]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == list(range(5))
+
+
+def test_admission_rejects_what_cannot_meet_the_deadline():
+    scheduler = InferenceScheduler(deadlines={"interactive": 10.0}, throughput=100.0)
+    release, _ = block(scheduler)
+    scheduler.submit(lambda: None, cost=500)
+    with pytest.raises(AdmissionError) as e:
+        scheduler.submit(lambda: None, cost=600)  # 5s behind the queued task + 6s of its own
+    assert e.value.predicted_wait == pytest.approx(5.0)
+    # a cheaper task goes ahead of the queued one, so it still fits
+    assert scheduler.submit(lambda: None, cost=50, deadline=1.0)
+    release.set()
+
+
+def test_defer_moves_to_the_batch_lane():
+    scheduler = InferenceScheduler(deadlines={"interactive": 1.0}, throughput=100.0)
+    release, _ = block(scheduler)
+    scheduler.submit(lambda: None, cost=50)
+    scheduler.submit(lambda: None, cost=200, defer=True)
+    lanes = scheduler.stats()["lanes"]
+    assert lanes["interactive"]["depth"] == 1
+    assert lanes["batch"]["depth"] == 1
+    release.set()
+
+
+def test_result_and_exception_reach_the_future():
+    scheduler = InferenceScheduler()
+    assert scheduler.run(lambda x: x * 2, 21, cost=1) == 42
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        scheduler.run(fail, cost=1)
+
+
+def test_throughput_learned_only_from_successful_tasks():
+    scheduler = InferenceScheduler(throughput=10000.0, smoothing=0.5)
+
+    def fail():
+        time.sleep(0.15)
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        scheduler.run(fail, cost=100)
+    assert scheduler.throughput == 10000.0
+
+    scheduler.run(time.sleep, 0.15, cost=100)
+    assert scheduler.throughput < 10000.0
+
+
+def test_concurrency_runs_tasks_side_by_side():
+    scheduler = InferenceScheduler(throughput=1e9, concurrency=2)
+    barrier = threading.Barrier(2, timeout=5)
+    futures = [scheduler.submit(barrier.wait, cost=1) for _ in range(2)]
+    for future in futures:
+        future.result(5)  # a BrokenBarrierError if the two tasks did not overlap
+    assert scheduler.stats()["concurrency"] == 2
+
+
+def test_predicted_wait_shares_the_queue_between_slots():
+    scheduler = InferenceScheduler(throughput=100.0, concurrency=2)
+    releases = [block(scheduler)[0] for _ in range(2)]
+    for cost in (100, 200, 300):
+        scheduler.submit(lambda: None, cost=cost)
+    # 100 and 200 start as the running tasks end, 300 follows 100: the next free slot is at 2s
+    assert scheduler.predicted_wait() == pytest.approx(2.0, abs=0.05)
+    for release in releases:
+        release.set()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from f5_tts.infer.utils_infer import select_ref_clip  # noqa: E402
+
+SR = 16000
+WORD_SECONDS, GAP_SECONDS = 0.4, 0.2
+
+
+def speech(n_words, lead=0.5):
+    """A tone burst per "word" separated by silence, with the matching word timestamps."""
+    wave = np.zeros(int((lead + n_words * (WORD_SECONDS + GAP_SECONDS)) * SR), dtype=np.float32)
+    words = []
+    t = np.arange(int(WORD_SECONDS * SR)) / SR
+    for k in range(n_words):
+        start = lead + k * (WORD_SECONDS + GAP_SECONDS)
+        a = int(start * SR)
+        wave[a : a + len(t)] = 0.3 * np.sin(2 * np.pi * 220 * t)
+        words.append({"text": f" w{k}", "start": start, "end": start + WORD_SECONDS})
+    return wave, words
+
+
+def test_clip_length_is_within_the_target():
+    wave, words = speech(50)
+    start, end, _ = select_ref_clip(wave, SR, words=words, target_seconds=(5.0, 8.0))
+    assert 5.0 <= end - start <= 8.0
+    assert 0.0 <= start < end <= len(wave) / SR
+
+
+def test_cuts_snap_to_word_boundaries():
+    wave, words = speech(50)
+    start, end, text = select_ref_clip(wave, SR, words=words, target_seconds=(5.0, 8.0))
+    i = [w["start"] for w in words].index(start)
+    j = [w["end"] for w in words].index(end)
+    assert text == "".join(w["text"] for w in words[i : j + 1]).strip()
+
+
+def test_cuts_snap_to_pauses_without_words():
+    wave, words = speech(50)
+    start, end, text = select_ref_clip(wave, SR, target_seconds=(5.0, 8.0))
+    assert 5.0 <= end - start <= 8.0
+    assert text is None
+    assert min(abs(start - w["start"]) for w in words) <= 0.02
+    assert min(abs(end - w["end"]) for w in words) <= 0.02
+
+
+def test_reference_within_the_target_is_used_whole():
+    wave, words = speech(6)  # 4.1 s
+    assert select_ref_clip(wave, SR, words=words, target_seconds=(5.0, 8.0)) is None
+    assert select_ref_clip(wave, SR, target_seconds=(5.0, 8.0)) is None
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from f5_tts.infer.singleflight import SingleFlight
+from f5_tts.infer.singleflight import request_key
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Starts `callers` threads calling flight.do(key, fn) and returns their results or exceptions."""
+    results = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_coalesced(flight, count, timeout=5):
+    deadline = time.time() + timeout
+    while flight.stats()["coalesced"] < count:
+        assert time.time() < deadline, "callers did not join the in-flight computation"
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_computation():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"audio": "a.wav"}
+
+    threads, results = run_concurrently(flight, "k", compute, 4)
+    wait_coalesced(flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "coalesced": 3}
+
+
+def test_waiters_get_the_same_exception():
+    flight, release = SingleFlight(), threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, results = run_concurrently(flight, "k", compute, 3)
+    wait_coalesced(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_key_is_forgotten_after_the_call():
+    flight, calls = SingleFlight(), []
+    flight.do("k", calls.append, 1)
+    flight.do("k", calls.append, 2)
+    assert calls == [1, 2]
+    with pytest.raises(ZeroDivisionError):
+        flight.do("k", lambda: 1 / 0)
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_request_key_is_canonical_and_tracks_file_changes(tmp_path):
+    path = tmp_path / "ref.wav"
+    path.write_bytes(b"abc")
+    key = request_key("tts", {"b": 1, "a": "ñ"}, [str(path)])
+    assert key == request_key("tts", {"a": "ñ", "b": 1}, [str(path)])
+    assert key != request_key("tts", {"a": "ñ", "b": 2}, [str(path)])
+    assert key != request_key("multistyle", {"a": "ñ", "b": 1}, [str(path)])
+
+    path.write_bytes(b"abcd")
+    assert key != request_key("tts", {"b": 1, "a": "ñ"}, [str(path)])
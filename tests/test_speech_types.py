@@ -0,0 +1,75 @@
+import json
+import os
+
+from f5_tts.infer.speech_types import SpeechTypeRegistry
+
+
+def add(style, audio):
+    def apply(data):
+        data[style] = {"audio": audio, "status": "pending"}
+
+    return apply
+
+
+def test_write_from_one_instance_is_seen_by_another(tmp_path):
+    path = str(tmp_path / "speech_types.json")
+    first, second = SpeechTypeRegistry(path), SpeechTypeRegistry(path)
+    assert second.snapshot() == {}
+
+    first.update(add("Regular", "a.wav"))
+    assert second.get("Regular") == {"audio": "a.wav", "status": "pending"}
+
+    # the new version is a new file, so the change is noticed even with the same size
+    second.update(add("Regular", "b.wav"))
+    assert first.get("Regular")["audio"] == "b.wav"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_unchanged_file_is_not_parsed_again(tmp_path, monkeypatch):
+    path = str(tmp_path / "speech_types.json")
+    SpeechTypeRegistry(path).update(add("Regular", "a.wav"))
+    registry = SpeechTypeRegistry(path)
+    loads = []
+    real_load = json.load
+    monkeypatch.setattr(json, "load", lambda f: loads.append(f.name) or real_load(f))
+    for _ in range(3):
+        assert "Regular" in registry
+    assert len(loads) == 1
+
+
+def test_updates_start_from_the_version_on_disk(tmp_path):
+    path = str(tmp_path / "speech_types.json")
+    first, second = SpeechTypeRegistry(path), SpeechTypeRegistry(path)
+    first.snapshot()
+    second.snapshot()
+    first.update(add("Regular", "a.wav"))
+    second.update(add("Susurro", "b.wav"))
+    with open(path, encoding="utf-8") as f:
+        assert set(json.load(f)) == {"Regular", "Susurro"}
+
+
+def test_stale_set_prepared_is_ignored(tmp_path):
+    path = str(tmp_path / "speech_types.json")
+    worker, uploader = SpeechTypeRegistry(path), SpeechTypeRegistry(path)
+    worker.update(add("Regular", "old.wav"))
+    audio = worker.get("Regular")["audio"]
+
+    # a new audio is uploaded while the old one is being prepared
+    uploader.update(add("Regular", "new.wav"))
+    inode = os.stat(path).st_ino
+    assert not worker.set_prepared("Regular", audio, {"audio": "old.npy"}, "ready")
+    assert uploader.get("Regular") == {"audio": "new.wav", "status": "pending"}
+    assert os.stat(path).st_ino == inode  # nothing was written
+
+    assert not worker.set_prepared("Borrado", "old.wav", None, "error")
+    assert worker.set_prepared("Regular", "new.wav", {"audio": "new.npy"}, "ready")
+    assert uploader.get("Regular") == {"audio": "new.wav", "status": "ready", "prepared": {"audio": "new.npy"}}
+
+
+def test_broken_file_keeps_the_last_good_version(tmp_path):
+    path = str(tmp_path / "speech_types.json")
+    registry = SpeechTypeRegistry(path)
+    registry.update(add("Regular", "a.wav"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"Regular": ')
+    assert registry.get("Regular")["audio"] == "a.wav"
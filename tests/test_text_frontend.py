@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+pytest.importorskip("torch")
+num2words = pytest.importorskip("num2words").num2words
+
+from f5_tts.model.utils import TextFrontend  # noqa: E402
+
+VOCAB = {c: i for i, c in enumerate(" abcdefghijklmnopqrstuvwxyzáéíóúñ.,;:!?¿¡'\"-", start=1)}
+
+
+def reference_normalize(text):
+    """The whole-text normalization TextFrontend replaced."""
+    text = re.sub(r"([A-Za-z])(\d)", r"\1 \2", text)
+    text = re.sub(r"(\d)([A-Za-z])", r"\1 \2", text)
+    return re.sub(r"\b\d+\b", lambda m: num2words(int(m.group()), lang="es"), text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Tengo 3 gatos y 12 perros.",
+        "El modelo A4 salió en 2019. ¿Y el 5G? No llegó:  nunca!",
+        "Son 3.5 kg; 10:30 h, 25% y 1000000 de gracias.",
+        "Sin números.\n\nSegundo párrafo 7.",
+        "",
+    ],
+)
+def test_normalize_matches_whole_text_normalization(text):
+    assert TextFrontend(VOCAB).normalize(text) == reference_normalize(text)
+
+
+def test_normalize_caches_sentences():
+    frontend = TextFrontend(VOCAB)
+    frontend.normalize("Uno 1. Dos 2.")
+    frontend.normalize("Dos 2. Uno 1.")
+    info = frontend._normalize_sentence.cache_info()
+    assert info.hits >= 2
+
+
+def test_token_ids_use_the_vocab_and_zero_for_unknown():
+    frontend = TextFrontend(VOCAB)
+    ids = frontend.token_ids(list("hola€"))
+    assert ids.tolist() == [VOCAB["h"], VOCAB["o"], VOCAB["l"], VOCAB["a"], 0]
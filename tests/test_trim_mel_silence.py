@@ -0,0 +1,70 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from f5_tts.infer.utils_infer import trim_mel_silence  # noqa: E402
+
+VOICED, SILENT = 0.0, -10.0  # log-mel levels; silent frames end up ~10 nats below the voiced ones
+
+
+def mel_from(*segments, n_mels=100):
+    """Log-mel of shape (1, n_mels, n) from (level, frames) runs, with each frame tagged in its first bin."""
+    columns = []
+    for level, frames in segments:
+        for _ in range(frames):
+            column = torch.full((n_mels,), level)
+            column[0] = level + 1e-3 * len(columns)
+            columns.append(column)
+    return torch.stack(columns, dim=1).unsqueeze(0)
+
+
+def frames_of(mel):
+    """Indices (in the untrimmed mel) of the frames that were kept."""
+    return [round(float(v) * 1000) for v in mel[0, 0] - mel[0, 1]]
+
+
+def test_trailing_silence_is_cut_down_to_keep_frames():
+    mel = mel_from((VOICED, 20), (SILENT, 30))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5)
+    assert trimmed.shape == (1, 100, 25)
+    assert dropped == 25
+    assert frames_of(trimmed) == list(range(25))
+
+
+def test_short_trailing_silence_is_kept():
+    mel = mel_from((VOICED, 20), (SILENT, 3))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5)
+    assert dropped == 0
+    assert trimmed is mel
+
+
+def test_leading_silence_is_left_alone():
+    # the generated mel starts right after the reference: the pause there belongs to the prosody
+    mel = mel_from((SILENT, 10), (VOICED, 20), (SILENT, 30))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5, max_internal_frames=4)
+    assert dropped == 25
+    assert frames_of(trimmed) == list(range(35))
+
+
+def test_internal_pauses_are_capped_at_max_internal_frames():
+    mel = mel_from((VOICED, 10), (SILENT, 20), (VOICED, 10), (SILENT, 3), (VOICED, 10))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5, max_internal_frames=6)
+    assert dropped == 14
+    kept = frames_of(trimmed)
+    # the long pause keeps its 3 first and 3 last frames, the short one is untouched
+    assert kept == list(range(13)) + list(range(27, 53))
+
+
+def test_internal_pauses_untouched_without_max_internal_frames():
+    mel = mel_from((VOICED, 10), (SILENT, 20), (VOICED, 10))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5)
+    assert dropped == 0
+    assert trimmed is mel
+
+
+@pytest.mark.parametrize("level", [VOICED, SILENT])
+def test_uniform_input_comes_back_unchanged(level):
+    mel = mel_from((level, 40))
+    trimmed, dropped = trim_mel_silence(mel, keep_frames=5, max_internal_frames=4)
+    assert dropped == 0
+    assert trimmed is mel
@@ -0,0 +1,168 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from f5_tts.infer.audio_assembly import crossfade_concat  # noqa: E402
+from f5_tts.infer.utils_infer import CancellationToken  # noqa: E402
+from f5_tts.infer.utils_infer import DurationEstimator  # noqa: E402
+from f5_tts.infer.utils_infer import InferenceCancelled  # noqa: E402
+from f5_tts.infer.utils_infer import ModelFrontend  # noqa: E402
+from f5_tts.infer.utils_infer import target_sample_rate  # noqa: E402
+from f5_tts.infer.worker_pool import InferencePool  # noqa: E402
+from f5_tts.infer.worker_pool import core_groups  # noqa: E402
+
+TEXT = " ".join(["El perro corre por el parque cada mañana temprano."] * 12)
+
+
+class FakePool(InferencePool):
+    """The planning and joining of InferencePool, with chunks produced in this process instead of by workers."""
+
+    def __init__(self, workers):
+        self.frontend = ModelFrontend()
+        self.processes = [None] * workers
+        self.submitted, self.futures = [], []
+        self.broken = None
+
+    def submit_chunk(self, voice, text, return_mel=False, **params):
+        self.submitted.append(text)
+        future = Future()
+        self.futures.append(future)
+        wave = np.full(2400 + 10 * len(self.submitted), len(self.submitted), dtype=np.float32)
+        mel = np.ones((100, len(self.submitted)), dtype=np.float32) if return_mel else None
+        future.set_result((wave, mel))
+        return future
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive = False
+
+    def join(self):
+        pass
+
+
+class ThreadWorkerPool(InferencePool):
+    """InferencePool with its queues and dispatcher, served by threads standing in for the worker processes."""
+
+    liveness_interval = 0.05
+
+    def __init__(self, workers):
+        self.frontend = ModelFrontend()
+        self.tasks, self.results = queue.Queue(), queue.Queue()
+        self.processes = [FakeProcess(pid) for pid in range(workers)]
+        for process in self.processes:
+            threading.Thread(target=self._serve, args=(process,), daemon=True).start()
+        self._start_dispatcher()
+
+    def _serve(self, process):
+        while True:
+            task = self.tasks.get()
+            if task is None or not process.alive:  # a killed worker takes its task down with it
+                return
+            task_id = task[0]
+            self.results.put((task_id, (np.ones(2400, dtype=np.float32), None), None))
+
+
+def call_with_timeout(fn, timeout=10):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the call hung"
+    return outcome
+
+
+@pytest.fixture
+def voice(tmp_path):
+    path = tmp_path / "ref.npy"
+    np.save(path, np.zeros(5 * target_sample_rate, dtype=np.float32))
+    return {"audio": str(path), "ref_text": "Una referencia de prueba.", "mel": None, "duration": None}
+
+
+def estimator():
+    return DurationEstimator(frames_per_byte=6.0).to_dict()
+
+
+def test_chunks_are_joined_in_order(voice):
+    pool = FakePool(workers=2)
+    chunks = []
+    wave, sr, mel = pool.synthesize(
+        {**voice, "duration": estimator()},
+        TEXT,
+        return_spectrogram=True,
+        on_chunk=lambda i, text, wave, mel: chunks.append((i, text, wave, len(pool.submitted))),
+    )
+    assert sr == target_sample_rate
+    # one chunk per worker queued ahead of the one being joined
+    assert [queued for *_, queued in chunks] == [min(i + 3, len(chunks)) for i in range(len(chunks))]
+    assert [i for i, *_ in chunks] == list(range(len(pool.submitted)))
+    assert len(chunks) > 2 and " ".join(text for _, text, *_ in chunks).split() == TEXT.split()
+    np.testing.assert_array_equal(wave, crossfade_concat([w for _, _, w, _ in chunks], sr))
+    assert mel.shape == (100, sum(range(1, len(chunks) + 1)))
+
+
+def test_sink_and_no_assembly(voice):
+    pool = FakePool(workers=2)
+    received = []
+
+    class Sink:
+        def write(self, wave):
+            received.append(wave)
+
+    wave, _, mel = pool.synthesize(voice, TEXT, sink=Sink())
+    assert wave is None and mel is None and received
+
+    pieces = []
+    wave, _, _ = pool.synthesize(voice, TEXT, assemble=False, on_chunk=lambda *args: pieces.append(args))
+    assert wave is None and len(pieces) > 1
+
+
+def test_cancellation_while_waiting_for_a_chunk(voice):
+    pool = FakePool(workers=1)
+    token = CancellationToken()
+    never = Future()
+    pool.submit_chunk = lambda *args, **kwargs: never
+    threading.Timer(0.1, token.cancel).start()
+    with pytest.raises(InferenceCancelled):
+        pool.synthesize(voice, TEXT, cancel_token=token)
+
+
+def test_dead_worker_breaks_the_pool_instead_of_hanging(voice):
+    pool = ThreadWorkerPool(workers=2)
+    voice = {**voice, "duration": estimator()}
+    assert "result" in call_with_timeout(lambda: pool.synthesize(voice, TEXT))
+
+    pool.processes[0].alive = False
+    outcome = call_with_timeout(lambda: pool.synthesize(voice, TEXT))
+    assert isinstance(outcome.get("error"), RuntimeError)
+    assert pool.broken is not None
+
+    # later requests fail right away rather than queueing chunks nobody will read
+    outcome = call_with_timeout(lambda: pool.synthesize(voice, TEXT), timeout=2)
+    assert "broken" in str(outcome["error"])
+    pool.close()
+
+
+def test_core_groups():
+    assert core_groups(2, cores=range(8)) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert core_groups(4, 2, cores=range(8)) == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert core_groups(3, 4, cores=range(8)) == [[0, 1, 2, 3], [4, 5, 6, 7], [0, 1, 2, 3]]